@@ -1,68 +1,121 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_from_directory, stream_with_context
 import json
 import os
-import random
 from pathlib import Path
 import uuid
 from dotenv import load_dotenv
-from typing import List, Dict, Any, Optional
-import google.generativeai as genai
+from typing import List, Dict, Any, Optional, Iterator
 from flask_cors import CORS
 
+from psycopg.types.json import Jsonb
 from utils.db import execute_query, execute_query_single, execute_insert
 from utils.user_routes import user_blueprint
 from utils.tarot_routes import tarot_blueprint
-from utils.auth import token_required, get_user_info
-
-from utils.card_recognition import TAROT_CARDS_DATA
-from utils.prompts import TAROT_SYSTEM_PROMPT
+from utils.auth import token_required, get_request_token, verify_token, authenticate_token, invalidate_principal, principal_cache, internal_required
+
+from utils.card_recognition import TAROT_CARDS_DATA, DECK
+from utils.context_builder import build_context
+from utils.image_pipeline import build_variants, load_manifest, manifest_files, variant_urls
+from utils.sprite_atlas import build_atlases, load_atlas_manifest, atlas_files
+from utils.session_store import (
+    create_session_store, SessionSweeper, SESSION_TTL_SECONDS, InvalidSessionIdError, check_session_id
+)
+from utils.interpretation_cache import create_interpretation_cache, reading_cache_key, greeting_cache_key
+from utils.metrics import install_flask_metrics, timed_session
+from utils.llm import create_llm, is_fallback, LLMUnavailableError
+from utils.password_hashing import password_hasher
+from utils.jobs import LocalJobQueue, QueueFullError, Job, job_priority, FINISHED_STATES
+from utils.startup import Startup
+from utils.asset_server import AssetServer
+from utils.spreads import SPREADS, SPREAD_MAX_POSITIONS, SpreadError, draw_spread, draw_indices, new_seed, card_label, card_cache_label
+
+# Comma-separated exact origins allowed to call the API, or * for any; asgi.py sends the same headers
+CORS_ORIGINS = [origin.strip() for origin in os.environ.get("CORS_ORIGINS", "*").split(",") if origin.strip()]
 
 app = Flask(__name__) 
-CORS(app)
+CORS(app, origins=CORS_ORIGINS)
+install_flask_metrics(app)
 load_dotenv()
 
-GOOGLE_API_KEY = os.environ.get("GOOGLE_API_KEY")
-genai.configure(api_key=GOOGLE_API_KEY)
-model = genai.GenerativeModel('gemini-1.5-flash')
+# Database schema, image checks and the model SDK load in the background, see create_app()
+startup = Startup()
+app.before_request(startup.ensure_started)
+
+llm = create_llm()
 
 app.register_blueprint(user_blueprint)
 app.register_blueprint(tarot_blueprint) 
 
 SESSION_DIR = os.environ.get("SESSION_DIR", "./data/sessions")
-os.makedirs(SESSION_DIR, exist_ok=True)
+session_store = create_session_store(SESSION_DIR)
+session_sweeper = SessionSweeper(session_store)
+# Job records live apart from sessions so session routes can never read or overwrite them
+job_store = create_session_store(SESSION_DIR, namespace="jobs")
+job_sweeper = SessionSweeper(job_store)
+interpretation_cache = create_interpretation_cache()
 
 CARDS_IMAGES_DIR = os.environ.get("CARDS_IMAGES_DIR", "./static/images/tarot")
-os.makedirs(CARDS_IMAGES_DIR, exist_ok=True)
-
-def init_db():
-    """Initialize the database tables if they don't exist"""
-    try:
-        from utils.db import get_db_connection
-        with get_db_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    SELECT EXISTS (
-                        SELECT FROM information_schema.tables 
-                        WHERE table_name = 'users'
-                    );
-                """)
-                if not cur.fetchone()['exists']:
-                    schema_file = Path("./db_schema.sql")
-                    if schema_file.exists():
-                        with open(schema_file, "r") as f:
-                            schema_sql = f.read()
-                            cur.execute(schema_sql)
-                            conn.commit()
-                            print("Database tables created successfully!")
-                    else:
-                        print("Schema file not found! Database tables were not created.")
-    except Exception as e:
-        print(f"Error initializing database: {e}")
+CARDS_VARIANTS_DIR = os.environ.get("CARDS_VARIANTS_DIR", os.path.join(CARDS_IMAGES_DIR, "variants"))
+CARDS_VARIANTS_URL = "/static/images/tarot/variants"
+CARDS_ATLAS_DIR = os.environ.get("CARDS_ATLAS_DIR", os.path.join(CARDS_IMAGES_DIR, "atlas"))
+CARDS_ATLAS_URL = "/static/images/tarot/atlas"
+IMAGE_VARIANTS_ON_STARTUP = os.environ.get("IMAGE_VARIANTS_ON_STARTUP", "0") == "1"
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
 
+# db_schema.sql uses jsonb_path_query_array and EXECUTE FUNCTION triggers
+MIN_POSTGRES_VERSION = 120000
 
-init_db()
+@startup.task("database")
+def init_db():
+    """Create the database tables or upgrade them; db_schema.sql is safe to re-apply.
+
+    A reading_data column still stored as text is only reported: converting it is a
+    batched job for "python -m utils.reading_data_migration", and queries read the
+    column as reading_data::jsonb in the meantime.
+    """
+    from utils.db import advisory_lock
+    from utils.reading_data_migration import reading_data_type
+    schema_file = Path("./db_schema.sql")
+    if not schema_file.exists():
+        print("Schema file not found! Database tables were not created.")
+        return
+    with open(schema_file, "r") as f:
+        schema_sql = f.read()
+    if reading_data_type() not in (None, "jsonb"):
+        print("tarot_readings.reading_data is not JSONB yet; run python -m utils.reading_data_migration")
+    with advisory_lock("tarot_schema") as conn:
+        with conn.cursor() as cur:
+            cur.execute("SHOW server_version_num")
+            server_version = int(cur.fetchone()["server_version_num"])
+            if server_version < MIN_POSTGRES_VERSION:
+                raise RuntimeError(f"PostgreSQL 12 or newer is required, found {server_version}")
+            cur.execute("""
+                SELECT EXISTS (
+                    SELECT FROM information_schema.tables 
+                    WHERE table_name = 'users'
+                );
+            """)
+            created = not cur.fetchone()['exists']
+            cur.execute("SELECT to_regclass('user_stats') IS NULL AS missing")
+            backfill_stats = not created and cur.fetchone()['missing']
+            cur.execute(schema_sql)
+            if created:
+                print("Database tables created successfully!")
+    if backfill_stats:
+        from utils.user_stats import rebuild_user_stats
+        print(f"user_stats backfilled for {rebuild_user_stats()} users")
+
+@startup.task("sessions")
+def prepare_session_stores():
+    """Create the session and job directories or tables before the first request needs them"""
+    os.makedirs(SESSION_DIR, exist_ok=True)
+    session_store.prepare()
+    job_store.prepare()
+
+@startup.task("card_images", required=False)
 def validate_tarot_cards():
-    cards_dir = Path(os.environ.get("CARDS_IMAGES_DIR", "./static/images/tarot"))
+    os.makedirs(CARDS_IMAGES_DIR, exist_ok=True)
+    cards_dir = Path(CARDS_IMAGES_DIR)
     missing_images = []
     for card in TAROT_CARDS_DATA:
         image_path = cards_dir / card["image"]
@@ -74,70 +127,192 @@ def validate_tarot_cards():
     else:
         print("Все изображения карт найдены!")
 
+@startup.task("frontend_assets", required=False)
+def scan_frontend_assets():
+    asset_server.scan()
+
+@startup.task("llm", required=False)
+def warm_up_llm():
+    llm.warm_up()
+
 def get_card_by_name(name: str) -> Optional[Dict[str, Any]]:
-    return next((card for card in TAROT_CARDS_DATA if card["name"] == name), None)
+    return DECK.get(name)
+
+asset_server = AssetServer()
+
+CATALOG_MAX_AGE = int(os.environ.get("CATALOG_MAX_AGE", 3600))
+
+# Whatever was built before; the image_variants startup task rebuilds them when asked to
+image_manifest = load_manifest(CARDS_VARIANTS_DIR)
+atlas_manifest = load_atlas_manifest(CARDS_ATLAS_DIR)
+image_variant_files = manifest_files(image_manifest)
+image_atlas_files = atlas_files(atlas_manifest)
+
+def catalog_card(card: Dict[str, Any], *fields: str) -> Dict[str, Any]:
+    """A card entry for the catalogs, with variant image URLs when they have been built"""
+    entry = {field: card[field] for field in fields} if fields else dict(card)
+    variants = variant_urls(image_manifest, card["image"], CARDS_VARIANTS_URL)
+    if variants:
+        entry["variants"] = variants
+    return entry
+
+def register_catalogs():
+    """Pre-build the card catalog response bodies"""
+    DECK.register_catalog("tarot-cards", [catalog_card(card) for card in TAROT_CARDS_DATA])
+    DECK.register_catalog("cards", {
+        "cards": [catalog_card(card, "name", "image") for card in TAROT_CARDS_DATA]
+    })
+    for size, atlas in atlas_manifest.get("atlases", {}).items():
+        DECK.register_catalog(f"atlas-{size}", {
+            "size": size,
+            "version": atlas["version"],
+            "url": f"{CARDS_ATLAS_URL}/{atlas['file']}",
+            "width": atlas["width"],
+            "height": atlas["height"],
+            "cards": atlas["cards"]
+        })
+
+register_catalogs()
+
+@startup.task("image_variants", required=False)
+def build_image_variants():
+    """Rebuild card variants and atlases (IMAGE_VARIANTS_ON_STARTUP=1) and the catalogs that list them"""
+    global image_manifest, atlas_manifest, image_variant_files, image_atlas_files
+    if not IMAGE_VARIANTS_ON_STARTUP:
+        return
+    image_manifest = build_variants(CARDS_IMAGES_DIR, CARDS_VARIANTS_DIR)
+    atlas_manifest = build_atlases(CARDS_IMAGES_DIR, CARDS_ATLAS_DIR)
+    image_variant_files = manifest_files(image_manifest)
+    image_atlas_files = atlas_files(atlas_manifest)
+    register_catalogs()
+
+def catalog_response(name: str) -> Response:
+    """Serve a pre-built catalog body, answering revalidation with 304 and gzip when accepted"""
+    body = DECK.catalog(name)
+    gzipped = request.accept_encodings["gzip"] > 0
+    # Each encoding is a different representation and needs its own strong validator
+    etag = f"{body.etag}-gzip" if gzipped else body.etag
+    headers = {
+        "ETag": f'"{etag}"',
+        "Cache-Control": f"public, max-age={CATALOG_MAX_AGE}",
+        "Vary": "Accept-Encoding"
+    }
+    if any(request.if_none_match.contains_weak(tag) for tag in (body.etag, f"{body.etag}-gzip")):
+        return Response(status=304, headers=headers)
+    if gzipped:
+        headers["Content-Encoding"] = "gzip"
+        return Response(body.gzipped, mimetype="application/json", headers=headers)
+    return Response(body.raw, mimetype="application/json", headers=headers)
+
+INSERT_READING_SQL = """
+    INSERT INTO tarot_readings
+    (user_id, reading_name, description, reading_data, is_saved)
+    VALUES
+    (%(user_id)s, %(name)s, %(description)s, %(reading_data)s, TRUE)
+    RETURNING id
+"""
 
 class TarotSession:
-    def __init__(self, session_id: str, user_id: Optional[int] = None):
+    """A reading conversation. Mutations are buffered and written by ``save()`` as journal records."""
+
+    TRACKED_FIELDS = (
+        "user_id", "ttl", "questions_asked", "cards_drawn", "cards",
+        "reading_detail", "summary", "summary_upto", "spread"
+    )
+
+    def __init__(self, session_id: str, user_id: Optional[int] = None, ttl: int = SESSION_TTL_SECONDS):
         self.session_id = session_id
         self.user_id = user_id
+        self.ttl = ttl
         self.questions_asked = False
         self.cards_drawn = False
         self.user_responses = []
         self.cards = []
         self.history = []
-        self.save()
+        self.reading_detail = None
+        self.spread = None
+        self.summary = ""
+        self.summary_upto = 0
+        self._pending = []
+        self._persisted_fields = None
     
-    def save(self):
-        session_path = Path(SESSION_DIR) / f"{self.session_id}.json"
-        session_path.parent.mkdir(parents=True, exist_ok=True)
-        data = {
+    def to_dict(self) -> Dict[str, Any]:
+        return {
             "session_id": self.session_id,
             "user_id": self.user_id,
+            "ttl": self.ttl,
             "questions_asked": self.questions_asked,
             "cards_drawn": self.cards_drawn,
-            "user_responses": self.user_responses,
-            "cards": self.cards,
-            "history": self.history
+            "user_responses": list(self.user_responses),
+            "cards": list(self.cards),
+            "history": list(self.history),
+            "reading_detail": self.reading_detail,
+            "spread": self.spread,
+            "summary": self.summary,
+            "summary_upto": self.summary_upto
         }
-        with open(session_path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+    
+    def _tracked_fields(self) -> Dict[str, Any]:
+        return {
+            field: list(value) if isinstance(value, list) else value
+            for field, value in ((f, getattr(self, f)) for f in self.TRACKED_FIELDS)
+        }
+    
+    def save(self):
+        """Flush buffered mutations: a full snapshot for new sessions, appended records otherwise"""
+        session_sweeper.ensure_started()
+        fields = self._tracked_fields()
+        with timed_session("save"):
+            if self._persisted_fields is None:
+                session_store.put(self.session_id, self.to_dict())
+            else:
+                changed = {k: v for k, v in fields.items() if self._persisted_fields.get(k) != v}
+                records = list(self._pending)
+                if changed:
+                    records.append({"op": "set", "fields": changed})
+                session_store.append(self.session_id, records)
+        self._pending = []
+        self._persisted_fields = fields
     
     @classmethod
     def load(cls, session_id: str):
-        session_path = Path(SESSION_DIR) / f"{session_id}.json"
-        if not session_path.exists():
-            return cls(session_id)
-        with open(session_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        """Load a session from the store; unknown ids get a fresh, not yet persisted session"""
+        check_session_id(session_id)
+        session_sweeper.ensure_started()
+        with timed_session("load"):
+            data = session_store.get(session_id)
         session = cls(session_id)
+        if data is None:
+            return session
         session.user_id = data.get("user_id")
+        session.ttl = data.get("ttl", SESSION_TTL_SECONDS)
         session.questions_asked = data.get("questions_asked", False)
         session.cards_drawn = data.get("cards_drawn", False)
-        session.user_responses = data.get("user_responses", [])
-        session.cards = data.get("cards", [])
-        session.history = data.get("history", [])
+        session.user_responses = list(data.get("user_responses", []))
+        session.cards = list(data.get("cards", []))
+        session.history = list(data.get("history", []))
+        session.reading_detail = data.get("reading_detail")
+        session.spread = data.get("spread")
+        session.summary = data.get("summary", "")
+        session.summary_upto = data.get("summary_upto", 0)
+        session._persisted_fields = session._tracked_fields()
         return session
     
     def add_message(self, role: str, content: str):
         self.history.append({"role": role, "content": content})
-        self.save()
+        self._pending.append({"op": "message", "role": role, "content": content})
     
     def add_user_response(self, response: str):
         self.user_responses.append(response)
+        self._pending.append({"op": "response", "content": response})
         self.add_message("user", response)
-        self.save()
     
     def draw_cards(self, cards):
         self.cards = cards
         self.cards_drawn = True
-        self.save()
     
-    def save_to_database(self, reading_name="Расклад Таро", description=None):
-        """Save the reading to the database if user is authenticated"""
-        if not self.user_id:
-            return None
-        
+    def reading_params(self, reading_name="Расклад Таро", description=None) -> Dict[str, Any]:
+        """Parameters of INSERT_READING_SQL for this session's reading"""
         if not description and len(self.user_responses) > 0:
             description = self.user_responses[0][:100]  
         reading_data = {
@@ -145,62 +320,163 @@ class TarotSession:
             "questions": self.user_responses,
             "history": self.history
         }
-        reading_id = execute_insert(
-            """
-            INSERT INTO tarot_readings
-            (user_id, reading_name, description, reading_data, is_saved)
-            VALUES
-            (%(user_id)s, %(name)s, %(description)s, %(reading_data)s, TRUE)
-            """,
-            {
-                "user_id": self.user_id,
-                "name": reading_name,
-                "description": description or "Расклад Таро",
-                "reading_data": json.dumps(reading_data)
-            }
-        )
-        
-        return reading_id
-
-def get_ai_response(session: TarotSession) -> str:
-    """Get AI response based on user questions and cards"""
-    messages = [{"role": "system", "content": TAROT_SYSTEM_PROMPT}]
-    messages.extend(session.history)
+        if self.spread:
+            # The seed replays the exact draw, see utils.spreads.replay_spread
+            reading_data["spread"] = self.spread
+        return {
+            "user_id": self.user_id,
+            "name": reading_name,
+            "description": description or "Расклад Таро",
+            "reading_data": Jsonb(reading_data)
+        }
     
-    if session.questions_asked and session.cards_drawn:
-        cards_info = []
-        for card in session.cards:
-            card_description = f"Карта: {card['name']}, тип: {card['type']}"
-            cards_info.append(card_description)
-        
-        cards_msg = "Выбранные карты: " + ", ".join([card["name"] for card in session.cards])
-        cards_details = "Подробная информация о картах: " + "; ".join(cards_info)
+    def save_to_database(self, reading_name="Расклад Таро", description=None):
+        """Save the reading to the database if user is authenticated"""
+        if not self.user_id:
+            return None
         
-        session.add_message("system", cards_msg)
-        session.add_message("system", cards_details)
+        reading_id = execute_insert(INSERT_READING_SQL, self.reading_params(reading_name, description))
+        invalidate_principal(self.user_id)
         
-        messages.append({"role": "system", "content": cards_msg})
-        messages.append({"role": "system", "content": cards_details})
-    
-    response = model.generate_content([m["content"] for m in messages])
-    session.add_message("assistant", response.text)
-    return response.text
+        return reading_id
+
+def build_prompt(session: TarotSession) -> List[str]:
+    """Build the model prompt for a session within the context token budget"""
+    return build_context(session)
+
+def get_ai_response(session: TarotSession, timeout: Optional[float] = None,
+                    cache_key: Optional[str] = None) -> str:
+    """Get AI response based on user questions and cards; the caller flushes the session.
+
+    With a ``cache_key`` a cached interpretation is returned without calling the model,
+    and a fresh one is stored for the next identical request. When the model is
+    unavailable the fallback message is returned and neither recorded nor cached.
+    """
+    prompt = build_prompt(session)
+    cached = interpretation_cache.get(cache_key) if cache_key else None
+    if cached is not None:
+        session.add_message("assistant", cached)
+        return cached
+    try:
+        text = llm.generate(prompt, timeout=timeout)
+    except LLMUnavailableError as e:
+        return e.fallback
+    session.add_message("assistant", text)
+    if cache_key:
+        interpretation_cache.put(cache_key, text)
+    return text
+
+def stream_ai_response(session: TarotSession, cache_key: Optional[str] = None) -> Iterator[str]:
+    """Yield the AI response chunk by chunk.
+
+    Whatever was generated is added to the session history when the stream finishes,
+    fails or is closed early by a disconnecting client; the caller flushes the session.
+    Only complete responses are cached; a fallback message is neither recorded nor cached.
+    """
+    prompt = build_prompt(session)
+    cached = interpretation_cache.get(cache_key) if cache_key else None
+    if cached is not None:
+        session.add_message("assistant", cached)
+        yield cached
+        return
+    parts = []
+    completed = False
+    try:
+        for text in llm.stream(prompt):
+            parts.append(text)
+            yield text
+        completed = True
+    except LLMUnavailableError as e:
+        yield e.fallback
+    finally:
+        if parts:
+            session.add_message("assistant", "".join(parts))
+            if completed and cache_key:
+                interpretation_cache.put(cache_key, "".join(parts))
+
+def interpretation_key(session: TarotSession, reading_detail: str) -> str:
+    """Cache key for the reading of a session's drawn cards"""
+    return reading_cache_key([card_cache_label(card) for card in session.cards], reading_detail, session.user_responses)
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Format a Server-Sent Events frame"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def sse_response(events: Iterator[str]) -> Response:
+    return Response(
+        stream_with_context(events),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def stream_interpretation(session: TarotSession, on_done=None, cache_key: Optional[str] = None) -> Iterator[str]:
+    """Stream the AI response as SSE ``token`` events followed by ``done`` or ``error``"""
+    parts = []
+    chunks = stream_ai_response(session, cache_key)
+    try:
+        for text in chunks:
+            parts.append(text)
+            yield sse_event("token", {"text": text})
+        done = {"message": "".join(parts), "fallback": is_fallback("".join(parts))}
+        if on_done:
+            done.update(on_done(done["fallback"]))
+        yield sse_event("done", done)
+    except Exception as e:
+        print(f"Ошибка при получении интерпретации: {e}")
+        yield sse_event("error", {
+            "message": "Произошла ошибка при получении интерпретации. Пожалуйста, попробуйте снова.",
+            "error": str(e)
+        })
+    finally:
+        chunks.close()
+        session.save()
+
+def get_request_user_id() -> Optional[int]:
+    """Return the user id from an optional Bearer token, or None for anonymous requests"""
+    token = get_request_token()
+    payload = verify_token(token) if token else None
+    return payload["user_id"] if payload else None
 
 @app.route('/api/tarot-cards', methods=['GET'])
 def get_tarot_cards():
     """Get all tarot cards"""
-    return jsonify(TAROT_CARDS_DATA)
+    return catalog_response("tarot-cards")
 
 @app.route('/api/random-subset-cards', methods=['GET'])
 def get_random_subset_cards():
     """Get a random subset of tarot cards"""
     cards_count = request.args.get('count', 20, type=int)
-    selected_cards = random.sample(TAROT_CARDS_DATA, min(cards_count, len(TAROT_CARDS_DATA)))    
+    indices, _ = draw_indices(max(0, min(cards_count, len(TAROT_CARDS_DATA))), new_seed(), 0.0)
+    selected_cards = [TAROT_CARDS_DATA[i] for i in indices.tolist()]
     return jsonify({
         "cards": selected_cards,
         "total_count": len(selected_cards)
     })
 
+@app.route('/api/spreads', methods=['GET'])
+def get_spreads():
+    """List the named spreads and their positions"""
+    return jsonify({
+        "spreads": [{"name": name, **spread} for name, spread in SPREADS.items()],
+        "custom_max_positions": SPREAD_MAX_POSITIONS
+    })
+
+@app.errorhandler(SpreadError)
+def handle_spread_error(e):
+    return jsonify({"success": False, "message": str(e)}), 400
+
+@app.errorhandler(InvalidSessionIdError)
+def handle_invalid_session_id(e):
+    return jsonify({"success": False, "message": str(e)}), 400
+
+@app.route('/api/cards/atlas', methods=['GET'])
+def get_cards_atlas():
+    """Get the sprite atlas image URL and per-card coordinates for one size"""
+    size = request.args.get('size', 'thumb')
+    if not DECK.has_catalog(f"atlas-{size}"):
+        return jsonify({"success": False, "message": "Атлас для этого размера не найден"}), 404
+    return catalog_response(f"atlas-{size}")
+
 @app.route('/api/submit-questions', methods=['POST'])
 def submit_questions():
     """Submit questions for a tarot reading"""
@@ -208,14 +484,7 @@ def submit_questions():
     session_id = data.get('session_id')
     responses = data.get('responses')
     
-    user_id = None
-    auth_header = request.headers.get('Authorization')
-    if auth_header and auth_header.startswith('Bearer '):
-        from utils.auth import verify_token
-        token = auth_header.split(" ")[1]
-        payload = verify_token(token)
-        if payload:
-            user_id = payload["user_id"]
+    user_id = get_request_user_id()
     
     session = TarotSession.load(session_id)
     
@@ -232,54 +501,132 @@ def submit_questions():
         "success": True
     })
 
-@app.route('/api/draw-cards', methods=['POST'])
-def draw_tarot_cards():
-    """Draw tarot cards for a reading"""
-    data = request.json
+def prepare_draw(data: Dict[str, Any], user_id: Optional[int]) -> TarotSession:
+    """Load the session and record the drawn cards and detail preference from a draw request.
+
+    With ``spread`` (a spread name or a custom layout) the server draws the cards from
+    ``seed`` or a fresh one; otherwise ``cards`` lists the names the client picked.
+    Raises SpreadError for an invalid spread or seed.
+    """
     session_id = data.get('session_id')
-    cards = data.get('cards')
     reading_detail = data.get('reading_detail', 'detailed')
-    save_to_account = data.get('save_to_account', False)
-    reading_name = data.get('reading_name', 'Расклад Таро')
-    
-    user_id = None
-    auth_header = request.headers.get('Authorization')
-    if auth_header and auth_header.startswith('Bearer '):
-        from utils.auth import verify_token
-        token = auth_header.split(" ")[1]
-        payload = verify_token(token)
-        if payload:
-            user_id = payload["user_id"]
+    spread = None
+    if data.get('spread'):
+        spread = draw_spread(data['spread'], data.get('seed'), data.get('reversals', True))
     
     session = TarotSession.load(session_id)
     
     if user_id:
         session.user_id = user_id
     
-    selected_cards = []
-    for card_name in cards:
-        card_info = next((card for card in TAROT_CARDS_DATA if card["name"] == card_name), None)
-        if card_info:
-            selected_cards.append(card_info)
+    if spread:
+        selected_cards = spread.pop("cards")
+        session.spread = spread
+        session.draw_cards(selected_cards)
+        session.add_user_response(f"Расклад «{spread['title']}»: " + ", ".join(
+            f"{card['position']} — {card_label(card)}" for card in selected_cards
+        ))
+    else:
+        cards = data.get('cards')
+        selected_cards, unknown_cards = DECK.resolve(cards)
+        if unknown_cards:
+            print(f"Неизвестные карты в запросе: {', '.join(unknown_cards)}")
+        session.spread = None
+        session.draw_cards(selected_cards)
+        session.add_user_response(f"Я выбрал карты: {', '.join(cards)}")
+    
+    session.reading_detail = reading_detail
+    return session
+
+def spread_payload(session: TarotSession) -> Dict[str, Any]:
+    """The server-drawn spread for a draw response, empty when the client picked the cards"""
+    if not session.spread:
+        return {}
+    return {"spread": {**session.spread, "cards": session.cards}}
+
+def run_interpretation_job(job: Job) -> Dict[str, Any]:
+    """Job handler: generate the next AI message for a session that was prepared by the request"""
+    payload = job.payload
+    session = TarotSession.load(payload["session_id"])
+    # A job cancelled while the model was answering leaves no trace in the session or the account
+    try:
+        ai_message = get_ai_response(session, timeout=job.remaining(), cache_key=payload.get("cache_key"))
+    finally:
+        if not job_queue.is_cancelled(job):
+            session.save()
+    if job_queue.is_cancelled(job):
+        return None
+    
+    fallback = is_fallback(ai_message)
+    reading_id = None
+    if payload.get("save_to_account") and session.user_id and not fallback and not job_queue.is_cancelled(job):
+        reading_id = session.save_to_database(reading_name=payload.get("reading_name", "Расклад Таро"))
+    return {"message": ai_message, "fallback": fallback, "reading_id": reading_id, **spread_payload(session)}
+
+job_queue = LocalJobQueue(store=job_store)
+job_queue.register("interpretation", run_interpretation_job)
+
+def enqueue_interpretation(session: TarotSession, reading_detail: str = "detailed", **payload):
+    """Queue an interpretation for a flushed session and answer with the job id"""
+    job_sweeper.ensure_started()
+    try:
+        job = job_queue.submit(
+            "interpretation",
+            {"session_id": session.session_id, **payload},
+            priority=job_priority(session.user_id is not None, reading_detail),
+            user_id=session.user_id
+        )
+    except QueueFullError:
+        return jsonify({
+            "success": False,
+            "message": "Сервер перегружен. Пожалуйста, попробуйте позже."
+        }), 503
+    return jsonify({
+        "success": True,
+        "job_id": job.id,
+        "status": job.status
+    }), 202
+
+@app.route('/api/draw-cards', methods=['POST'])
+def draw_tarot_cards():
+    """Draw tarot cards for a reading"""
+    data = request.json
+    save_to_account = data.get('save_to_account', False)
+    reading_name = data.get('reading_name', 'Расклад Таро')
+    session = prepare_draw(data, get_request_user_id())
     
-    session.draw_cards(selected_cards)
-    session.add_user_response(f"Я выбрал карты: {', '.join(cards)}")
+    reading_detail = data.get('reading_detail', 'detailed')
+    cache_key = interpretation_key(session, reading_detail)
     
-    session.add_message("system", f"Пользователь предпочитает {reading_detail} чтение карт")
+    if data.get('async'):
+        session.save()
+        return enqueue_interpretation(
+            session,
+            reading_detail,
+            save_to_account=save_to_account,
+            reading_name=reading_name,
+            cache_key=cache_key
+        )
     
     try:
-        ai_message = get_ai_response(session)
+        ai_message = get_ai_response(session, cache_key=cache_key)
+        session.save()
         
+        # A fallback answer is not an interpretation, so it is not saved to the account
+        fallback = is_fallback(ai_message)
         reading_id = None
-        if save_to_account and session.user_id:
+        if save_to_account and session.user_id and not fallback:
             reading_id = session.save_to_database(reading_name=reading_name)
         
         return jsonify({
             "success": True,
             "message": ai_message,
-            "reading_id": reading_id
+            "fallback": fallback,
+            "reading_id": reading_id,
+            **spread_payload(session)
         })
     except Exception as e:
+        session.save()
         print(f"Ошибка при получении интерпретации: {e}")
         return jsonify({
             "success": False,
@@ -292,17 +639,11 @@ def new_session():
     """Create a new tarot reading session"""
     session_id = str(uuid.uuid4())
     
-    user_id = None
-    auth_header = request.headers.get('Authorization')
-    if auth_header and auth_header.startswith('Bearer '):
-        from utils.auth import verify_token
-        token = auth_header.split(" ")[1]
-        payload = verify_token(token)
-        if payload:
-            user_id = payload["user_id"]
+    user_id = get_request_user_id()
     
     session = TarotSession(session_id, user_id)
-    initial_message = get_ai_response(session)
+    initial_message = get_ai_response(session, cache_key=greeting_cache_key())
+    session.save()
     
     return jsonify({
         "session_id": session_id,
@@ -319,7 +660,13 @@ def handle_message():
         user_message = data.get('message')
         session = TarotSession.load(session_id)
         session.add_user_response(user_message)
-        ai_message = get_ai_response(session)
+        if data.get('async'):
+            session.save()
+            return enqueue_interpretation(session, "brief")
+        try:
+            ai_message = get_ai_response(session)
+        finally:
+            session.save()
         return jsonify({
             "message": ai_message
         })
@@ -327,10 +674,145 @@ def handle_message():
         session_id = request.args.get('session_id')
         session = TarotSession.load(session_id)
         ai_message = get_ai_response(session)
+        session.save()
         return jsonify({
             "message": ai_message
         })
 
+@app.route('/api/draw-cards/stream', methods=['POST'])
+def draw_tarot_cards_stream():
+    """Draw tarot cards and stream the interpretation as Server-Sent Events"""
+    data = request.json
+    save_to_account = data.get('save_to_account', False)
+    reading_name = data.get('reading_name', 'Расклад Таро')
+    session = prepare_draw(data, get_request_user_id())
+    
+    def on_done(fallback: bool):
+        reading_id = None
+        if save_to_account and session.user_id and not fallback:
+            reading_id = session.save_to_database(reading_name=reading_name)
+        return {"success": True, "reading_id": reading_id, **spread_payload(session)}
+    
+    cache_key = interpretation_key(session, data.get('reading_detail', 'detailed'))
+    return sse_response(stream_interpretation(session, on_done, cache_key))
+
+@app.route('/api/new-session/stream', methods=['POST'])
+def new_session_stream():
+    """Create a new tarot reading session and stream the greeting as Server-Sent Events"""
+    session_id = str(uuid.uuid4())
+    user_id = get_request_user_id()
+    session = TarotSession(session_id, user_id)
+    
+    def events():
+        yield sse_event("session", {
+            "session_id": session_id,
+            "is_authenticated": user_id is not None
+        })
+        yield from stream_interpretation(session, cache_key=greeting_cache_key())
+    
+    return sse_response(events())
+
+@app.route('/api/message/stream', methods=['POST'])
+def handle_message_stream():
+    """Handle a chat message and stream the reply as Server-Sent Events"""
+    data = request.json
+    session = TarotSession.load(data.get('session_id'))
+    session.add_user_response(data.get('message'))
+    return sse_response(stream_interpretation(session))
+
+def find_job(job_id: str) -> Optional[Job]:
+    """Look up a job the current request may see; other users' jobs read as missing"""
+    job = job_queue.get(job_id)
+    if job and not job.visible_to(get_request_user_id()):
+        return None
+    return job
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Get an interpretation job; ?wait=N long-polls up to N seconds for it to finish"""
+    job = find_job(job_id)
+    if not job:
+        return jsonify({"success": False, "message": "Задача не найдена"}), 404
+    wait = min(request.args.get('wait', 0, type=float), 60)
+    if wait > 0:
+        job = job_queue.wait(job, wait)
+    return jsonify({"success": True, **job.to_dict()})
+
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+def get_job_events(job_id):
+    """Stream an interpretation job's status as Server-Sent Events until it finishes"""
+    first_job = find_job(job_id)
+    if not first_job:
+        return jsonify({"success": False, "message": "Задача не найдена"}), 404
+    
+    def events():
+        job = first_job
+        last_status = None
+        idle = 0
+        while True:
+            if job.status != last_status:
+                last_status = job.status
+                idle = 0
+                yield sse_event("status", {"status": job.status})
+            if job.status in FINISHED_STATES:
+                yield sse_event("done" if job.status == "done" else "error", job.to_dict())
+                return
+            job = job_queue.wait(job, 1)
+            if not job.finished:
+                idle += 1
+                if idle % 15 == 0:
+                    yield ": keep-alive\n\n"
+    
+    return sse_response(events())
+
+@app.route('/api/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """Cancel a queued or running interpretation job"""
+    if not find_job(job_id) or not job_queue.cancel(job_id):
+        return jsonify({"success": False, "message": "Задача не найдена или уже завершена"}), 404
+    return jsonify({"success": True})
+
+@app.route('/api/interpretation-cache/stats', methods=['GET'])
+@internal_required
+def get_interpretation_cache_stats():
+    """Get interpretation cache hit rates and sizes"""
+    return jsonify(interpretation_cache.stats())
+
+@app.route('/api/auth/principal-cache/stats', methods=['GET'])
+@internal_required
+def get_principal_cache_stats():
+    """Get authenticated principal cache hit rates and size"""
+    return jsonify(principal_cache.stats())
+
+@app.route('/api/auth/password-hasher/stats', methods=['GET'])
+@internal_required
+def get_password_hasher_stats():
+    """Get password hashing pool size, cost factor and rejection count"""
+    return jsonify(password_hasher.stats())
+
+@app.route('/api/llm/stats', methods=['GET'])
+@internal_required
+def get_llm_stats():
+    """Get the model client settings and circuit breaker state"""
+    return jsonify(llm.stats())
+
+@app.route('/api/jobs/stats', methods=['GET'])
+@internal_required
+def get_job_stats():
+    """Get interpretation queue depth and outcome counters"""
+    return jsonify(job_queue.stats())
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    """Liveness: the process is up and serving requests"""
+    return jsonify({"status": "ok"})
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    """Readiness: deferred initialization has finished"""
+    stats = startup.stats()
+    return jsonify(stats), 200 if stats["ready"] else 503
+
 @app.route('/api/history', methods=['GET'])
 def get_history():
     """Get the chat history for a session"""
@@ -343,15 +825,7 @@ def get_history():
 @app.route('/api/cards', methods=['GET'])
 def get_cards():
     """Get all tarot cards with minimal information"""
-    cards_data = []
-    for card in TAROT_CARDS_DATA:
-        cards_data.append({
-            "name": card["name"],
-            "image": card["image"]
-        })
-    return jsonify({
-        "cards": cards_data 
-    })
+    return catalog_response("cards")
 
 @app.route('/api/save-reading', methods=['POST'])
 @token_required
@@ -382,22 +856,17 @@ def save_reading_to_account(user):
 @app.route('/api/check-auth', methods=['GET'])
 def check_auth():
     """Check if the user is authenticated"""
-    auth_header = request.headers.get('Authorization')
-    if auth_header and auth_header.startswith('Bearer '):
-        from utils.auth import verify_token
-        token = auth_header.split(" ")[1]
-        payload = verify_token(token)
-        if payload:
-            user = get_user_info(payload["user_id"])
-            if user:
-                return jsonify({
-                    "authenticated": True,
-                    "user": {
-                        "id": user["id"],
-                        "name": user["name"],
-                        "email": user["email"]
-                    }
-                })
+    token = get_request_token()
+    user = authenticate_token(token) if token else None
+    if user:
+        return jsonify({
+            "authenticated": True,
+            "user": {
+                "id": user["id"],
+                "name": user["name"],
+                "email": user["email"]
+            }
+        })
     
     return jsonify({
         "authenticated": False
@@ -405,6 +874,13 @@ def check_auth():
 
 @app.route('/static/images/tarot/<path:filename>')
 def tarot_image(filename):
+    variant = filename[len("variants/"):] if filename.startswith("variants/") else None
+    atlas = filename[len("atlas/"):] if filename.startswith("atlas/") else None
+    if variant in image_variant_files or atlas in image_atlas_files:
+        directory = CARDS_VARIANTS_DIR if variant else CARDS_ATLAS_DIR
+        response = send_from_directory(directory, variant or atlas, max_age=IMMUTABLE_MAX_AGE)
+        response.headers["Cache-Control"] = f"public, max-age={IMMUTABLE_MAX_AGE}, immutable"
+        return response
     return send_from_directory(CARDS_IMAGES_DIR, filename)
 
 @app.route('/static/<path:path>')
@@ -413,42 +889,42 @@ def serve_static(path):
 
 @app.route('/static/media/<path:filename>')
 def serve_static_media(filename):
-    media_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'frontend', 'build', 'static', 'media'))
-    return send_from_directory(media_dir, filename)
+    return asset_server.serve(f"static/media/{filename}")
 
 @app.route('/static/js/<path:filename>')
 def serve_static_js(filename):
-    static_js_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'frontend', 'build', 'static', 'js'))
-    return send_from_directory(static_js_dir, filename)
+    return asset_server.serve(f"static/js/{filename}")
 
 @app.route('/static/css/<path:filename>')
 def serve_static_css(filename):
-    static_css_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'frontend', 'build', 'static', 'css'))
-    return send_from_directory(static_css_dir, filename)
+    return asset_server.serve(f"static/css/{filename}")
 
 @app.route('/manifest.json')
 def serve_manifest():
-    return send_from_directory(os.path.join(os.path.dirname(__file__), '..', 'frontend', 'build'), 'manifest.json')
+    return asset_server.serve('manifest.json')
 
 @app.route('/favicon.ico')
 def serve_favicon():
-    return send_from_directory(os.path.join(os.path.dirname(__file__), '..', 'frontend', 'build'), 'favicon.ico')
+    return asset_server.serve('favicon.ico')
 
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
 def serve_react_app(path):
     if path.startswith('api/'):
         return {"error": "Not found"}, 404
-    react_build_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'frontend', 'build'))
-    if path == '':
-        return send_from_directory(react_build_dir, 'index.html')
-    file_path = os.path.join(react_build_dir, path)
-    if os.path.exists(file_path) and os.path.isfile(file_path):
-        directory, filename = os.path.split(file_path)
-        return send_from_directory(directory, filename)
-    return send_from_directory(react_build_dir, 'index.html')
+    if path and path in asset_server:
+        return asset_server.serve(path)
+    return asset_server.serve('index.html')
+
+def create_app() -> Flask:
+    """Application factory: starts deferred initialization and returns the app.
 
-validate_tarot_cards()
+    Importing this module has no slow side effects. Initialization starts here or
+    on the first request, once per process, so preload-and-fork servers work too:
+    gunicorn 'App:create_app()'
+    """
+    startup.ensure_started()
+    return app
 
 if __name__ == '__main__':
-    app.run(debug=True, port=5000)
\ No newline at end of file
+    create_app().run(debug=True, port=5000)
\ No newline at end of file
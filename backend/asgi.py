@@ -0,0 +1,285 @@
+"""ASGI entry point with an asyncio request path for the reading and chat endpoints.
+
+The routes in ASYNC_ROUTES await the model and Postgres instead of holding a thread
+each, so one process can keep thousands of readings in flight. Every other route,
+and "async": true job submissions, are handed to the Flask app unchanged.
+
+Run with: uvicorn asgi:app --host 0.0.0.0 --port 5000
+"""
+import asyncio
+import json
+import os
+import time
+import uuid
+from typing import Dict, Any, List, Optional, Callable, Awaitable, Tuple
+from urllib.parse import parse_qs
+
+from asgiref.wsgi import WsgiToAsgi
+
+from App import (
+    create_app, CORS_ORIGINS, TarotSession, INSERT_READING_SQL, llm, interpretation_cache,
+    build_prompt, prepare_draw, spread_payload, interpretation_key
+)
+from utils.auth import verify_token, invalidate_principal
+from utils.db import execute_insert_async, close_async_pool
+from utils.interpretation_cache import greeting_cache_key
+from utils.llm import is_fallback, LLMUnavailableError
+from utils.session_store import InvalidSessionIdError
+from utils.spreads import SpreadError
+from utils.metrics import observe_request
+
+ASGI_MAX_BODY_BYTES = int(os.environ.get("ASGI_MAX_BODY_BYTES", 1024 * 1024))
+
+wsgi_app = WsgiToAsgi(create_app())
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class AsyncRequest:
+    """The parts of an HTTP request the async handlers need"""
+
+    def __init__(self, scope: Dict[str, Any], body: bytes):
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.args = {k: v[0] for k, v in parse_qs(scope.get("query_string", b"").decode("latin-1")).items()}
+        self.headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers", [])}
+        self.body = body
+        self._json = None
+
+    @property
+    def json(self) -> Dict[str, Any]:
+        if self._json is None:
+            try:
+                self._json = json.loads(self.body or b"{}")
+            except json.JSONDecodeError:
+                raise HTTPError(400, "Некорректный JSON в теле запроса")
+            if not isinstance(self._json, dict):
+                raise HTTPError(400, "Некорректный JSON в теле запроса")
+        return self._json
+
+    def user_id(self) -> Optional[int]:
+        """The user id from an optional Bearer token, or None for anonymous requests"""
+        auth_header = self.headers.get("authorization", "")
+        if auth_header.startswith("Bearer "):
+            payload = verify_token(auth_header.split(" ")[1])
+            if payload:
+                return payload["user_id"]
+        return None
+
+
+async def get_ai_response_async(session: TarotSession, cache_key: Optional[str] = None) -> str:
+    """Async counterpart of App.get_ai_response; the caller flushes the session"""
+    prompt = build_prompt(session)
+    cached = await asyncio.to_thread(interpretation_cache.get, cache_key) if cache_key else None
+    if cached is not None:
+        session.add_message("assistant", cached)
+        return cached
+    try:
+        text = await llm.generate_async(prompt)
+    except LLMUnavailableError as e:
+        return e.fallback
+    session.add_message("assistant", text)
+    if cache_key:
+        await asyncio.to_thread(interpretation_cache.put, cache_key, text)
+    return text
+
+
+async def save_to_database_async(session: TarotSession, reading_name: str = "Расклад Таро") -> Optional[int]:
+    """Async counterpart of TarotSession.save_to_database"""
+    if not session.user_id:
+        return None
+    reading_id = await execute_insert_async(INSERT_READING_SQL, session.reading_params(reading_name))
+    invalidate_principal(session.user_id)
+    return reading_id
+
+
+async def new_session(request: AsyncRequest):
+    """Create a new tarot reading session"""
+    session_id = str(uuid.uuid4())
+    user_id = request.user_id()
+    session = TarotSession(session_id, user_id)
+    initial_message = await get_ai_response_async(session, cache_key=greeting_cache_key())
+    await asyncio.to_thread(session.save)
+    return {
+        "session_id": session_id,
+        "message": initial_message,
+        "is_authenticated": user_id is not None
+    }
+
+
+async def submit_questions(request: AsyncRequest):
+    """Submit questions for a tarot reading"""
+    data = request.json
+    user_id = request.user_id()
+    session = await asyncio.to_thread(TarotSession.load, data.get("session_id"))
+    if user_id:
+        session.user_id = user_id
+    for response in data.get("responses") or []:
+        session.add_user_response(response)
+    session.questions_asked = True
+    await asyncio.to_thread(session.save)
+    return {"success": True}
+
+
+async def draw_cards(request: AsyncRequest):
+    """Draw tarot cards for a reading"""
+    data = request.json
+    save_to_account = data.get("save_to_account", False)
+    reading_name = data.get("reading_name", "Расклад Таро")
+    try:
+        session = await asyncio.to_thread(prepare_draw, data, request.user_id())
+    except SpreadError as e:
+        raise HTTPError(400, str(e))
+    cache_key = interpretation_key(session, data.get("reading_detail", "detailed"))
+    try:
+        ai_message = await get_ai_response_async(session, cache_key=cache_key)
+        await asyncio.to_thread(session.save)
+        fallback = is_fallback(ai_message)
+        reading_id = None
+        if save_to_account and session.user_id and not fallback:
+            reading_id = await save_to_database_async(session, reading_name)
+        return {
+            "success": True,
+            "message": ai_message,
+            "fallback": fallback,
+            "reading_id": reading_id,
+            **spread_payload(session)
+        }
+    except Exception as e:
+        await asyncio.to_thread(session.save)
+        print(f"Ошибка при получении интерпретации: {e}")
+        return {
+            "success": False,
+            "message": "Произошла ошибка при получении интерпретации. Пожалуйста, попробуйте снова.",
+            "error": str(e)
+        }, 500
+
+
+async def handle_message(request: AsyncRequest):
+    """Handle chat messages in a tarot session"""
+    if request.method == "POST":
+        data = request.json
+        session = await asyncio.to_thread(TarotSession.load, data.get("session_id"))
+        session.add_user_response(data.get("message"))
+    else:
+        session = await asyncio.to_thread(TarotSession.load, request.args.get("session_id"))
+    try:
+        ai_message = await get_ai_response_async(session)
+    finally:
+        await asyncio.to_thread(session.save)
+    return {"message": ai_message}
+
+
+async def get_history(request: AsyncRequest):
+    """Get the chat history for a session"""
+    session = await asyncio.to_thread(TarotSession.load, request.args.get("session_id"))
+    return {"history": session.history}
+
+
+ASYNC_ROUTES: Dict[Tuple[str, str], Callable[[AsyncRequest], Awaitable[Any]]] = {
+    ("POST", "/api/new-session"): new_session,
+    ("POST", "/api/submit-questions"): submit_questions,
+    ("POST", "/api/draw-cards"): draw_cards,
+    ("POST", "/api/message"): handle_message,
+    ("GET", "/api/message"): handle_message,
+    ("GET", "/api/history"): get_history,
+}
+
+# Job submissions stay on the Flask side, where the worker-thread queue lives
+QUEUED_ROUTES = {"/api/draw-cards", "/api/message"}
+
+
+async def read_body(receive) -> bytes:
+    chunks, size = [], 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            raise HTTPError(400, "Клиент отключился")
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > ASGI_MAX_BODY_BYTES:
+            raise HTTPError(413, "Слишком большой запрос")
+        chunks.append(chunk)
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+def replay_body(body: bytes, receive):
+    """A receive callable that yields an already-read body before resuming the original"""
+    sent = False
+
+    async def replay():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return await receive()
+    return replay
+
+
+def cors_headers(origin: Optional[str]) -> List[Tuple[bytes, bytes]]:
+    """The CORS response headers flask_cors would send for CORS_ORIGINS; preflights go to Flask"""
+    if "*" in CORS_ORIGINS:
+        return [(b"access-control-allow-origin", b"*")]
+    headers = [(b"vary", b"Origin")]
+    if origin in CORS_ORIGINS:
+        headers.append((b"access-control-allow-origin", origin.encode("latin-1")))
+    return headers
+
+
+async def send_json(send, payload: Any, status: int = 200, origin: Optional[str] = None) -> None:
+    body = json.dumps(payload).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode("latin-1")),
+            *cors_headers(origin),
+        ]
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def lifespan(receive, send) -> None:
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await close_async_pool()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+    handler = ASYNC_ROUTES.get((scope.get("method"), scope.get("path"))) if scope["type"] == "http" else None
+    if handler is None:
+        return await wsgi_app(scope, receive, send)
+
+    started = time.perf_counter()
+    status = 500
+    try:
+        body = await read_body(receive)
+        request = AsyncRequest(scope, body)
+        if request.method == "POST" and request.path in QUEUED_ROUTES and request.json.get("async"):
+            return await wsgi_app(scope, replay_body(body, receive), send)
+        result = await handler(request)
+        payload, status = result if isinstance(result, tuple) else (result, 200)
+    except HTTPError as e:
+        payload, status = {"success": False, "message": e.message}, e.status
+    except InvalidSessionIdError as e:
+        payload, status = {"success": False, "message": str(e)}, 400
+    except Exception as e:
+        print(f"Error handling {scope['method']} {scope['path']}: {e}")
+        payload = {"success": False, "message": "Внутренняя ошибка сервера"}
+    observe_request(scope["method"], scope["path"], status, time.perf_counter() - started)
+    origin = dict(scope.get("headers", [])).get(b"origin")
+    await send_json(send, payload, status, origin.decode("latin-1") if origin else None)
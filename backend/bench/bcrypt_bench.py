@@ -0,0 +1,74 @@
+"""Measure bcrypt throughput to size login capacity.
+
+For every cost factor, hashes back to back in one process and then through a
+PasswordHasher pool of each requested size, and reports hashes/sec overall and
+per worker. Checking a password costs the same as hashing it.
+
+Usage: python -m bench.bcrypt_bench [--rounds 10 12] [--workers 1 2 4] [--seconds 3]
+"""
+import argparse
+import concurrent.futures
+import os
+import time
+
+import bcrypt
+
+from utils.password_hashing import PasswordHasher, PasswordHasherBusyError
+
+PASSWORD = "BenchPass123"
+
+
+def single_core(rounds: int, seconds: float) -> float:
+    password = PASSWORD.encode("utf-8")
+    count = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+        count += 1
+    return count / (time.perf_counter() - started)
+
+
+def pooled(rounds: int, workers: int, seconds: float) -> float:
+    hasher = PasswordHasher(workers=workers, queue_size=workers, rounds=rounds, timeout=60)
+    hasher.hash(PASSWORD)  # start the worker processes outside the measurement
+    count = 0
+    with concurrent.futures.ThreadPoolExecutor(workers * 2) as clients:
+        started = time.perf_counter()
+        deadline = started + seconds
+
+        def client() -> int:
+            done = 0
+            while time.perf_counter() < deadline:
+                try:
+                    hasher.hash(PASSWORD)
+                    done += 1
+                except PasswordHasherBusyError:
+                    time.sleep(0.001)
+            return done
+
+        for done in clients.map(lambda _: client(), range(workers * 2)):
+            count += done
+        elapsed = time.perf_counter() - started
+    hasher._pool().shutdown()
+    return count / elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="bcrypt hashes/sec per core")
+    parser.add_argument("--rounds", type=int, nargs="+", default=[10, 12])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count() or 1])
+    parser.add_argument("--seconds", type=float, default=3)
+    args = parser.parse_args()
+
+    print(f"CPU: {os.cpu_count()}")
+    print(f"{'rounds':>6}{'workers':>9}{'hash/s':>10}{'per worker':>12}{'ms/hash':>10}")
+    for rounds in args.rounds:
+        rate = single_core(rounds, args.seconds)
+        print(f"{rounds:>6}{'inline':>9}{rate:>10.1f}{rate:>12.1f}{1000 / rate:>10.1f}")
+        for workers in args.workers:
+            rate = pooled(rounds, workers, args.seconds)
+            print(f"{rounds:>6}{workers:>9}{rate:>10.1f}{rate / workers:>12.1f}{1000 * workers / rate:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
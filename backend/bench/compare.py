@@ -0,0 +1,53 @@
+"""Compare two load-test result files and flag regressions.
+
+Usage: python -m bench.compare BASELINE.json CANDIDATE.json [--threshold 0.10]
+
+Exits with status 1 when any endpoint's p95 grows, or the overall req/s drops,
+by more than the threshold.
+"""
+import argparse
+import json
+import sys
+from typing import Dict, Any, List
+
+
+def _change(old: float, new: float) -> float:
+    return (new - old) / old if old else 0.0
+
+
+def compare(baseline: Dict[str, Any], candidate: Dict[str, Any], threshold: float) -> List[str]:
+    """Print a side-by-side table and return the list of regressions"""
+    regressions = []
+    print(f"{'endpoint':<18}{'p95 base':>10}{'p95 new':>10}{'change':>9}{'p99 base':>10}{'p99 new':>10}")
+    for endpoint, base in baseline["endpoints"].items():
+        new = candidate["endpoints"].get(endpoint)
+        if new is None:
+            continue
+        change = _change(base["p95_ms"], new["p95_ms"])
+        print(f"{endpoint:<18}{base['p95_ms']:>10}{new['p95_ms']:>10}{change:>+9.1%}"
+              f"{base['p99_ms']:>10}{new['p99_ms']:>10}")
+        if change > threshold:
+            regressions.append(f"{endpoint}: p95 {base['p95_ms']} -> {new['p95_ms']} ms ({change:+.1%})")
+    rps_change = _change(baseline["rps"], candidate["rps"])
+    print(f"\nreq/s: {baseline['rps']} -> {candidate['rps']} ({rps_change:+.1%})")
+    if -rps_change > threshold:
+        regressions.append(f"req/s {baseline['rps']} -> {candidate['rps']} ({rps_change:+.1%})")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed relative regression")
+    args = parser.parse_args()
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.candidate, encoding="utf-8") as f:
+        candidate = json.load(f)
+    print(f"Базовый прогон: {baseline.get('label')} ({baseline.get('commit')}), "
+          f"новый: {candidate.get('label')} ({candidate.get('commit')})\n")
+    regressions = compare(baseline, candidate, args.threshold)
+    if regressions:
+        print("\nРегрессии:\n  " + "\n  ".join(regressions))
+        sys.exit(1)
@@ -0,0 +1,86 @@
+"""Deterministic stand-in for genai.GenerativeModel used by the benchmarks.
+
+Answers are derived from a hash of the prompt, so identical requests produce
+identical text. Latency, token rate and failures are configured through env:
+
+    FAKE_LLM_LATENCY_MS      time to first token (default 300)
+    FAKE_LLM_TOKENS_PER_SEC  generation speed after the first token (default 80)
+    FAKE_LLM_TOKENS          tokens per answer (default 120)
+    FAKE_LLM_FAILURE_RATE    share of calls that raise, 0..1 (default 0)
+    FAKE_LLM_SEED            seed of the failure sequence (default 42)
+"""
+import asyncio
+import hashlib
+import os
+import random
+import threading
+import time
+from typing import Any, Iterator, List
+
+FAKE_LLM_LATENCY_MS = float(os.environ.get("FAKE_LLM_LATENCY_MS", 300))
+FAKE_LLM_TOKENS_PER_SEC = float(os.environ.get("FAKE_LLM_TOKENS_PER_SEC", 80))
+FAKE_LLM_TOKENS = int(os.environ.get("FAKE_LLM_TOKENS", 120))
+FAKE_LLM_FAILURE_RATE = float(os.environ.get("FAKE_LLM_FAILURE_RATE", 0))
+FAKE_LLM_SEED = int(os.environ.get("FAKE_LLM_SEED", 42))
+
+_WORDS = [
+    "карты", "говорят", "о", "переменах", "в", "вашей", "жизни", "путь", "откроется",
+    "скоро", "доверьтесь", "интуиции", "энергия", "Башни", "указывает", "на", "обновление",
+    "Шут", "приносит", "новое", "начало", "будьте", "внимательны", "к", "знакам"
+]
+
+
+class FakeLLMError(ConnectionError):
+    """A transient model failure, so the client retries it and the circuit breaker counts it"""
+
+
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeModel:
+    """Implements the generate_content calls GeminiProvider makes, without any network access"""
+
+    def __init__(self, latency_ms: float = FAKE_LLM_LATENCY_MS, tokens_per_sec: float = FAKE_LLM_TOKENS_PER_SEC,
+                 tokens: int = FAKE_LLM_TOKENS, failure_rate: float = FAKE_LLM_FAILURE_RATE,
+                 seed: int = FAKE_LLM_SEED):
+        self.latency = latency_ms / 1000
+        self.token_delay = 1 / tokens_per_sec if tokens_per_sec > 0 else 0
+        self.tokens = tokens
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def _answer(self, contents: Any) -> List[str]:
+        prompt = "\n".join(contents) if isinstance(contents, list) else str(contents)
+        digest = hashlib.sha256(prompt.encode("utf-8")).digest()
+        return [_WORDS[digest[i % len(digest)] % len(_WORDS)] + " " for i in range(self.tokens)]
+
+    def _should_fail(self) -> bool:
+        with self._lock:
+            self.calls += 1
+            return self._random.random() < self.failure_rate
+
+    def _stream(self, words: List[str]) -> Iterator[FakeResponse]:
+        time.sleep(self.latency)
+        for i in range(0, len(words), 8):
+            time.sleep(self.token_delay * len(words[i:i + 8]))
+            yield FakeResponse("".join(words[i:i + 8]))
+
+    def generate_content(self, contents: Any, stream: bool = False, **kwargs):
+        if self._should_fail():
+            raise FakeLLMError("Injected fake LLM failure")
+        words = self._answer(contents)
+        if stream:
+            return self._stream(words)
+        time.sleep(self.latency + self.token_delay * len(words))
+        return FakeResponse("".join(words))
+
+    async def generate_content_async(self, contents: Any, **kwargs):
+        if self._should_fail():
+            raise FakeLLMError("Injected fake LLM failure")
+        words = self._answer(contents)
+        await asyncio.sleep(self.latency + self.token_delay * len(words))
+        return FakeResponse("".join(words))
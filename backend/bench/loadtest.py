@@ -0,0 +1,216 @@
+"""Drive full user journeys against a running backend and record latency per endpoint.
+
+Each virtual user repeats: register -> login -> new-session -> submit-questions ->
+draw-cards -> save-reading -> list readings. Results are written as JSON so runs
+can be compared with bench.compare.
+
+Usage: python -m bench.loadtest [--base-url URL] [--users N] [--journeys N] [--label NAME]
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import math
+import random
+import subprocess
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+import httpx
+
+from utils.card_recognition import TAROT_CARDS_DATA
+
+RESULTS_DIR = Path(__file__).parent / "results"
+PASSWORD = "BenchPass123"
+QUESTIONS = [
+    "Что меня ждет в ближайший месяц?",
+    "Стоит ли менять работу?",
+    "Как развиваются мои отношения?",
+    "На что обратить внимание в финансах?",
+    "Чему меня учит текущая ситуация?",
+]
+
+
+class StepFailed(Exception):
+    pass
+
+
+def percentile(sorted_values: List[float], fraction: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values), max(1, math.ceil(fraction * len(sorted_values)))) - 1
+    return sorted_values[index]
+
+
+class Recorder:
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.statuses: Dict[str, Dict[str, int]] = {}
+
+    def add(self, endpoint: str, elapsed_ms: float, status: int, ok: bool) -> None:
+        self.samples.setdefault(endpoint, []).append(elapsed_ms)
+        statuses = self.statuses.setdefault(endpoint, {})
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+        if not ok:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def summary(self, duration: float) -> Dict[str, Any]:
+        endpoints = {}
+        for endpoint, samples in self.samples.items():
+            ordered = sorted(samples)
+            endpoints[endpoint] = {
+                "count": len(ordered),
+                "errors": self.errors.get(endpoint, 0),
+                "statuses": self.statuses[endpoint],
+                "rps": round(len(ordered) / duration, 2) if duration else 0.0,
+                "mean_ms": round(sum(ordered) / len(ordered), 2),
+                "p50_ms": round(percentile(ordered, 0.50), 2),
+                "p95_ms": round(percentile(ordered, 0.95), 2),
+                "p99_ms": round(percentile(ordered, 0.99), 2),
+                "max_ms": round(ordered[-1], 2)
+            }
+        return endpoints
+
+
+async def call(client: httpx.AsyncClient, recorder: Recorder, endpoint: str, method: str, path: str,
+               **kwargs) -> Dict[str, Any]:
+    started = time.perf_counter()
+    try:
+        response = await client.request(method, path, **kwargs)
+    except httpx.HTTPError as e:
+        recorder.add(endpoint, (time.perf_counter() - started) * 1000, 0, False)
+        raise StepFailed(f"{endpoint}: {e}") from e
+    elapsed = (time.perf_counter() - started) * 1000
+    try:
+        body = response.json()
+    except ValueError:
+        body = {}
+    ok = response.status_code < 400 and not (isinstance(body, dict) and body.get("success") is False)
+    recorder.add(endpoint, elapsed, response.status_code, ok)
+    if not ok:
+        raise StepFailed(f"{endpoint}: HTTP {response.status_code} {str(body)[:200]}")
+    return body
+
+
+async def journey(client: httpx.AsyncClient, recorder: Recorder, rng: random.Random, run_id: str,
+                  user_index: int, iteration: int) -> None:
+    email = f"bench-{run_id}-{user_index}-{iteration}@example.com"
+    await call(client, recorder, "register", "POST", "/api/auth/register", json={
+        "name": f"Bench {user_index}", "email": email, "password": PASSWORD, "confirm_password": PASSWORD
+    })
+    login = await call(client, recorder, "login", "POST", "/api/auth/login",
+                       json={"email": email, "password": PASSWORD})
+    headers = {"Authorization": f"Bearer {login['token']}"}
+
+    session = await call(client, recorder, "new-session", "POST", "/api/new-session", headers=headers)
+    session_id = session["session_id"]
+    questions = rng.sample(QUESTIONS, 2) + [f"Вопрос {uuid.uuid4().hex[:8]}"]
+    await call(client, recorder, "submit-questions", "POST", "/api/submit-questions", headers=headers,
+               json={"session_id": session_id, "responses": questions})
+    cards = [card["name"] for card in rng.sample(TAROT_CARDS_DATA, 3)]
+    reading = await call(client, recorder, "draw-cards", "POST", "/api/draw-cards", headers=headers, json={
+        "session_id": session_id, "cards": cards, "reading_detail": rng.choice(["brief", "detailed"])
+    })
+    await call(client, recorder, "save-reading", "POST", "/api/save-reading", headers=headers, json={
+        "session_id": session_id,
+        "reading_name": "Бенчмарк расклад",
+        "reading_data": {"cards": [{"name": name} for name in cards], "questions": questions,
+                         "interpretation": reading.get("message"), "isAiGenerated": True}
+    })
+    await call(client, recorder, "list-readings", "GET", "/api/user/readings", headers=headers,
+               params={"limit": 10})
+
+
+async def virtual_user(client, recorder, rng, run_id, user_index, journeys, deadline, counters) -> None:
+    iteration = 0
+    while (journeys is None or iteration < journeys) and (deadline is None or time.monotonic() < deadline):
+        try:
+            await journey(client, recorder, rng, run_id, user_index, iteration)
+            counters["completed"] += 1
+        except StepFailed as e:
+            counters["failed"] += 1
+            if counters["failed"] <= 5:
+                print(f"Сценарий прерван: {e}")
+        iteration += 1
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    run_id = uuid.uuid4().hex[:8]
+    recorder = Recorder()
+    counters = {"completed": 0, "failed": 0}
+    limits = httpx.Limits(max_connections=args.users, max_keepalive_connections=args.users)
+    deadline = time.monotonic() + args.duration if args.duration else None
+    journeys = args.journeys if args.journeys is not None else (None if args.duration else 5)
+
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*[
+            virtual_user(client, recorder, random.Random(args.seed + i), run_id, i, journeys, deadline, counters)
+            for i in range(args.users)
+        ])
+        duration = time.perf_counter() - started
+
+    total = sum(len(samples) for samples in recorder.samples.values())
+    return {
+        "label": args.label,
+        "commit": git_commit(),
+        "started_at": datetime.datetime.utcnow().isoformat(),
+        "config": {
+            "base_url": args.base_url,
+            "users": args.users,
+            "journeys_per_user": journeys,
+            "duration_limit_s": args.duration,
+            "seed": args.seed
+        },
+        "duration_s": round(duration, 3),
+        "requests": total,
+        "rps": round(total / duration, 2) if duration else 0.0,
+        "journeys": counters,
+        "endpoints": recorder.summary(duration)
+    }
+
+
+def print_report(result: Dict[str, Any]) -> None:
+    print(f"\n{result['requests']} запросов за {result['duration_s']} с, {result['rps']} req/s, "
+          f"сценариев: {result['journeys']['completed']} успешно, {result['journeys']['failed']} с ошибкой")
+    print(f"{'endpoint':<18}{'count':>7}{'err':>6}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for endpoint, stats in result["endpoints"].items():
+        print(f"{endpoint:<18}{stats['count']:>7}{stats['errors']:>6}{stats['rps']:>9}"
+              f"{stats['p50_ms']:>9}{stats['p95_ms']:>9}{stats['p99_ms']:>9}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Tarot backend load test")
+    parser.add_argument("--base-url", default="http://127.0.0.1:5050")
+    parser.add_argument("--users", type=int, default=10, help="concurrent virtual users")
+    parser.add_argument("--journeys", type=int, default=None, help="journeys per user (default 5, unlimited with --duration)")
+    parser.add_argument("--duration", type=float, default=None, help="stop after this many seconds")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--label", default="run")
+    parser.add_argument("--output", default=None, help="results file (default bench/results/<time>-<label>.json)")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    print_report(result)
+    output = Path(args.output) if args.output else \
+        RESULTS_DIR / f"{datetime.datetime.now():%Y%m%d-%H%M%S}-{args.label}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"Результаты записаны в {output}")
+
+
+if __name__ == "__main__":
+    main()
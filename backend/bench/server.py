@@ -0,0 +1,53 @@
+"""Boot the backend against the fake LLM for benchmarking.
+
+Run from the backend directory, with Postgres from bench/docker-compose.yml up:
+Usage: python -m bench.server [--mode wsgi|asgi] [--port 5050]
+
+Database settings default to that compose file; any DB_* variable that is
+already set wins.
+"""
+import argparse
+import os
+import tempfile
+
+BENCH_ENV = {
+    "DB_HOST": "127.0.0.1",
+    "DB_PORT": "55432",
+    "DB_NAME": "tarot_bench",
+    "DB_USER": "tarot",
+    "DB_PASSWORD": "tarot",
+    "GOOGLE_API_KEY": "bench",
+    "JWT_SECRET_KEY": "bench-secret-key-with-at-least-32-bytes",
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the tarot backend with a fake LLM")
+    parser.add_argument("--mode", choices=["wsgi", "asgi"], default="wsgi")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5050)
+    args = parser.parse_args()
+
+    for key, value in BENCH_ENV.items():
+        os.environ.setdefault(key, value)
+    os.environ.setdefault("SESSION_DIR", tempfile.mkdtemp(prefix="tarot-bench-sessions-"))
+    os.environ.setdefault("INTERPRETATION_CACHE_PATH", os.path.join(os.environ["SESSION_DIR"], "cache.db"))
+
+    import App
+    from bench.fake_llm import FakeModel
+    from utils.llm import GeminiProvider, ResilientLLM
+    from utils.metrics import instrument_model
+    App.llm = ResilientLLM(GeminiProvider(instrument_model(FakeModel())))
+    print(f"Бенчмарк-сервер: режим {args.mode}, порт {args.port}, сессии в {os.environ['SESSION_DIR']}")
+
+    if args.mode == "asgi":
+        import uvicorn
+        import asgi
+        asgi.llm = App.llm
+        uvicorn.run(asgi.app, host=args.host, port=args.port, log_level="warning")
+    else:
+        App.create_app().run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
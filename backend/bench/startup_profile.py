@@ -0,0 +1,103 @@
+"""Report where cold start time goes and check it against a budget.
+
+Imports the app in a fresh interpreter with ``-X importtime``, prints the
+slowest modules imported before create_app() runs, then times create_app() and, optionally, the wait until
+/readyz would report ready. Exits with status 1 when the import exceeds the target.
+
+Usage: python -m bench.startup_profile [--target-ms 600] [--top 15] [--wait-ready 30]
+"""
+import argparse
+import json
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+FACTORY_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import App
+imported = time.perf_counter()
+sys.stderr.write("IMPORTED\\n")
+sys.stderr.flush()
+App.create_app()
+created = time.perf_counter()
+ready = App.startup.wait_ready({wait}) if {wait} > 0 else App.startup.is_ready()
+done = time.perf_counter()
+print("STARTUP " + json.dumps({{
+    "import_ms": (imported - started) * 1000,
+    "create_app_ms": (created - imported) * 1000,
+    "ready": ready,
+    "ready_ms": (done - started) * 1000 if ready else None,
+    "tasks": App.startup.stats()["tasks"]
+}}, default=str))
+"""
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int]]:
+    """(module, self_us, cumulative_us) of every import made before the app finished importing"""
+    rows = []
+    for line in stderr.splitlines():
+        if line == "IMPORTED":
+            break
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        rows.append((name.rstrip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def top_level(rows: List[Tuple[str, int, int]]) -> Dict[str, int]:
+    """Cumulative time of the modules imported directly by the app, by top-level package"""
+    totals: Dict[str, int] = {}
+    for name, _, cumulative in rows:
+        depth = len(name) - len(name.lstrip())
+        if depth == 3:
+            package = name.strip().split(".")[0]
+            totals[package] = totals.get(package, 0) + cumulative
+    return totals
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Profile application import and startup")
+    parser.add_argument("--target-ms", type=float, default=600, help="import time budget")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--wait-ready", type=float, default=0, help="seconds to wait for readiness")
+    args = parser.parse_args()
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", FACTORY_PROBE.format(wait=args.wait_ready)],
+        capture_output=True, text=True
+    )
+    rows = parse_importtime(result.stderr)
+    probe = next((line for line in result.stdout.splitlines() if line.startswith("STARTUP ")), None)
+    if probe is None:
+        print(result.stdout)
+        print(result.stderr[-2000:])
+        sys.exit(2)
+    startup = json.loads(probe[len("STARTUP "):])
+
+    app_row = next((row for row in rows if row[0].strip() == "App"), None)
+    print(f"Импорт App: {startup['import_ms']:.0f} мс (importtime: {app_row[2] / 1000 if app_row else 0:.0f} мс), "
+          f"create_app(): {startup['create_app_ms']:.1f} мс")
+    if startup["ready"]:
+        print(f"Готовность через {startup['ready_ms']:.0f} мс после старта")
+    else:
+        print("Приложение не стало готовым за отведенное время")
+    for name, task in startup["tasks"].items():
+        seconds = f"{task['seconds'] * 1000:.0f} мс" if task["seconds"] is not None else "-"
+        print(f"  {name:<17}{task['state']:<10}{seconds:>10}  {(task['error'] or '').splitlines()[0] if task['error'] else ''}")
+
+    print(f"\nПакеты, импортируемые приложением (накопительно):")
+    for package, cumulative in sorted(top_level(rows).items(), key=lambda item: -item[1])[:args.top]:
+        print(f"{cumulative / 1000:>10.1f} мс  {package}")
+    print(f"\nСамые медленные модули (собственное время):")
+    for name, self_us, _ in sorted(rows, key=lambda row: -row[1])[:args.top]:
+        print(f"{self_us / 1000:>10.1f} мс  {name.strip()}")
+
+    if startup["import_ms"] > args.target_ms:
+        print(f"\nИмпорт дольше цели {args.target_ms:.0f} мс")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
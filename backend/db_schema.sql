@@ -0,0 +1,188 @@
+-- Tarot application schema. Every statement is idempotent, so init_db applies
+-- this file on each start to create a fresh database or upgrade an existing one.
+-- Requires PostgreSQL 12+. init_db holds an advisory lock while applying it, since
+-- concurrent CREATE OR REPLACE FUNCTION from several workers fails. Triggers are
+-- only created when missing: CREATE OR REPLACE TRIGGER needs PostgreSQL 14.
+
+CREATE TABLE IF NOT EXISTS users (
+    id SERIAL PRIMARY KEY,
+    name VARCHAR(100) NOT NULL,
+    email VARCHAR(255) NOT NULL UNIQUE,
+    password_hash VARCHAR(255) NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    last_login TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS tarot_readings (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+    reading_name VARCHAR(255) NOT NULL,
+    description TEXT,
+    reading_data JSONB,
+    is_saved BOOLEAN NOT NULL DEFAULT FALSE,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Serves the reading history newest-first and its (created_at, id) keyset cursor.
+CREATE INDEX IF NOT EXISTS idx_tarot_readings_user_created
+    ON tarot_readings (user_id, created_at DESC, id DESC);
+
+-- Card and question containment search. Databases that still keep reading_data
+-- as text are converted, and indexed concurrently, by utils.reading_data_migration,
+-- which init_db runs before applying this file.
+DO $$
+BEGIN
+    IF (SELECT data_type FROM information_schema.columns
+        WHERE table_schema = current_schema()
+          AND table_name = 'tarot_readings' AND column_name = 'reading_data') = 'jsonb' THEN
+        CREATE INDEX IF NOT EXISTS idx_tarot_readings_data
+            ON tarot_readings USING GIN (reading_data jsonb_path_ops);
+    END IF;
+END;
+$$;
+
+-- Russian full-text search over names, descriptions, questions and AI answers.
+-- Rows written before the column existed, and the search index itself, are
+-- handled by "python -m utils.reading_search reindex".
+ALTER TABLE tarot_readings ADD COLUMN IF NOT EXISTS search_vector TSVECTOR;
+
+CREATE OR REPLACE FUNCTION reading_search_questions(data JSONB) RETURNS JSONB AS $$
+    SELECT COALESCE(jsonb_path_query_array(data, '$.questions[*]'), '[]'::jsonb);
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION reading_search_answers(data JSONB) RETURNS JSONB AS $$
+    SELECT COALESCE(jsonb_path_query_array(data, '$.history[*] ? (@.role == "assistant").content')
+                    || jsonb_path_query_array(data, '$.interpretation'), '[]'::jsonb);
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION reading_search_vector(name TEXT, description TEXT, data JSONB) RETURNS TSVECTOR AS $$
+    SELECT setweight(to_tsvector('russian', COALESCE(name, '')), 'A')
+        || setweight(to_tsvector('russian', COALESCE(description, '')), 'B')
+        || setweight(to_tsvector('russian', reading_search_questions(data)), 'B')
+        || setweight(to_tsvector('russian', reading_search_answers(data)), 'C');
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Plain text that ts_headline cuts result snippets from
+CREATE OR REPLACE FUNCTION reading_search_document(description TEXT, data JSONB) RETURNS TEXT AS $$
+    SELECT concat_ws(E'\n', description,
+        (SELECT string_agg(value #>> '{}', E'\n')
+         FROM jsonb_array_elements(reading_search_questions(data) || reading_search_answers(data))));
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION tarot_readings_search_vector() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := reading_search_vector(NEW.reading_name, NEW.description, NEW.reading_data);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- idx_tarot_readings_search is built concurrently by the reindex command, which
+-- also installs btree_gin when the database role is allowed to.
+
+DO $$
+BEGIN
+    IF (SELECT data_type FROM information_schema.columns
+        WHERE table_schema = current_schema()
+          AND table_name = 'tarot_readings' AND column_name = 'reading_data') = 'jsonb' THEN
+        IF NOT EXISTS (SELECT 1 FROM pg_trigger
+                       WHERE tgrelid = 'tarot_readings'::regclass AND tgname = 'tarot_readings_search_vector') THEN
+            CREATE TRIGGER tarot_readings_search_vector
+                BEFORE INSERT OR UPDATE OF reading_name, description, reading_data ON tarot_readings
+                FOR EACH ROW EXECUTE FUNCTION tarot_readings_search_vector();
+        END IF;
+    END IF;
+END;
+$$;
+
+CREATE TABLE IF NOT EXISTS saved_layouts (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    name VARCHAR(255) NOT NULL,
+    description TEXT,
+    cards TEXT[] NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Per-user counters maintained by triggers, so profile lookups never count rows.
+-- month_readings is only valid while month_start is the current month; readers
+-- treat an older month_start as zero and the next insert rolls it over.
+CREATE TABLE IF NOT EXISTS user_stats (
+    user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    total_readings INTEGER NOT NULL DEFAULT 0,
+    month_readings INTEGER NOT NULL DEFAULT 0,
+    month_start DATE NOT NULL DEFAULT date_trunc('month', CURRENT_DATE)::date,
+    saved_layouts INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE OR REPLACE FUNCTION user_stats_track_reading() RETURNS trigger AS $$
+DECLARE
+    current_month DATE := date_trunc('month', CURRENT_DATE)::date;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        IF NEW.user_id IS NULL THEN
+            RETURN NULL;
+        END IF;
+        INSERT INTO user_stats (user_id, total_readings, month_readings, month_start)
+        VALUES (NEW.user_id, 1, CASE WHEN NEW.created_at >= current_month THEN 1 ELSE 0 END, current_month)
+        ON CONFLICT (user_id) DO UPDATE SET
+            total_readings = user_stats.total_readings + 1,
+            month_readings = CASE WHEN user_stats.month_start = current_month
+                                  THEN user_stats.month_readings ELSE 0 END
+                             + EXCLUDED.month_readings,
+            month_start = current_month,
+            updated_at = CURRENT_TIMESTAMP;
+    ELSIF TG_OP = 'DELETE' THEN
+        IF OLD.user_id IS NULL THEN
+            RETURN NULL;
+        END IF;
+        UPDATE user_stats SET
+            total_readings = GREATEST(total_readings - 1, 0),
+            month_readings = CASE WHEN month_start = current_month AND OLD.created_at >= current_month
+                                  THEN GREATEST(month_readings - 1, 0) ELSE month_readings END,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE user_id = OLD.user_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_trigger
+                   WHERE tgrelid = 'tarot_readings'::regclass AND tgname = 'tarot_readings_user_stats') THEN
+        CREATE TRIGGER tarot_readings_user_stats
+            AFTER INSERT OR DELETE ON tarot_readings
+            FOR EACH ROW EXECUTE FUNCTION user_stats_track_reading();
+    END IF;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION user_stats_track_layout() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO user_stats (user_id, saved_layouts)
+        VALUES (NEW.user_id, 1)
+        ON CONFLICT (user_id) DO UPDATE SET
+            saved_layouts = user_stats.saved_layouts + 1,
+            updated_at = CURRENT_TIMESTAMP;
+    ELSIF TG_OP = 'DELETE' THEN
+        UPDATE user_stats SET
+            saved_layouts = GREATEST(saved_layouts - 1, 0),
+            updated_at = CURRENT_TIMESTAMP
+        WHERE user_id = OLD.user_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_trigger
+                   WHERE tgrelid = 'saved_layouts'::regclass AND tgname = 'saved_layouts_user_stats') THEN
+        CREATE TRIGGER saved_layouts_user_stats
+            AFTER INSERT OR DELETE ON saved_layouts
+            FOR EACH ROW EXECUTE FUNCTION user_stats_track_layout();
+    END IF;
+END;
+$$;
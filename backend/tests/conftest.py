@@ -0,0 +1,9 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# utils.db reads its settings at import; unit tests never open a connection
+for name, value in {"DB_HOST": "localhost", "DB_PORT": "5432", "DB_NAME": "tarot",
+                    "DB_USER": "tarot", "DB_PASSWORD": "tarot"}.items():
+    os.environ.setdefault(name, value)
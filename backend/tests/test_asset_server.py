@@ -0,0 +1,73 @@
+import gzip
+
+import pytest
+from flask import Flask
+
+from utils.asset_server import AssetServer
+
+SCRIPT = b"console.log('tarot');\n" * 200
+
+
+@pytest.fixture
+def server(tmp_path):
+    (tmp_path / "static" / "js").mkdir(parents=True)
+    (tmp_path / "static" / "js" / "main.3f2a1b9c.js").write_bytes(SCRIPT)
+    (tmp_path / "static" / "js" / "main.3f2a1b9c.js.br").write_bytes(b"prebuilt brotli body")
+    (tmp_path / "index.html").write_bytes(b"<!doctype html><title>Tarot</title>")
+    return AssetServer(str(tmp_path))
+
+
+@pytest.fixture
+def app():
+    return Flask(__name__, static_folder=None)
+
+
+def serve(app, server, path, **headers):
+    with app.test_request_context(headers=headers):
+        return server.serve(path)
+
+
+def test_prefers_brotli_then_gzip(app, server):
+    response = serve(app, server, "static/js/main.3f2a1b9c.js", **{"Accept-Encoding": "gzip, br"})
+    assert response.headers["Content-Encoding"] == "br"
+    assert response.headers["Vary"] == "Accept-Encoding"
+
+    response = serve(app, server, "static/js/main.3f2a1b9c.js", **{"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(response.get_data()) == SCRIPT
+
+
+def test_zero_quality_encodings_are_refused(app, server):
+    response = serve(app, server, "static/js/main.3f2a1b9c.js", **{"Accept-Encoding": "br;q=0, gzip;q=0"})
+    assert "Content-Encoding" not in response.headers
+    assert response.get_data() == SCRIPT
+
+
+def test_no_accept_encoding_gets_identity(app, server):
+    response = serve(app, server, "static/js/main.3f2a1b9c.js")
+    assert "Content-Encoding" not in response.headers
+    assert "immutable" in response.headers["Cache-Control"]
+
+
+def test_each_encoding_has_its_own_etag(app, server):
+    identity = serve(app, server, "static/js/main.3f2a1b9c.js").headers["ETag"]
+    gzipped = serve(app, server, "static/js/main.3f2a1b9c.js", **{"Accept-Encoding": "gzip"}).headers["ETag"]
+    assert identity != gzipped
+
+
+def test_weak_validator_of_any_encoding_revalidates(app, server):
+    etag = serve(app, server, "static/js/main.3f2a1b9c.js", **{"Accept-Encoding": "gzip"}).headers["ETag"]
+    response = serve(app, server, "static/js/main.3f2a1b9c.js",
+                     **{"Accept-Encoding": "gzip", "If-None-Match": f"W/{etag}"})
+    assert response.status_code == 304
+
+
+def test_small_files_are_not_compressed(app, server):
+    response = serve(app, server, "index.html", **{"Accept-Encoding": "gzip, br"})
+    assert "Content-Encoding" not in response.headers
+    assert "Vary" not in response.headers
+    assert response.headers["Cache-Control"] == "no-cache"
+
+
+def test_unknown_path_is_404(app, server):
+    assert serve(app, server, "missing.js").status_code == 404
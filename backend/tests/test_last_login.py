@@ -0,0 +1,54 @@
+import datetime
+
+from utils import last_login
+from utils.last_login import LastLoginBuffer, last_login_update_sql
+
+
+def test_update_sql_has_one_typed_row_per_user():
+    sql = last_login_update_sql(3)
+    assert "(%(id0)s::integer, %(at0)s::timestamp), (%(id1)s::integer, %(at1)s::timestamp), " \
+           "(%(id2)s::integer, %(at2)s::timestamp)" in sql
+    assert "%(id3)s" not in sql
+
+
+def test_update_sql_never_moves_last_login_backwards():
+    sql = " ".join(last_login_update_sql(1).split())
+    assert "WHERE u.id = v.id AND (u.last_login IS NULL OR u.last_login < v.last_login)" in sql
+
+
+def test_flush_writes_latest_login_in_sorted_batches(monkeypatch):
+    calls = []
+
+    def execute_update(query, params):
+        calls.append((query, params))
+        return len(params) // 2
+
+    monkeypatch.setattr(last_login, "execute_update", execute_update)
+    buffer = LastLoginBuffer(interval=60, batch_size=2)
+    monkeypatch.setattr(buffer, "ensure_started", lambda: None)
+    early, late = datetime.datetime(2024, 1, 1), datetime.datetime(2024, 1, 2)
+    buffer.record(3, early)
+    buffer.record(1, early)
+    buffer.record(2, early)
+    buffer.record(3, late)
+
+    assert buffer.flush() == 3
+    assert [params for _, params in calls] == [
+        {"id0": 1, "at0": early, "id1": 2, "at1": early},
+        {"id0": 3, "at0": late},
+    ]
+    assert buffer.flush() == 0
+
+
+def test_failed_flush_keeps_the_batch(monkeypatch):
+    def execute_update(query, params):
+        raise RuntimeError("database is down")
+
+    monkeypatch.setattr(last_login, "execute_update", execute_update)
+    buffer = LastLoginBuffer(interval=60)
+    monkeypatch.setattr(buffer, "ensure_started", lambda: None)
+    buffer.record(1, datetime.datetime(2024, 1, 1))
+
+    assert buffer.flush() == 0
+    assert buffer.stats()["pending"] == 1
+    assert buffer.stats()["errors"] == 1
@@ -0,0 +1,44 @@
+from utils.metrics import Counter, Histogram, query_label
+
+
+def samples(metric):
+    return [line for line in metric.render() if not line.startswith("#")]
+
+
+def test_histogram_buckets_are_cumulative_and_inclusive():
+    histogram = Histogram("test_seconds", "Test latency", ("op",), buckets=(0.1, 1, 5))
+    for value in (0.05, 0.1, 0.5, 1, 7):
+        histogram.observe(value, op="load")
+
+    assert samples(histogram) == [
+        'test_seconds_bucket{op="load",le="0.1"} 2',
+        'test_seconds_bucket{op="load",le="1"} 4',
+        'test_seconds_bucket{op="load",le="5"} 4',
+        'test_seconds_bucket{op="load",le="+Inf"} 5',
+        'test_seconds_sum{op="load"} 8.65',
+        'test_seconds_count{op="load"} 5',
+    ]
+
+
+def test_histogram_keeps_one_series_per_label_set():
+    histogram = Histogram("test_seconds", "Test latency", ("op",), buckets=(1,))
+    histogram.observe(0.5, op="save")
+    histogram.observe(2, op="load")
+
+    lines = samples(histogram)
+    assert 'test_seconds_bucket{op="load",le="1"} 0' in lines
+    assert 'test_seconds_bucket{op="save",le="1"} 1' in lines
+    assert 'test_seconds_count{op="load"} 1' in lines
+
+
+def test_label_values_are_escaped():
+    counter = Counter("test_total", "Test counter", ("route",))
+    counter.inc(route='/a"b\\c')
+    assert samples(counter) == ['test_total{route="/a\\"b\\\\c"} 1']
+
+
+def test_query_label_uses_verb_and_first_table():
+    assert query_label("SELECT id FROM tarot_readings WHERE user_id = %(id)s") == "select tarot_readings"
+    assert query_label("\n  INSERT INTO users (name) VALUES (%(name)s)") == "insert users"
+    assert query_label("CREATE TABLE IF NOT EXISTS user_stats (id int)") == "create user_stats"
+    assert query_label("SHOW server_version_num") == "show"
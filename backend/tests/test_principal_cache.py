@@ -0,0 +1,69 @@
+from utils import auth
+from utils.auth import PrincipalCache
+
+USER = {"id": 7, "name": "Мария", "email": "maria@example.com"}
+
+
+def test_hit_returns_a_copy():
+    cache = PrincipalCache(ttl=60)
+    cache.put(7, 1000, USER)
+
+    cached = cache.get(7, 1000)
+    assert cached == USER
+    cached["name"] = "changed"
+    assert cache.get(7, 1000)["name"] == "Мария"
+    assert cache.stats()["hits"] == 2
+
+
+def test_entries_are_keyed_by_token_issue_time():
+    cache = PrincipalCache(ttl=60)
+    cache.put(7, 1000, USER)
+    assert cache.get(7, 2000) is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(auth.time, "monotonic", lambda: now[0])
+    cache = PrincipalCache(ttl=60)
+    cache.put(7, 1000, USER)
+
+    now[0] = 160.0
+    assert cache.get(7, 1000) == USER
+    now[0] = 160.5
+    assert cache.get(7, 1000) is None
+    assert cache.stats()["expirations"] == 1
+    assert cache.stats()["size"] == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = PrincipalCache(ttl=60, max_entries=2)
+    cache.put(1, 0, {"id": 1})
+    cache.put(2, 0, {"id": 2})
+    cache.get(1, 0)
+    cache.put(3, 0, {"id": 3})
+
+    assert cache.get(2, 0) is None
+    assert cache.get(1, 0) == {"id": 1}
+    assert cache.get(3, 0) == {"id": 3}
+    assert cache.stats()["evictions"] == 1
+
+
+def test_invalidate_drops_every_token_of_a_user():
+    cache = PrincipalCache(ttl=60)
+    cache.put(7, 1000, USER)
+    cache.put(7, 2000, USER)
+    cache.put(8, 1000, {"id": 8})
+
+    cache.invalidate(7)
+
+    assert cache.get(7, 1000) is None
+    assert cache.get(7, 2000) is None
+    assert cache.get(8, 1000) == {"id": 8}
+    assert cache.stats()["invalidations"] == 2
+
+
+def test_zero_ttl_disables_the_cache():
+    cache = PrincipalCache(ttl=0)
+    cache.put(7, 1000, USER)
+    assert cache.get(7, 1000) is None
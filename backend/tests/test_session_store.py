@@ -0,0 +1,83 @@
+import json
+
+import pytest
+
+from utils.session_store import FileSessionStore, InvalidSessionIdError
+
+
+def journal_lines(store, session_id):
+    return store._path(session_id).read_bytes().splitlines(keepends=True)
+
+
+def session(**fields):
+    return {"history": [], "user_responses": [], **fields}
+
+
+def test_append_replays_onto_snapshot(tmp_path):
+    store = FileSessionStore(str(tmp_path))
+    store.put("s1", session(cards_drawn=False))
+    store.append("s1", [{"op": "message", "role": "user", "content": "hi"},
+                        {"op": "set", "fields": {"cards_drawn": True}}])
+
+    assert store.get("s1") == session(history=[{"role": "user", "content": "hi"}], cards_drawn=True)
+    assert len(journal_lines(store, "s1")) == 3
+
+
+def test_truncated_write_is_dropped_on_replay(tmp_path):
+    store = FileSessionStore(str(tmp_path))
+    store.put("s1", session(cards_drawn=False))
+    store.append("s1", [{"op": "set", "fields": {"cards_drawn": True}}])
+    path = store._path("s1")
+    intact = path.stat().st_size
+    with open(path, "ab") as f:
+        f.write(b'{"op": "set", "fields": {"summ')
+
+    assert store.get("s1") == session(cards_drawn=True)
+    assert path.stat().st_size == intact
+    assert store.recovered == 1
+
+    # The next append lands on a clean line boundary
+    store.append("s1", [{"op": "set", "fields": {"summary": "ok"}}])
+    assert store.get("s1") == session(cards_drawn=True, summary="ok")
+
+
+def test_compacts_after_compact_every_records(tmp_path):
+    store = FileSessionStore(str(tmp_path), compact_every=4)
+    store.put("s1", session(summary_upto=0))
+    for i in range(1, 4):
+        store.append("s1", [{"op": "set", "fields": {"summary_upto": i}}])
+    assert len(journal_lines(store, "s1")) == 4
+    assert store.compactions == 0
+
+    store.append("s1", [{"op": "set", "fields": {"summary_upto": 4}}])
+
+    lines = journal_lines(store, "s1")
+    assert len(lines) == 1
+    assert json.loads(lines[0]) == {"op": "snapshot", "state": session(summary_upto=4)}
+    assert store.compactions == 1
+    assert store.get("s1") == session(summary_upto=4)
+
+
+def test_get_compacts_a_long_journal_written_elsewhere(tmp_path):
+    FileSessionStore(str(tmp_path), compact_every=1000).put("s1", session(summary_upto=0))
+    writer = FileSessionStore(str(tmp_path), compact_every=1000)
+    for i in range(1, 6):
+        writer.append("s1", [{"op": "set", "fields": {"summary_upto": i}}])
+
+    reader = FileSessionStore(str(tmp_path), compact_every=5)
+    assert reader.get("s1") == session(summary_upto=5)
+    assert reader.compactions == 1
+    assert len(journal_lines(reader, "s1")) == 1
+
+
+def test_missing_session_and_directory_are_not_created(tmp_path):
+    store = FileSessionStore(str(tmp_path / "sessions"))
+    assert store.get("missing") is None
+    assert not (tmp_path / "sessions").exists()
+
+
+@pytest.mark.parametrize("session_id", ["../escape", "a/b", "", ".hidden", "x" * 200])
+def test_rejects_unsafe_session_ids(tmp_path, session_id):
+    store = FileSessionStore(str(tmp_path))
+    with pytest.raises(InvalidSessionIdError):
+        store.put(session_id, {})
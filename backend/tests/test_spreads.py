@@ -0,0 +1,50 @@
+import pytest
+
+from utils.spreads import SPREADS, SpreadError, draw_indices, draw_spread, new_seed, replay_spread
+
+
+def test_same_seed_draws_the_same_cards():
+    seed = new_seed()
+    first = draw_spread("celtic_cross", seed)
+    second = draw_spread("celtic_cross", seed)
+    assert first["seed"] == seed
+    assert [(c["name"], c["reversed"]) for c in first["cards"]] == \
+        [(c["name"], c["reversed"]) for c in second["cards"]]
+
+
+def test_replay_matches_the_stored_draw():
+    spread = draw_spread({"name": "custom", "title": "Выбор", "positions": ["Путь А", "Путь Б"]})
+    assert replay_spread(spread)["cards"] == spread["cards"]
+
+
+def test_positions_and_cards_line_up_without_repeats():
+    spread = draw_spread("celtic_cross", new_seed())
+    positions = [p["name"] for p in SPREADS["celtic_cross"]["positions"]]
+    assert [c["position"] for c in spread["cards"]] == positions
+    assert len({c["name"] for c in spread["cards"]}) == len(positions)
+
+
+def test_seed_prefix_is_stable():
+    # A longer spread continues the same shuffle as a shorter one
+    seed = new_seed()
+    three, _ = draw_indices(3, seed)
+    ten, _ = draw_indices(10, seed)
+    assert three.tolist() == ten[:3].tolist()
+
+
+def test_reversals_can_be_disabled():
+    spread = draw_spread("celtic_cross", new_seed(), reversals=False)
+    assert spread["reversal_rate"] == 0.0
+    assert not any(c["reversed"] for c in spread["cards"])
+
+
+def test_new_seeds_are_distinct_hex():
+    seeds = {new_seed() for _ in range(100)}
+    assert len(seeds) == 100
+    assert all(len(seed) == 32 and int(seed, 16) >= 0 for seed in seeds)
+
+
+@pytest.mark.parametrize("seed", ["not-hex", "0x", "zz"])
+def test_invalid_seed_is_rejected(seed):
+    with pytest.raises(SpreadError):
+        draw_spread("single", seed)
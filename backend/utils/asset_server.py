@@ -0,0 +1,192 @@
+"""Serve the React build from an in-memory manifest.
+
+The build directory is scanned once. Each file gets:
+
+- a content type and a strong ETag
+- gzip and, when the optional brotli package is installed, brotli bodies for
+  compressible types; ``.gz``/``.br`` files written next to it by
+  ``python -m utils.asset_server compress`` are used instead of compressing again
+- ``immutable`` caching when its name carries a content hash, revalidation otherwise
+
+Small files are answered from memory. Larger ones are sent from disk with
+send_file, which uses the server's wsgi.file_wrapper (sendfile) when it has one.
+
+Usage: python -m utils.asset_server compress [--build-dir DIR]
+"""
+import argparse
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Dict, Any, Optional
+
+from flask import Response, request, send_file
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+FRONTEND_BUILD_DIR = os.environ.get(
+    "FRONTEND_BUILD_DIR",
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "frontend", "build"))
+)
+ASSET_MEMORY_MAX_BYTES = int(os.environ.get("ASSET_MEMORY_MAX_BYTES", 512 * 1024))
+ASSET_COMPRESS_MIN_BYTES = 1024
+ASSET_IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+ASSET_BROTLI_QUALITY = int(os.environ.get("ASSET_BROTLI_QUALITY", 11))
+
+# CRA names: main.3f2a1b9c.js, 787.d4e5f6a7.chunk.js, logo.6ce24c58.svg
+HASHED_NAME_RE = re.compile(r"\.[0-9a-f]{8,}\.(?:chunk\.)?[A-Za-z0-9]+$")
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "application/manifest+json",
+                      "image/svg+xml", "application/xml", "application/wasm")
+ENCODING_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+
+class AssetVariant:
+    """One encoding of an asset, held in memory or left on disk"""
+
+    def __init__(self, etag: str, data: Optional[bytes] = None, path: Optional[str] = None):
+        self.etag = etag
+        self.data = data
+        self.path = path
+
+
+class Asset:
+    def __init__(self, content_type: str, cache_control: str, variants: Dict[str, AssetVariant]):
+        self.content_type = content_type
+        self.cache_control = cache_control
+        self.variants = variants
+        self.etags = {variant.etag for variant in variants.values()}
+
+
+def is_compressible(content_type: str) -> bool:
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=ASSET_BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def build_asset(path: Path, relative: str) -> Asset:
+    data = path.read_bytes()
+    etag = hashlib.sha256(data).hexdigest()[:32]
+    content_type = mimetypes.guess_type(relative)[0] or "application/octet-stream"
+    if HASHED_NAME_RE.search(path.name):
+        cache_control = f"public, max-age={ASSET_IMMUTABLE_MAX_AGE}, immutable"
+    else:
+        cache_control = "no-cache"
+    in_memory = len(data) <= ASSET_MEMORY_MAX_BYTES
+    variants = {"identity": AssetVariant(etag, data if in_memory else None, None if in_memory else str(path))}
+    if is_compressible(content_type) and len(data) >= ASSET_COMPRESS_MIN_BYTES:
+        for encoding, suffix in ENCODING_SUFFIXES.items():
+            sibling = path.with_name(path.name + suffix)
+            if sibling.is_file():
+                variants[encoding] = AssetVariant(f"{etag}-{encoding}", path=str(sibling))
+            elif encoding == "gzip" or brotli is not None:
+                body = compress(data, encoding)
+                # Not worth a Content-Encoding for a few percent
+                if len(body) < len(data) * 0.9:
+                    variants[encoding] = AssetVariant(f"{etag}-{encoding}", data=body)
+    return Asset(content_type, cache_control, variants)
+
+
+def scan_build(build_dir: str) -> Dict[str, Asset]:
+    """Map every file of a build directory, by its URL path, to a servable Asset"""
+    root = Path(build_dir)
+    assets = {}
+    if not root.is_dir():
+        return assets
+    for path in sorted(root.rglob("*")):
+        if not path.is_file() or path.suffix in (".gz", ".br") and path.with_suffix("").is_file():
+            continue
+        relative = path.relative_to(root).as_posix()
+        assets[relative] = build_asset(path, relative)
+    return assets
+
+
+class AssetServer:
+    def __init__(self, build_dir: str = FRONTEND_BUILD_DIR):
+        self.build_dir = build_dir
+        self._assets: Optional[Dict[str, Asset]] = None
+        self._lock = threading.Lock()
+
+    @property
+    def assets(self) -> Dict[str, Asset]:
+        if self._assets is None:
+            self.scan()
+        return self._assets
+
+    def scan(self) -> int:
+        """Read the build directory into memory and return the number of files"""
+        with self._lock:
+            if self._assets is None:
+                self._assets = scan_build(self.build_dir)
+                print(f"Сборка фронтенда: {len(self._assets)} файлов из {self.build_dir}")
+        return len(self._assets)
+
+    def __contains__(self, path: str) -> bool:
+        return path in self.assets
+
+    def serve(self, path: str) -> Response:
+        """Respond with an asset in the best encoding the client accepts, or 304 when it is unchanged"""
+        asset = self.assets.get(path)
+        if asset is None:
+            return Response("Not found", status=404, mimetype="text/plain")
+        encoding = next((e for e in ("br", "gzip") if e in asset.variants and request.accept_encodings[e] > 0),
+                        "identity")
+        variant = asset.variants[encoding]
+        headers = {"ETag": f'"{variant.etag}"', "Cache-Control": asset.cache_control}
+        if len(asset.variants) > 1:
+            headers["Vary"] = "Accept-Encoding"
+        # Weak comparison: proxies that re-encode a body turn the tag into W/"..."
+        if any(request.if_none_match.contains_weak(etag) for etag in asset.etags):
+            return Response(status=304, headers=headers)
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        if variant.data is not None:
+            return Response(variant.data, mimetype=asset.content_type, headers=headers)
+        response = send_file(variant.path, mimetype=asset.content_type, etag=False, max_age=None,
+                             conditional=encoding == "identity")
+        response.headers.update(headers)
+        return response
+
+    def stats(self) -> Dict[str, Any]:
+        assets = self.assets
+        encodings: Dict[str, int] = {}
+        for asset in assets.values():
+            for encoding in asset.variants:
+                encodings[encoding] = encodings.get(encoding, 0) + 1
+        return {"build_dir": self.build_dir, "files": len(assets), "variants": encodings, "brotli": brotli is not None}
+
+
+def write_compressed(build_dir: str) -> int:
+    """Write .gz and .br files next to every compressible build file and return how many were written"""
+    written = 0
+    for relative, asset in scan_build(build_dir).items():
+        path = Path(build_dir) / relative
+        for encoding, suffix in ENCODING_SUFFIXES.items():
+            variant = asset.variants.get(encoding)
+            if variant is not None and variant.data is not None:
+                path.with_name(path.name + suffix).write_bytes(variant.data)
+                written += 1
+    return written
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Precompress the React build")
+    parser.add_argument("command", choices=["compress"])
+    parser.add_argument("--build-dir", default=FRONTEND_BUILD_DIR)
+    args = parser.parse_args()
+    if brotli is None:
+        print("Пакет brotli не установлен, будут созданы только .gz")
+    print(f"Записано сжатых файлов: {write_compressed(args.build_dir)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,50 @@
+import hmac
 import os
 from functools import wraps
 from flask import request, jsonify
 import jwt
 import datetime
-import bcrypt
+import threading
+import time
+from collections import OrderedDict
 from dotenv import load_dotenv
 from typing import Dict, Any, Optional, Callable
-from utils.db import execute_query_single, execute_update
+from utils.db import execute_query, execute_query_single, execute_update
+from utils.last_login import last_login_buffer
+from utils.user_stats import USER_STATS_COLUMNS
+from utils.password_hashing import password_hasher, needs_rehash, PasswordHasherBusyError
 
 load_dotenv()
 
 JWT_SECRET_KEY = os.environ.get("JWT_SECRET_KEY", "mystic_tarot_secret_key")
 JWT_EXPIRATION_HOURS = int(os.environ.get("JWT_EXPIRATION_HOURS", 24))
+PRINCIPAL_CACHE_TTL = int(os.environ.get("PRINCIPAL_CACHE_TTL", 60))
+PRINCIPAL_CACHE_SIZE = int(os.environ.get("PRINCIPAL_CACHE_SIZE", 10000))
+INTERNAL_API_TOKEN = os.environ.get("INTERNAL_API_TOKEN", "")
 
 def hash_password(password: str) -> str:
-    """Hash a password using bcrypt"""
-    salt = bcrypt.gensalt()
-    hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
-    return hashed.decode('utf-8')
+    """Hash a password using bcrypt on the hashing pool; raises PasswordHasherBusyError when saturated"""
+    return password_hasher.hash(password)
 
 def check_password(password: str, hashed_password: str) -> bool:
-    """Verify a password against its hash"""
-    return bcrypt.checkpw(password.encode('utf-8'), hashed_password.encode('utf-8'))
+    """Verify a password against its hash on the hashing pool"""
+    return password_hasher.check(password, hashed_password)
+
+def upgrade_password_hash(user_id: int, password: str, hashed_password: str) -> None:
+    """Re-hash a just verified password whose cost differs from BCRYPT_ROUNDS.
+
+    Skipped while the hashing pool is saturated; the next login tries again.
+    """
+    if not needs_rehash(hashed_password):
+        return
+    try:
+        new_hash = hash_password(password)
+    except PasswordHasherBusyError:
+        return
+    execute_update(
+        "UPDATE users SET password_hash = %(password_hash)s WHERE id = %(user_id)s",
+        {"password_hash": new_hash, "user_id": user_id}
+    )
 
 def generate_token(user_id: int) -> str:
     """Generate a JWT token for a user"""
@@ -42,16 +65,94 @@ def verify_token(token: str) -> Optional[Dict[str, Any]]:
     except jwt.InvalidTokenError:
         return None
 
+class PrincipalCache:
+    """Short-lived LRU of authenticated users keyed by (user_id, token iat)"""
+
+    def __init__(self, ttl: int = PRINCIPAL_CACHE_TTL, max_entries: int = PRINCIPAL_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    def get(self, user_id: int, iat: Any) -> Optional[Dict[str, Any]]:
+        key = (user_id, iat)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] >= time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.counters["hits"] += 1
+                    return dict(entry[0])
+                del self._entries[key]
+                self.counters["expirations"] += 1
+            self.counters["misses"] += 1
+            return None
+
+    def put(self, user_id: int, iat: Any, user: Dict[str, Any]) -> None:
+        if self.ttl <= 0:
+            return
+        key = (user_id, iat)
+        with self._lock:
+            self._entries[key] = (dict(user), time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.counters["evictions"] += 1
+
+    def invalidate(self, user_id: int) -> None:
+        """Drop every cached principal of a user, whichever token it was loaded for"""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == user_id]:
+                del self._entries[key]
+                self.counters["invalidations"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self.counters)
+            size = len(self._entries)
+        lookups = counters["hits"] + counters["misses"]
+        return {
+            "size": size,
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hit_rate": round(counters["hits"] / lookups, 4) if lookups else 0.0,
+            **counters
+        }
+
+principal_cache = PrincipalCache()
+
+def invalidate_principal(user_id: int) -> None:
+    """Forget cached user info after the user's profile or stats change"""
+    principal_cache.invalidate(user_id)
+
+def get_request_token() -> Optional[str]:
+    """Return the Bearer token of the current request, if any"""
+    auth_header = request.headers.get('Authorization')
+    if auth_header and auth_header.startswith('Bearer '):
+        return auth_header.split(" ")[1]
+    return None
+
+def load_principal(payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Return the user of a verified token payload, from the principal cache when possible"""
+    user_id, iat = payload['user_id'], payload.get('iat')
+    user = principal_cache.get(user_id, iat)
+    if user is None:
+        user = get_user_info(user_id)
+        if user:
+            principal_cache.put(user_id, iat, user)
+    return user
+
+def authenticate_token(token: str) -> Optional[Dict[str, Any]]:
+    """Verify a JWT and return its user, or None when the token or user is invalid"""
+    payload = verify_token(token)
+    return load_principal(payload) if payload else None
+
 def token_required(f: Callable) -> Callable:
     """Decorator to protect routes that require authentication"""
     @wraps(f)
     def decorated(*args, **kwargs):
-        token = None
-        
-        auth_header = request.headers.get('Authorization')
-        if auth_header and auth_header.startswith('Bearer '):
-            token = auth_header.split(" ")[1]
-        
+        token = get_request_token()
         if not token:
             return jsonify({'message': 'Authorization token is missing'}), 401
         
@@ -59,7 +160,7 @@ def token_required(f: Callable) -> Callable:
         if not payload:
             return jsonify({'message': 'Invalid or expired token'}), 401
         
-        user = get_user_info(payload['user_id'])
+        user = load_principal(payload)
         if not user:
             return jsonify({'message': 'User not found'}), 401
         
@@ -67,18 +168,27 @@ def token_required(f: Callable) -> Callable:
     
     return decorated
 
+def internal_required(f: Callable) -> Callable:
+    """Decorator for operational endpoints: requires an X-Internal-Token header equal to INTERNAL_API_TOKEN.
+
+    Without a configured token these routes answer 404, as if they did not exist.
+    """
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        supplied = request.headers.get('X-Internal-Token', '')
+        if not INTERNAL_API_TOKEN or not hmac.compare_digest(supplied.encode(), INTERNAL_API_TOKEN.encode()):
+            return jsonify({'message': 'Not found'}), 404
+        return f(*args, **kwargs)
+    
+    return decorated
+
 def get_user_info(user_id: int) -> Optional[Dict[str, Any]]:
     """Get user information from the database with aggregated stats"""
-    query = """
-        SELECT u.id, u.name, u.email, u.created_at,
-               COUNT(tr.id) as total_readings,
-               COUNT(CASE WHEN tr.created_at >= date_trunc('month', CURRENT_DATE) THEN 1 END) as month_readings,
-               COUNT(sl.id) as saved_layouts
+    query = f"""
+        SELECT u.id, u.name, u.email, u.created_at, {USER_STATS_COLUMNS}
         FROM users u
-        LEFT JOIN tarot_readings tr ON u.id = tr.user_id
-        LEFT JOIN saved_layouts sl ON u.id = sl.user_id
+        LEFT JOIN user_stats s ON s.user_id = u.id
         WHERE u.id = %(user_id)s
-        GROUP BY u.id
     """
     user = execute_query_single(query, {"user_id": user_id})
     
@@ -89,9 +199,23 @@ def get_user_info(user_id: int) -> Optional[Dict[str, Any]]:
     
     return user
 
+def get_login_user(email: str) -> Optional[Dict[str, Any]]:
+    """Get the password hash, profile and stats of a user by email in one query"""
+    rows = execute_query(
+        f"""
+        SELECT u.id, u.name, u.email, u.created_at, u.password_hash, {USER_STATS_COLUMNS}
+        FROM users u
+        LEFT JOIN user_stats s ON s.user_id = u.id
+        WHERE u.email = %(email)s
+        """,
+        {"email": email}
+    )
+    if not rows:
+        return None
+    user = rows[0]
+    user["avatar"] = user["name"][0].upper() if user["name"] else "U"
+    return user
+
 def update_last_login(user_id: int) -> None:
-    """Update the last login timestamp for a user"""
-    execute_update(
-        "UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE id = %(user_id)s",
-        {"user_id": user_id}
-    )
\ No newline at end of file
+    """Record a login; the timestamp is written by the batched last_login writer"""
+    last_login_buffer.record(user_id)
@@ -1,3 +1,8 @@
+import gzip
+import hashlib
+import json
+from typing import Dict, Any, Optional, List, Tuple
+
 TAROT_CARDS_DATA = [
     # Старшие арканы (Major Arcana)
     {"name": "Шут", "image": "0.png", "type": "major"},
@@ -87,3 +92,65 @@ TAROT_CARDS_DATA = [
     {"name": "Королева Пентаклей", "image": "q_pent.png", "type": "minor", "suit": "pentacles"},
     {"name": "Король Пентаклей", "image": "k_pent.png", "type": "minor", "suit": "pentacles"},
 ]
+
+
+class CatalogBody:
+    """A pre-serialized JSON response body with its gzip form and strong ETag"""
+
+    def __init__(self, payload):
+        self.raw = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        self.gzipped = gzip.compress(self.raw, compresslevel=9, mtime=0)
+        self.etag = hashlib.sha256(self.raw).hexdigest()[:32]
+
+
+class Deck:
+    """Indexed registry of tarot cards with pre-built catalog bodies"""
+
+    def __init__(self, cards: List[Dict[str, Any]]):
+        self.cards = cards
+        self.by_name = {card["name"]: card for card in cards}
+        self.by_image = {card["image"]: card for card in cards}
+        self.by_id = dict(enumerate(cards))
+        self.ids = {card["name"]: card_id for card_id, card in self.by_id.items()}
+        self.by_type: Dict[str, List[Dict[str, Any]]] = {}
+        self.by_suit: Dict[str, List[Dict[str, Any]]] = {}
+        for card in cards:
+            self.by_type.setdefault(card["type"], []).append(card)
+            if "suit" in card:
+                self.by_suit.setdefault(card["suit"], []).append(card)
+        self._catalogs: Dict[str, CatalogBody] = {}
+
+    def __len__(self) -> int:
+        return len(self.cards)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.by_name
+
+    def get(self, name: str) -> Optional[Dict[str, Any]]:
+        return self.by_name.get(name)
+
+    def resolve(self, names: List[str]) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """Split card names into known cards (in the given order) and unknown names"""
+        cards, unknown = [], []
+        for name in names:
+            card = self.by_name.get(name)
+            if card is None:
+                unknown.append(name)
+            else:
+                cards.append(card)
+        return cards, unknown
+
+    def register_catalog(self, name: str, payload) -> CatalogBody:
+        """Serialize and compress a catalog payload once so requests only copy bytes"""
+        body = CatalogBody(payload)
+        self._catalogs[name] = body
+        return body
+
+    def has_catalog(self, name: str) -> bool:
+        return name in self._catalogs
+
+    def catalog(self, name: str) -> CatalogBody:
+        return self._catalogs[name]
+
+
+DECK = Deck(TAROT_CARDS_DATA)
@@ -0,0 +1,98 @@
+import os
+import re
+from typing import Dict, Any, List, Callable
+
+from utils.prompts import TAROT_SYSTEM_PROMPT
+
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", 6000))
+CONTEXT_RECENT_TURNS = int(os.environ.get("CONTEXT_RECENT_TURNS", 6))
+CONTEXT_SUMMARY_MAX_CHARS = int(os.environ.get("CONTEXT_SUMMARY_MAX_CHARS", 2000))
+CONTEXT_SUMMARY_TURN_CHARS = 200
+
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?…])\s")
+_ROLE_LABELS = {"user": "Клиент", "assistant": "Таролог"}
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count; Cyrillic text averages about three characters per token"""
+    return len(text) // 3 + 1
+
+
+def card_facts(session) -> List[str]:
+    """The fixed slot of system facts: drawn cards and the detail preference, stated once"""
+    facts = []
+    if session.questions_asked and session.cards_drawn:
+        spread = getattr(session, "spread", None)
+        if spread:
+            facts.append(f"Расклад: {spread['title']}, карты выложены по позициям")
+            positions = []
+            for card in session.cards:
+                orientation = "перевернутая" if card.get("reversed") else "прямая"
+                meaning = f" ({card['position_meaning']})" if card.get("position_meaning") else ""
+                positions.append(f"Позиция «{card['position']}»{meaning}: {card['name']}, {orientation}, тип: {card['type']}")
+            facts.append("Карты по позициям: " + "; ".join(positions))
+        else:
+            cards_info = []
+            for card in session.cards:
+                cards_info.append(f"Карта: {card['name']}, тип: {card['type']}")
+            facts.append("Выбранные карты: " + ", ".join([card["name"] for card in session.cards]))
+            facts.append("Подробная информация о картах: " + "; ".join(cards_info))
+    if session.reading_detail:
+        facts.append(f"Пользователь предпочитает {session.reading_detail} чтение карт")
+    return facts
+
+
+def _first_sentence(text: str, limit: int = CONTEXT_SUMMARY_TURN_CHARS) -> str:
+    text = " ".join(text.split())
+    sentence = _SENTENCE_END_RE.split(text, maxsplit=1)[0]
+    return sentence if len(sentence) <= limit else sentence[:limit].rstrip() + "…"
+
+
+def summarize_turns(summary: str, turns: List[Dict[str, Any]]) -> str:
+    """Extend a rolling summary with older turns, keeping the most recent lines within the size cap"""
+    lines = summary.splitlines() if summary else []
+    for turn in turns:
+        label = _ROLE_LABELS.get(turn["role"], turn["role"])
+        lines.append(f"{label}: {_first_sentence(turn['content'])}")
+    while lines and len("\n".join(lines)) > CONTEXT_SUMMARY_MAX_CHARS:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+def build_context(session, budget: int = CONTEXT_TOKEN_BUDGET, recent_turns: int = CONTEXT_RECENT_TURNS,
+                  summarizer: Callable[[str, List[Dict[str, Any]]], str] = summarize_turns) -> List[str]:
+    """Build a bounded prompt: system prompt, fixed facts, rolling summary and the last turns verbatim.
+
+    System messages in the history are not replayed; their facts come from the fixed
+    slot. Turns that fall out of the verbatim window are folded into
+    ``session.summary`` once, tracked by ``session.summary_upto``, so the prompt size
+    stays flat however long the conversation runs.
+    """
+    head = [TAROT_SYSTEM_PROMPT, *card_facts(session)]
+    remaining = budget - sum(estimate_tokens(text) for text in head) - CONTEXT_SUMMARY_MAX_CHARS // 3
+
+    turn_indexes = [i for i, m in enumerate(session.history) if m["role"] != "system"]
+    window = []
+    for i in reversed(turn_indexes[-recent_turns:] if recent_turns > 0 else []):
+        cost = estimate_tokens(session.history[i]["content"])
+        if window and cost > remaining:
+            break
+        window.insert(0, i)
+        remaining -= cost
+
+    window_start = window[0] if window else len(session.history)
+    if window_start > session.summary_upto:
+        older = [session.history[i] for i in turn_indexes if session.summary_upto <= i < window_start]
+        if older:
+            session.summary = summarizer(session.summary, older)
+        session.summary_upto = window_start
+
+    contents = list(head)
+    if session.summary:
+        contents.append("Краткое содержание предыдущего разговора:\n" + session.summary)
+    for i in window:
+        content = session.history[i]["content"]
+        if estimate_tokens(content) > budget:
+            content = content[-budget * 3:]
+        contents.append(content)
+    return contents
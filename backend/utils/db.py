@@ -1,9 +1,16 @@
+import asyncio
 import os
+import threading
+import time
+from contextlib import contextmanager
 from dotenv import load_dotenv
 import psycopg
-from psycopg.rows import dict_row  
+from psycopg.rows import dict_row
+from psycopg_pool import ConnectionPool, AsyncConnectionPool
 from typing import Dict, Any, Optional, List, Union
 
+from utils.metrics import timed_query
+
 load_dotenv()
 
 DB_HOST = os.environ["DB_HOST"]
@@ -12,79 +19,234 @@ DB_NAME = os.environ["DB_NAME"]
 DB_USER = os.environ["DB_USER"]
 DB_PASSWORD = os.environ["DB_PASSWORD"]
 
+DB_POOL_MIN_SIZE = int(os.environ.get("DB_POOL_MIN_SIZE", 2))
+DB_POOL_MAX_SIZE = int(os.environ.get("DB_POOL_MAX_SIZE", 10))
+DB_POOL_MAX_IDLE = float(os.environ.get("DB_POOL_MAX_IDLE", 300))
+DB_POOL_MAX_WAITING = int(os.environ.get("DB_POOL_MAX_WAITING", 50))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 10))
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+_checkout_stats = {"checkouts": 0, "checkout_ms_total": 0.0, "checkout_ms_max": 0.0}
+_checkout_stats_lock = threading.Lock()
+_async_pool: Optional[AsyncConnectionPool] = None
+_async_pool_lock = asyncio.Lock()
+
+
+# Connections forked from a parent process share its sockets, and the pool threads
+# do not survive the fork, so a child starts with no pools and opens its own.
+# The inherited pools are kept referenced: finalizing them would close sockets
+# that the parent still owns.
+_inherited_pools: List[Any] = []
+
+
+def _forget_pools_after_fork() -> None:
+    global _pool, _pool_lock, _async_pool, _async_pool_lock, _checkout_stats_lock
+    _inherited_pools.extend(pool for pool in (_pool, _async_pool) if pool is not None)
+    _pool = None
+    _async_pool = None
+    _pool_lock = threading.Lock()
+    _async_pool_lock = asyncio.Lock()
+    _checkout_stats_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_forget_pools_after_fork)
+
+
+def _connection_kwargs() -> Dict[str, Any]:
+    return {
+        "host": DB_HOST,
+        "port": DB_PORT,
+        "dbname": DB_NAME,
+        "user": DB_USER,
+        "password": DB_PASSWORD,
+        "row_factory": dict_row,
+        "autocommit": True
+    }
+
+
 def get_db_connection():
     """Create and return a new database connection"""
-    conn = psycopg.connect(
-        host=DB_HOST,
-        port=DB_PORT,
-        dbname=DB_NAME,
-        user=DB_USER,
-        password=DB_PASSWORD,
-        row_factory=dict_row 
-    )
-    conn.autocommit = True
-    return conn
+    return psycopg.connect(**_connection_kwargs())
+
+
+@contextmanager
+def advisory_lock(name: str):
+    """Hold a Postgres advisory lock on a dedicated connection, which is yielded for the locked work.
+
+    Workers that start together queue on the lock instead of running DDL concurrently.
+    Closing the connection releases the lock, even if the work failed.
+    """
+    with get_db_connection() as conn:
+        conn.execute("SELECT pg_advisory_lock(hashtext(%s))", (name,))
+        yield conn
+
+
+def get_pool() -> ConnectionPool:
+    """Return the process-wide connection pool, opening it on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                pool = ConnectionPool(
+                    kwargs=_connection_kwargs(),
+                    min_size=DB_POOL_MIN_SIZE,
+                    max_size=DB_POOL_MAX_SIZE,
+                    max_idle=DB_POOL_MAX_IDLE,
+                    max_waiting=DB_POOL_MAX_WAITING,
+                    timeout=DB_POOL_TIMEOUT,
+                    check=ConnectionPool.check_connection,
+                    name="tarot",
+                    open=False
+                )
+                pool.open()
+                _pool = pool
+    return _pool
+
+
+def close_pool() -> None:
+    """Close the connection pool, e.g. on shutdown; forked children drop theirs automatically"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+@contextmanager
+def pooled_connection():
+    """Borrow a connection from the pool and return it when done"""
+    started = time.perf_counter()
+    with get_pool().connection() as conn:
+        waited_ms = (time.perf_counter() - started) * 1000
+        with _checkout_stats_lock:
+            _checkout_stats["checkouts"] += 1
+            _checkout_stats["checkout_ms_total"] += waited_ms
+            _checkout_stats["checkout_ms_max"] = max(_checkout_stats["checkout_ms_max"], waited_ms)
+        yield conn
+
+
+def get_pool_stats() -> Dict[str, Any]:
+    """Return connection pool statistics"""
+    if _pool is None:
+        return {"open": False}
+    stats = _pool.get_stats()
+    with _checkout_stats_lock:
+        checkouts = _checkout_stats["checkouts"]
+        total_ms = _checkout_stats["checkout_ms_total"]
+        max_ms = _checkout_stats["checkout_ms_max"]
+    pool_size = stats.get("pool_size", 0)
+    available = stats.get("pool_available", 0)
+    return {
+        "open": True,
+        "min_size": _pool.min_size,
+        "max_size": _pool.max_size,
+        "pool_size": pool_size,
+        "in_use": pool_size - available,
+        "available": available,
+        "waiting": stats.get("requests_waiting", 0),
+        "requests_queued": stats.get("requests_queued", 0),
+        "requests_errors": stats.get("requests_errors", 0),
+        "connections_lost": stats.get("connections_lost", 0),
+        "checkouts": checkouts,
+        "checkout_ms_avg": round(total_ms / checkouts, 3) if checkouts else 0.0,
+        "checkout_ms_max": round(max_ms, 3)
+    }
 
 
 def execute_query(query, params=None):
     """Execute a query and return all results"""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    try:
-        cur.execute(query, params)
-        if cur.description:
-            return cur.fetchall()
-        return []
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        cur.close()
-        conn.close()
+    with timed_query("execute_query", query), pooled_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(query, params)
+            if cur.description:
+                return cur.fetchall()
+            return []
 
 
 def execute_query_single(query, params=None):
     """Execute a query and return the first row of results"""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    try:
-        cur.execute(query, params)
-        if cur.description:
-            result = cur.fetchone()
-            if result:
-                return result
-            raise Exception("The last operation didn't produce a result")
-        return None
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        cur.close()
-        conn.close()
+    with timed_query("execute_query_single", query), pooled_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(query, params)
+            if cur.description:
+                result = cur.fetchone()
+                if result:
+                    return result
+                raise Exception("The last operation didn't produce a result")
+            return None
 
 
 def execute_insert(query, params=None):
     """Execute an insert query and return the inserted ID"""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    try:
-        cur.execute(query, params)
-        id_result = cur.fetchone()
-        if id_result and 'id' in id_result:
-            return id_result['id']
-        return None
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        cur.close()
-        conn.close()
+    with timed_query("execute_insert", query), pooled_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(query, params)
+            id_result = cur.fetchone()
+            if id_result and 'id' in id_result:
+                return id_result['id']
+            return None
 
 
 def execute_update(query: str, params: Dict[str, Any]) -> int:
     """Execute an update query and return the number of affected rows"""
-    with get_db_connection() as conn:
+    with timed_query("execute_update", query), pooled_connection() as conn:
         with conn.cursor() as cur:
             cur.execute(query, params)
-            conn.commit()
             return cur.rowcount
+
+
+async def get_async_pool() -> AsyncConnectionPool:
+    """Return the event loop's connection pool for the async request path, opening it on first use"""
+    global _async_pool
+    if _async_pool is None:
+        async with _async_pool_lock:
+            if _async_pool is None:
+                pool = AsyncConnectionPool(
+                    kwargs=_connection_kwargs(),
+                    min_size=DB_POOL_MIN_SIZE,
+                    max_size=DB_POOL_MAX_SIZE,
+                    max_idle=DB_POOL_MAX_IDLE,
+                    max_waiting=DB_POOL_MAX_WAITING,
+                    timeout=DB_POOL_TIMEOUT,
+                    check=AsyncConnectionPool.check_connection,
+                    name="tarot-async",
+                    open=False
+                )
+                await pool.open()
+                _async_pool = pool
+    return _async_pool
+
+
+async def close_async_pool() -> None:
+    """Close the async connection pool on application shutdown"""
+    global _async_pool
+    async with _async_pool_lock:
+        if _async_pool is not None:
+            await _async_pool.close()
+            _async_pool = None
+
+
+async def execute_query_async(query, params=None):
+    """Async variant of execute_query"""
+    with timed_query("execute_query_async", query):
+        pool = await get_async_pool()
+        async with pool.connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(query, params)
+                if cur.description:
+                    return await cur.fetchall()
+                return []
+
+
+async def execute_insert_async(query, params=None):
+    """Async variant of execute_insert"""
+    with timed_query("execute_insert_async", query):
+        pool = await get_async_pool()
+        async with pool.connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(query, params)
+                id_result = await cur.fetchone()
+                if id_result and 'id' in id_result:
+                    return id_result['id']
+                return None
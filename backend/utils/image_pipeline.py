@@ -0,0 +1,185 @@
+"""Responsive, content-hashed card image variants.
+
+Usage: python -m utils.image_pipeline [--force] [--workers N]
+"""
+import argparse
+import fcntl
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+from PIL import Image, features
+
+from utils.card_recognition import TAROT_CARDS_DATA
+
+PIPELINE_VERSION = 1
+VARIANT_WIDTHS = {"thumb": 120, "medium": 240, "full": None}
+VARIANT_QUALITY = {"webp": 80, "avif": 55}
+IMAGE_VARIANTS_WORKERS = int(os.environ.get("IMAGE_VARIANTS_WORKERS", os.cpu_count() or 1))
+MANIFEST_NAME = "manifest.json"
+BUILD_LOCK_NAME = ".build.lock"
+
+
+@contextmanager
+def build_lock(out_dir: str):
+    """Serialize builds into one output directory across processes.
+
+    Workers that start together take turns: the first one builds, the others find
+    an up-to-date manifest and neither rebuild nor delete its files.
+    """
+    Path(out_dir).mkdir(parents=True, exist_ok=True)
+    with open(Path(out_dir) / BUILD_LOCK_NAME, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+
+
+def _avif_supported() -> bool:
+    try:
+        return features.check_module("avif")
+    except ValueError:
+        return False
+
+
+def variant_formats() -> List[str]:
+    return ["webp", "avif"] if _avif_supported() else ["webp"]
+
+
+def _file_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _build_image_variants(source_path: str, out_dir: str, formats: List[str]) -> Dict[str, Any]:
+    """Render every size/format variant of one source image; runs in a worker process"""
+    with open(source_path, "rb") as f:
+        source = f.read()
+    image = Image.open(io.BytesIO(source))
+    image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+    stem = Path(source_path).stem
+
+    variants: Dict[str, Dict[str, Any]] = {}
+    for size, width in VARIANT_WIDTHS.items():
+        if width and image.width > width:
+            resized = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+        else:
+            resized = image
+        for fmt in formats:
+            options = {"quality": VARIANT_QUALITY[fmt]}
+            if fmt == "webp":
+                options["method"] = 6
+            buffer = io.BytesIO()
+            resized.save(buffer, format=fmt.upper(), **options)
+            data = buffer.getvalue()
+            filename = f"{stem}.{size}.{_file_hash(data)[:12]}.{fmt}"
+            out_path = Path(out_dir) / filename
+            if not out_path.exists():
+                tmp_path = out_path.with_suffix(f".{os.getpid()}.tmp")
+                tmp_path.write_bytes(data)
+                os.replace(tmp_path, out_path)
+            variants.setdefault(size, {})[fmt] = {
+                "file": filename,
+                "width": resized.width,
+                "height": resized.height,
+                "bytes": len(data)
+            }
+    return {"source_hash": _file_hash(source), "variants": variants}
+
+
+def load_manifest(out_dir: str) -> Dict[str, Any]:
+    try:
+        with open(Path(out_dir) / MANIFEST_NAME, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {"version": PIPELINE_VERSION, "formats": [], "images": {}}
+
+
+def manifest_files(manifest: Dict[str, Any]) -> set:
+    """All variant file names referenced by a manifest"""
+    return {
+        entry["file"]
+        for image in manifest.get("images", {}).values()
+        for formats in image["variants"].values()
+        for entry in formats.values()
+    }
+
+
+def build_variants(images_dir: str, out_dir: str, workers: int = IMAGE_VARIANTS_WORKERS,
+                   force: bool = False, cards: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """Build missing or outdated variants for every card image and write the manifest"""
+    with build_lock(out_dir):
+        return _build_variants(images_dir, out_dir, workers, force, cards)
+
+
+def _build_variants(images_dir: str, out_dir: str, workers: int, force: bool,
+                    cards: Optional[List[Dict[str, Any]]]) -> Dict[str, Any]:
+    cards = cards if cards is not None else TAROT_CARDS_DATA
+    formats = variant_formats()
+    previous = load_manifest(out_dir)
+    reusable = not force and previous.get("version") == PIPELINE_VERSION and previous.get("formats") == formats
+    existing = set(os.listdir(out_dir))
+
+    images: Dict[str, Any] = {}
+    pending: Dict[str, str] = {}
+    for card in cards:
+        source_path = Path(images_dir) / card["image"]
+        if not source_path.exists():
+            print(f"ВНИМАНИЕ: Не найдено изображение для карты {card['name']}: {source_path}")
+            continue
+        entry = previous.get("images", {}).get(card["image"]) if reusable else None
+        if entry and entry["source_hash"] == _file_hash(source_path.read_bytes()) \
+                and manifest_files({"images": {card["image"]: entry}}) <= existing:
+            images[card["image"]] = entry
+        else:
+            pending[card["image"]] = str(source_path)
+
+    if pending:
+        # Forking a threaded server process can deadlock the children; start clean ones instead
+        with ProcessPoolExecutor(max_workers=max(1, workers),
+                                 mp_context=multiprocessing.get_context("forkserver")) as pool:
+            futures = {
+                image: pool.submit(_build_image_variants, source_path, out_dir, formats)
+                for image, source_path in pending.items()
+            }
+            for image, future in futures.items():
+                images[image] = future.result()
+
+    manifest = {"version": PIPELINE_VERSION, "formats": formats, "images": images}
+    tmp_path = Path(out_dir) / f"{MANIFEST_NAME}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, Path(out_dir) / MANIFEST_NAME)
+
+    referenced = manifest_files(manifest)
+    for filename in existing - referenced - {MANIFEST_NAME, BUILD_LOCK_NAME}:
+        if not filename.endswith(".tmp"):
+            (Path(out_dir) / filename).unlink(missing_ok=True)
+
+    print(f"Варианты изображений: пересобрано {len(pending)}, без изменений {len(images) - len(pending)}")
+    return manifest
+
+
+def variant_urls(manifest: Dict[str, Any], image: str, url_prefix: str) -> Optional[Dict[str, Dict[str, str]]]:
+    """Map size -> format -> URL for one card image, or None when it has no variants"""
+    entry = manifest.get("images", {}).get(image)
+    if not entry:
+        return None
+    return {
+        size: {fmt: f"{url_prefix}/{info['file']}" for fmt, info in formats.items()}
+        for size, formats in entry["variants"].items()
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build responsive tarot card image variants")
+    parser.add_argument("--images-dir", default=os.environ.get("CARDS_IMAGES_DIR", "./static/images/tarot"))
+    parser.add_argument("--out-dir", default=None)
+    parser.add_argument("--workers", type=int, default=IMAGE_VARIANTS_WORKERS)
+    parser.add_argument("--force", action="store_true")
+    args = parser.parse_args()
+    build_variants(args.images_dir, args.out_dir or os.path.join(args.images_dir, "variants"),
+                   args.workers, args.force)
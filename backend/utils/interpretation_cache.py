@@ -0,0 +1,251 @@
+import hashlib
+import json
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Any, Optional, List
+
+from utils.prompts import TAROT_SYSTEM_PROMPT
+
+INTERPRETATION_CACHE_SIZE = int(os.environ.get("INTERPRETATION_CACHE_SIZE", 1000))
+INTERPRETATION_CACHE_TTL = int(os.environ.get("INTERPRETATION_CACHE_TTL", 7 * 24 * 3600))
+INTERPRETATION_CACHE_BACKEND = os.environ.get("INTERPRETATION_CACHE_BACKEND", "sqlite")
+INTERPRETATION_CACHE_PATH = os.environ.get("INTERPRETATION_CACHE_PATH", "./data/interpretation_cache.db")
+INTERPRETATION_CACHE_MAX_ROWS = int(os.environ.get("INTERPRETATION_CACHE_MAX_ROWS", 100000))
+GREETING_POOL_SIZE = int(os.environ.get("GREETING_POOL_SIZE", 8))
+
+# Changing the system prompt changes every key, so stale interpretations are never served
+PROMPT_VERSION = hashlib.sha256(TAROT_SYSTEM_PROMPT.encode("utf-8")).hexdigest()[:12]
+
+_PUNCTUATION_RE = re.compile(r"[^\w\s]+", re.UNICODE)
+_WHITESPACE_RE = re.compile(r"\s+", re.UNICODE)
+
+
+def normalize_question(text: str) -> str:
+    """Lowercase, fold ё, drop punctuation and collapse whitespace"""
+    text = text.lower().replace("ё", "е")
+    text = _PUNCTUATION_RE.sub(" ", text)
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+def _key(parts: Dict[str, Any]) -> str:
+    canonical = json.dumps(parts, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def reading_cache_key(card_names: List[str], reading_detail: str, questions: List[str]) -> str:
+    """Cache key for a reading: cards in draw order, detail level, normalized questions and prompt version"""
+    return _key({
+        "kind": "reading",
+        "cards": list(card_names),
+        "detail": reading_detail,
+        "questions": [normalize_question(q) for q in questions],
+        "prompt": PROMPT_VERSION
+    })
+
+
+def greeting_cache_key(slot: Optional[int] = None) -> str:
+    """Cache key for one slot of the new-session greeting pool; a random slot when not given"""
+    if slot is None:
+        slot = random.randrange(GREETING_POOL_SIZE)
+    return _key({"kind": "greeting", "slot": slot, "prompt": PROMPT_VERSION})
+
+
+class SQLiteCacheTier:
+    """Persistent interpretation tier in a local SQLite file"""
+
+    def __init__(self, db_path: str, max_rows: int = INTERPRETATION_CACHE_MAX_ROWS):
+        self.db_path = db_path
+        self.max_rows = max_rows
+        self._local = threading.local()
+        self._schema_ready = False
+        self._puts = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        # Opened lazily per thread and process, so importing the app touches no files
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, isolation_level=None, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        if not self._schema_ready:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS interpretation_cache (
+                    key TEXT PRIMARY KEY,
+                    response TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_interpretation_cache_expires ON interpretation_cache (expires_at)"
+            )
+            self._schema_ready = True
+        return conn
+
+    def get(self, key: str) -> Optional[str]:
+        row = self._connection().execute(
+            "SELECT response FROM interpretation_cache WHERE key = ? AND expires_at >= ?",
+            (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def put(self, key: str, response: str, ttl: int) -> None:
+        conn = self._connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO interpretation_cache (key, response, expires_at) VALUES (?, ?, ?)",
+            (key, response, time.time() + ttl)
+        )
+        self._puts += 1
+        if self._puts % 100 == 0:
+            conn.execute("DELETE FROM interpretation_cache WHERE expires_at < ?", (time.time(),))
+            conn.execute("""
+                DELETE FROM interpretation_cache WHERE key IN (
+                    SELECT key FROM interpretation_cache ORDER BY expires_at DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.max_rows,))
+
+
+class PostgresCacheTier:
+    """Persistent interpretation tier shared by every node through Postgres"""
+
+    def __init__(self, max_rows: int = INTERPRETATION_CACHE_MAX_ROWS):
+        self.max_rows = max_rows
+        self._puts = 0
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+
+    def _ensure_schema(self) -> None:
+        """Create the table on first use, so building the tier never touches the database"""
+        if self._schema_ready:
+            return
+        from utils.db import execute_update
+        with self._schema_lock:
+            if self._schema_ready:
+                return
+            execute_update("""
+                CREATE TABLE IF NOT EXISTS interpretation_cache (
+                    key TEXT PRIMARY KEY,
+                    response TEXT NOT NULL,
+                    expires_at TIMESTAMP WITH TIME ZONE NOT NULL
+                )
+            """, {})
+            execute_update(
+                "CREATE INDEX IF NOT EXISTS idx_interpretation_cache_expires ON interpretation_cache (expires_at)", {}
+            )
+            self._schema_ready = True
+
+    def get(self, key: str) -> Optional[str]:
+        from utils.db import execute_query
+        self._ensure_schema()
+        rows = execute_query(
+            "SELECT response FROM interpretation_cache WHERE key = %(key)s AND expires_at >= now()",
+            {"key": key}
+        )
+        return rows[0]["response"] if rows else None
+
+    def put(self, key: str, response: str, ttl: int) -> None:
+        from utils.db import execute_update
+        self._ensure_schema()
+        execute_update(
+            """
+            INSERT INTO interpretation_cache (key, response, expires_at)
+            VALUES (%(key)s, %(response)s, now() + make_interval(secs => %(ttl)s))
+            ON CONFLICT (key) DO UPDATE SET response = EXCLUDED.response, expires_at = EXCLUDED.expires_at
+            """,
+            {"key": key, "response": response, "ttl": ttl}
+        )
+        self._puts += 1
+        if self._puts % 100 == 0:
+            execute_update("DELETE FROM interpretation_cache WHERE expires_at < now()", {})
+            execute_update("""
+                DELETE FROM interpretation_cache WHERE key IN (
+                    SELECT key FROM interpretation_cache ORDER BY expires_at DESC OFFSET %(max_rows)s
+                )
+            """, {"max_rows": self.max_rows})
+
+
+class InterpretationCache:
+    """Two-tier cache of AI interpretations: an in-memory LRU over an optional persistent tier"""
+
+    def __init__(self, persistent=None, max_entries: int = INTERPRETATION_CACHE_SIZE,
+                 ttl: int = INTERPRETATION_CACHE_TTL):
+        self.persistent = persistent
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {"memory_hits": 0, "persistent_hits": 0, "misses": 0, "evictions": 0, "errors": 0}
+
+    def _remember(self, key: str, response: str) -> None:
+        with self._lock:
+            self._entries[key] = (response, time.time() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.counters["evictions"] += 1
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] >= time.time():
+                    self._entries.move_to_end(key)
+                    self.counters["memory_hits"] += 1
+                    return entry[0]
+                del self._entries[key]
+        if self.persistent is not None:
+            try:
+                response = self.persistent.get(key)
+            except Exception as e:
+                print(f"Error reading interpretation cache: {e}")
+                response = None
+                self.counters["errors"] += 1
+            if response is not None:
+                self._remember(key, response)
+                with self._lock:
+                    self.counters["persistent_hits"] += 1
+                return response
+        with self._lock:
+            self.counters["misses"] += 1
+        return None
+
+    def put(self, key: str, response: str) -> None:
+        self._remember(key, response)
+        if self.persistent is not None:
+            try:
+                self.persistent.put(key, response, self.ttl)
+            except Exception as e:
+                print(f"Error writing interpretation cache: {e}")
+                self.counters["errors"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self.counters)
+            size = len(self._entries)
+        hits = counters["memory_hits"] + counters["persistent_hits"]
+        lookups = hits + counters["misses"]
+        return {
+            "backend": type(self.persistent).__name__ if self.persistent else None,
+            "prompt_version": PROMPT_VERSION,
+            "memory_size": size,
+            "memory_max_entries": self.max_entries,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            **counters
+        }
+
+
+def create_interpretation_cache() -> InterpretationCache:
+    """Build the interpretation cache configured through environment variables"""
+    if INTERPRETATION_CACHE_BACKEND == "postgres":
+        persistent = PostgresCacheTier()
+    elif INTERPRETATION_CACHE_BACKEND == "sqlite":
+        persistent = SQLiteCacheTier(INTERPRETATION_CACHE_PATH)
+    else:
+        persistent = None
+    return InterpretationCache(persistent)
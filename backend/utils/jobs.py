@@ -0,0 +1,311 @@
+import itertools
+import os
+import queue
+import threading
+import time
+import uuid
+from typing import Dict, Any, Optional, Callable
+
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 4))
+JOB_QUEUE_SIZE = int(os.environ.get("JOB_QUEUE_SIZE", 100))
+JOB_TIMEOUT = float(os.environ.get("JOB_TIMEOUT", 120))
+JOB_RESULT_TTL = float(os.environ.get("JOB_RESULT_TTL", 600))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+TIMED_OUT = "timed_out"
+FINISHED_STATES = (DONE, FAILED, CANCELLED, TIMED_OUT)
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted to a queue that is already at capacity"""
+
+
+class Job:
+    """A unit of background work identified by a handler name and a JSON-serializable payload"""
+
+    def __init__(self, kind: str, payload: Dict[str, Any], priority: int = 0, timeout: float = JOB_TIMEOUT,
+                 user_id: Optional[int] = None):
+        self.id = str(uuid.uuid4())
+        self.kind = kind
+        self.payload = payload
+        self.user_id = user_id
+        self.priority = priority
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.deadline = self.created_at + timeout
+        self._finished = threading.Event()
+
+    def remaining(self) -> float:
+        """Seconds left before the job deadline"""
+        return max(0.0, self.deadline - time.time())
+
+    def finish(self, status: str, result: Any = None, error: Optional[str] = None) -> None:
+        if self.status in FINISHED_STATES:
+            return
+        self.status = status
+        self.result = result
+        self.error = error
+        self.finished_at = time.time()
+        self._finished.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._finished.wait(timeout)
+
+    def visible_to(self, user_id: Optional[int]) -> bool:
+        """Jobs submitted by a signed-in user are only visible to that user"""
+        return self.user_id is None or self.user_id == user_id
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATES
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "user_id": self.user_id,
+            "status": self.status,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Job":
+        """A read-only copy of a job published by another process"""
+        job = cls(data["kind"], {}, user_id=data.get("user_id"))
+        job.id = data["job_id"]
+        job.status = data["status"]
+        job.result = data.get("result")
+        job.error = data.get("error")
+        job.created_at = data.get("created_at")
+        job.started_at = data.get("started_at")
+        job.finished_at = data.get("finished_at")
+        if job.finished:
+            job._finished.set()
+        return job
+
+
+class JobQueue:
+    """Interface for interpretation job queues; a broker-backed queue can implement the same methods"""
+
+    def register(self, kind: str, handler: Callable[[Job], Any]) -> None:
+        raise NotImplementedError
+
+    def submit(self, kind: str, payload: Dict[str, Any], priority: int = 0,
+               timeout: float = JOB_TIMEOUT, user_id: Optional[int] = None) -> Job:
+        raise NotImplementedError
+
+    def get(self, job_id: str) -> Optional[Job]:
+        raise NotImplementedError
+
+    def wait(self, job: Job, timeout: float) -> Job:
+        """Wait up to ``timeout`` seconds for a job to finish and return its latest state"""
+        raise NotImplementedError
+
+    def is_cancelled(self, job: Job) -> bool:
+        raise NotImplementedError
+
+    def cancel(self, job_id: str) -> bool:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        raise NotImplementedError
+
+
+class LocalJobQueue(JobQueue):
+    """In-process priority queue drained by a bounded pool of worker threads.
+
+    Lower priority values run first. Workers start lazily in each process, so the
+    queue is safe to create before a preforking server forks its workers.
+
+    Jobs run in the process that accepted them. With a ``store`` (a session store
+    in its own "jobs" namespace, shared by the workers) every state change is
+    published as a record keyed by the job id, so another worker can answer a poll or
+    record a cancellation that the owning worker picks up. Without one, job
+    requests must reach the worker that submitted the job (a single worker or
+    sticky routing).
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, max_size: int = JOB_QUEUE_SIZE,
+                 result_ttl: float = JOB_RESULT_TTL, store=None):
+        self.workers = workers
+        self.max_size = max_size
+        self.result_ttl = result_ttl
+        self.store = store
+        self._handlers: Dict[str, Callable[[Job], Any]] = {}
+        self._queue: "queue.PriorityQueue" = queue.PriorityQueue(maxsize=max_size)
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+        self._pid: Optional[int] = None
+        self._running = 0
+        self.counters = {"submitted": 0, "rejected": 0, DONE: 0, FAILED: 0, CANCELLED: 0, TIMED_OUT: 0}
+
+    def _publish(self, job: Job) -> None:
+        if self.store is None:
+            return
+        try:
+            self.store.put(job.id, {
+                **job.to_dict(), "ttl": int(self.result_ttl + max(0.0, job.deadline - job.created_at))
+            })
+        except Exception as e:
+            print(f"Error publishing job {job.id}: {e}")
+
+    def _load(self, job_id: str) -> Optional[Job]:
+        if self.store is None:
+            return None
+        try:
+            data = self.store.get(job_id)
+        except Exception as e:
+            print(f"Error loading job {job_id}: {e}")
+            return None
+        return Job.from_dict(data) if data and data.get("job_id") == job_id else None
+
+    def register(self, kind: str, handler: Callable[[Job], Any]) -> None:
+        self._handlers[kind] = handler
+
+    def _ensure_workers(self) -> None:
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.PriorityQueue(maxsize=self.max_size)
+            self._running = 0
+            for i in range(self.workers):
+                threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True).start()
+            self._pid = os.getpid()
+
+    def submit(self, kind: str, payload: Dict[str, Any], priority: int = 0,
+               timeout: float = JOB_TIMEOUT, user_id: Optional[int] = None) -> Job:
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        self._ensure_workers()
+        self._prune()
+        job = Job(kind, payload, priority, timeout, user_id)
+        try:
+            self._queue.put_nowait((priority, next(self._seq), job))
+        except queue.Full:
+            with self._lock:
+                self.counters["rejected"] += 1
+            raise QueueFullError("Job queue is full")
+        with self._lock:
+            self._jobs[job.id] = job
+            self.counters["submitted"] += 1
+        self._publish(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        return job if job is not None else self._load(job_id)
+
+    def _is_local(self, job: Job) -> bool:
+        with self._lock:
+            return self._jobs.get(job.id) is job
+
+    def wait(self, job: Job, timeout: float) -> Job:
+        if self._is_local(job):
+            job.wait(timeout)
+            return job
+        deadline = time.time() + timeout
+        while not job.finished and time.time() < deadline:
+            time.sleep(min(0.5, max(0.0, deadline - time.time())))
+            job = self._load(job.id) or job
+        return job
+
+    def is_cancelled(self, job: Job) -> bool:
+        """Whether the job was cancelled here or, through the store, by another worker"""
+        if job.status == CANCELLED:
+            return True
+        published = self._load(job.id)
+        return published is not None and published.status == CANCELLED
+
+    def cancel(self, job_id: str) -> bool:
+        job = self.get(job_id)
+        if job is None or job.finished:
+            return False
+        if not self._is_local(job):
+            # The owning worker sees the record through is_cancelled and stops there
+            job.finish(CANCELLED)
+            self._publish(job)
+            return True
+        self._finish(job, CANCELLED)
+        return True
+
+    def _finish(self, job: Job, status: str, result: Any = None, error: Optional[str] = None) -> None:
+        if job.status in FINISHED_STATES:
+            return
+        job.finish(status, result, error)
+        with self._lock:
+            self.counters[status] += 1
+        self._publish(job)
+
+    def _prune(self) -> None:
+        cutoff = time.time() - self.result_ttl
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job.finished_at is not None and job.finished_at < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+    def _work(self) -> None:
+        while True:
+            _, _, job = self._queue.get()
+            try:
+                if job.status != QUEUED:
+                    continue
+                if self.is_cancelled(job):
+                    self._finish(job, CANCELLED)
+                    continue
+                if job.remaining() <= 0:
+                    self._finish(job, TIMED_OUT, error="Job timed out in queue")
+                    continue
+                job.status = RUNNING
+                job.started_at = time.time()
+                self._publish(job)
+                with self._lock:
+                    self._running += 1
+                try:
+                    result = self._handlers[job.kind](job)
+                    if self.is_cancelled(job):
+                        self._finish(job, CANCELLED)
+                    elif job.remaining() <= 0:
+                        self._finish(job, TIMED_OUT, error="Job exceeded its deadline")
+                    else:
+                        self._finish(job, DONE, result=result)
+                except Exception as e:
+                    print(f"Error running job {job.id} ({job.kind}): {e}")
+                    self._finish(job, FAILED, error=str(e))
+                finally:
+                    with self._lock:
+                        self._running -= 1
+            finally:
+                self._queue.task_done()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queue_depth": self._queue.qsize(),
+                "queue_capacity": self.max_size,
+                "running": self._running,
+                "tracked_jobs": len(self._jobs),
+                **self.counters
+            }
+
+
+def job_priority(authenticated: bool, reading_detail: str = "detailed") -> int:
+    """Authenticated users go first; within a tier brief readings, being cheaper, run before detailed ones"""
+    return (0 if authenticated else 2) + (1 if reading_detail == "detailed" else 0)
@@ -0,0 +1,113 @@
+"""Buffered users.last_login writes.
+
+Logins record a timestamp in memory; a background thread writes every pending
+timestamp in one multi-row UPDATE each LAST_LOGIN_FLUSH_INTERVAL seconds, and
+whatever is left is flushed at interpreter exit. A crash loses at most one
+interval of last_login updates.
+"""
+import atexit
+import datetime
+import os
+import threading
+from typing import Dict, Any, Optional
+
+from utils.db import execute_update
+
+LAST_LOGIN_FLUSH_INTERVAL = float(os.environ.get("LAST_LOGIN_FLUSH_INTERVAL", 5))
+LAST_LOGIN_BATCH_SIZE = int(os.environ.get("LAST_LOGIN_BATCH_SIZE", 500))
+
+
+def last_login_update_sql(count: int) -> str:
+    values = ", ".join(f"(%(id{i})s::integer, %(at{i})s::timestamp)" for i in range(count))
+    return f"""
+        UPDATE users u
+        SET last_login = v.last_login
+        FROM (VALUES {values}) AS v(id, last_login)
+        WHERE u.id = v.id AND (u.last_login IS NULL OR u.last_login < v.last_login)
+    """
+
+
+class LastLoginBuffer:
+    """Latest login time per user, written to the database in batches by a background thread"""
+
+    def __init__(self, interval: float = LAST_LOGIN_FLUSH_INTERVAL, batch_size: int = LAST_LOGIN_BATCH_SIZE):
+        self.interval = interval
+        self.batch_size = batch_size
+        self._pending: Dict[int, datetime.datetime] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pid: Optional[int] = None
+        self._stop = threading.Event()
+        self.counters = {"recorded": 0, "written": 0, "flushes": 0, "errors": 0}
+
+    def record(self, user_id: int, at: Optional[datetime.datetime] = None) -> None:
+        if self.interval <= 0:
+            self._write({user_id: at or datetime.datetime.now()})
+            return
+        self.ensure_started()
+        with self._lock:
+            self._pending[user_id] = at or datetime.datetime.now()
+            self.counters["recorded"] += 1
+
+    def ensure_started(self) -> None:
+        """Start the writer thread in the current process if it is not running yet"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # A forked child must not flush its parent's buffer
+            self._pending = {}
+            self._stop = threading.Event()
+            threading.Thread(target=self._run, name="last-login-writer", daemon=True).start()
+            self._pid = os.getpid()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def flush(self) -> int:
+        """Write every pending timestamp and return how many users were updated"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+            try:
+                written = self._write(pending)
+            except Exception as e:
+                print(f"Error writing last_login for {len(pending)} users: {e}")
+                with self._lock:
+                    self.counters["errors"] += 1
+                    # Keep the batch for the next flush unless a newer login replaced it
+                    for user_id, at in pending.items():
+                        self._pending.setdefault(user_id, at)
+                return 0
+            with self._lock:
+                self.counters["flushes"] += 1
+                self.counters["written"] += written
+            return written
+
+    def _write(self, pending: Dict[int, datetime.datetime]) -> int:
+        # Sorted ids make every worker lock users rows in the same order
+        items = sorted(pending.items())
+        written = 0
+        for start in range(0, len(items), self.batch_size):
+            batch = items[start:start + self.batch_size]
+            params: Dict[str, Any] = {}
+            for i, (user_id, at) in enumerate(batch):
+                params[f"id{i}"] = user_id
+                params[f"at{i}"] = at
+            written += execute_update(last_login_update_sql(len(batch)), params)
+        return written
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"pending": len(self._pending), "interval": self.interval, **self.counters}
+
+
+last_login_buffer = LastLoginBuffer()
+atexit.register(last_login_buffer.flush)
@@ -0,0 +1,517 @@
+"""Model providers behind one interface, and a client that keeps a slow model from taking the site down.
+
+ResilientLLM adds, around any provider:
+
+- a per-process concurrency limit (LLM_MAX_CONCURRENCY), waited on only until the deadline
+- a deadline per call: the caller's timeout, or LLM_TIMEOUT, shared by every attempt
+- retries of transient errors with full-jitter exponential backoff
+- optional hedging: after LLM_HEDGE_AFTER seconds a duplicate request is sent if a slot
+  is free, and the first answer wins
+- a circuit breaker that opens after LLM_BREAKER_THRESHOLD transient failures in a row
+
+When the model cannot answer, LLMUnavailableError carries a short fallback message
+the routes can show instead of waiting for a timeout.
+"""
+import asyncio
+import concurrent.futures
+import os
+import random
+import threading
+import time
+from typing import Dict, Any, Iterator, List, Optional
+
+from dotenv import load_dotenv
+
+from utils.metrics import LLM_FALLBACKS, LLM_HEDGES, LLM_RETRIES, instrument_model, observe_llm_call
+
+load_dotenv()
+
+LLM_PROVIDER = os.environ.get("LLM_PROVIDER", "gemini")
+LLM_MODEL = os.environ.get("LLM_MODEL", "")
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", 16))
+LLM_TIMEOUT = float(os.environ.get("LLM_TIMEOUT", 60))
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", 2))
+LLM_RETRY_BASE_DELAY = float(os.environ.get("LLM_RETRY_BASE_DELAY", 0.5))
+LLM_RETRY_MAX_DELAY = float(os.environ.get("LLM_RETRY_MAX_DELAY", 8))
+LLM_HEDGE_AFTER = float(os.environ.get("LLM_HEDGE_AFTER", 0))
+LLM_BREAKER_THRESHOLD = int(os.environ.get("LLM_BREAKER_THRESHOLD", 5))
+LLM_BREAKER_COOLDOWN = float(os.environ.get("LLM_BREAKER_COOLDOWN", 30))
+LLM_FALLBACK_MESSAGE = os.environ.get(
+    "LLM_FALLBACK_MESSAGE",
+    "Карты сейчас молчат: сервис толкований временно перегружен. Пожалуйста, попробуйте чуть позже."
+)
+GOOGLE_API_KEY = os.environ.get("GOOGLE_API_KEY")
+OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
+
+DEFAULT_MODELS = {"gemini": "gemini-1.5-flash", "openai": "gpt-4o-mini"}
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+_TRANSIENT_ERRORS = (TimeoutError, ConnectionError, concurrent.futures.TimeoutError, asyncio.TimeoutError)
+
+
+class LLMUnavailableError(Exception):
+    """Raised when the model cannot answer in time; ``fallback`` is the message to show instead"""
+
+    def __init__(self, reason: str, fallback: str = LLM_FALLBACK_MESSAGE):
+        super().__init__(f"Model unavailable: {reason}")
+        self.reason = reason
+        self.fallback = fallback
+
+
+def is_fallback(text: str) -> bool:
+    """Whether an answer is the fallback message shown while the model is unavailable"""
+    return text == LLM_FALLBACK_MESSAGE
+
+
+class LLMProvider:
+    """Base interface for text generation backends. ``prompt`` is the list built by build_context."""
+
+    name = "base"
+
+    def generate(self, prompt: List[str], timeout: float) -> str:
+        raise NotImplementedError
+
+    def stream(self, prompt: List[str], timeout: float) -> Iterator[str]:
+        yield self.generate(prompt, timeout)
+
+    async def generate_async(self, prompt: List[str], timeout: float) -> str:
+        return await asyncio.to_thread(self.generate, prompt, timeout)
+
+    def is_retryable(self, error: Exception) -> bool:
+        """Whether an error is transient: worth a retry and counted by the circuit breaker"""
+        return isinstance(error, _TRANSIENT_ERRORS)
+
+    def warm_up(self) -> None:
+        """Load the client library ahead of the first request"""
+
+
+class GeminiProvider(LLMProvider):
+    """google.generativeai, or any object with the same generate_content calls.
+
+    The SDK is slow to import, so the default model is only built on first use.
+    """
+
+    name = "gemini"
+
+    def __init__(self, model=None, model_name: Optional[str] = None):
+        self.model_name = model_name or DEFAULT_MODELS["gemini"]
+        self._model = model
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    import google.generativeai as genai
+                    genai.configure(api_key=GOOGLE_API_KEY)
+                    self._model = instrument_model(genai.GenerativeModel(self.model_name))
+        return self._model
+
+    def warm_up(self) -> None:
+        self.model
+
+    def generate(self, prompt: List[str], timeout: float) -> str:
+        return self.model.generate_content(prompt, request_options={"timeout": timeout}).text
+
+    def stream(self, prompt: List[str], timeout: float) -> Iterator[str]:
+        for chunk in self.model.generate_content(prompt, stream=True, request_options={"timeout": timeout}):
+            if chunk.text:
+                yield chunk.text
+
+    async def generate_async(self, prompt: List[str], timeout: float) -> str:
+        response = await self.model.generate_content_async(prompt, request_options={"timeout": timeout})
+        return response.text
+
+    def is_retryable(self, error: Exception) -> bool:
+        from google.api_core import exceptions
+        return super().is_retryable(error) or isinstance(error, (
+            exceptions.TooManyRequests, exceptions.ResourceExhausted, exceptions.ServiceUnavailable,
+            exceptions.InternalServerError, exceptions.DeadlineExceeded, exceptions.GatewayTimeout
+        ))
+
+
+class OpenAIProvider(LLMProvider):
+    """OpenAI chat completions; the first prompt part becomes the system message"""
+
+    name = "openai"
+
+    def __init__(self, model_name: Optional[str] = None, api_key: Optional[str] = OPENAI_API_KEY):
+        import openai
+        # Retries are ours, so the SDK must not add its own on top
+        self.client = openai.OpenAI(api_key=api_key, max_retries=0)
+        self.async_client = openai.AsyncOpenAI(api_key=api_key, max_retries=0)
+        self.model_name = model_name or DEFAULT_MODELS["openai"]
+        self._transient = (openai.APITimeoutError, openai.APIConnectionError, openai.RateLimitError,
+                           openai.InternalServerError)
+
+    @staticmethod
+    def _messages(prompt: List[str]) -> List[Dict[str, str]]:
+        return [
+            {"role": "system", "content": prompt[0]},
+            {"role": "user", "content": "\n\n".join(prompt[1:])}
+        ]
+
+    def generate(self, prompt: List[str], timeout: float) -> str:
+        started = time.perf_counter()
+        try:
+            response = self.client.chat.completions.create(
+                model=self.model_name, messages=self._messages(prompt), timeout=timeout
+            )
+        except Exception:
+            observe_llm_call("generate", "error", time.perf_counter() - started, prompt)
+            raise
+        text = response.choices[0].message.content or ""
+        observe_llm_call("generate", "ok", time.perf_counter() - started, prompt, len(text))
+        return text
+
+    def stream(self, prompt: List[str], timeout: float) -> Iterator[str]:
+        started = time.perf_counter()
+        size = 0
+        outcome = "error"
+        try:
+            for chunk in self.client.chat.completions.create(
+                model=self.model_name, messages=self._messages(prompt), timeout=timeout, stream=True
+            ):
+                text = chunk.choices[0].delta.content if chunk.choices else None
+                if text:
+                    size += len(text)
+                    yield text
+            outcome = "ok"
+        except GeneratorExit:
+            outcome = "cancelled"
+            raise
+        finally:
+            observe_llm_call("stream", outcome, time.perf_counter() - started, prompt, size)
+
+    async def generate_async(self, prompt: List[str], timeout: float) -> str:
+        started = time.perf_counter()
+        try:
+            response = await self.async_client.chat.completions.create(
+                model=self.model_name, messages=self._messages(prompt), timeout=timeout
+            )
+        except Exception:
+            observe_llm_call("async", "error", time.perf_counter() - started, prompt)
+            raise
+        text = response.choices[0].message.content or ""
+        observe_llm_call("async", "ok", time.perf_counter() - started, prompt, len(text))
+        return text
+
+    def is_retryable(self, error: Exception) -> bool:
+        return super().is_retryable(error) or isinstance(error, self._transient)
+
+
+class StubProvider(LLMProvider):
+    """Canned answers for local development without an API key"""
+
+    name = "stub"
+
+    def generate(self, prompt: List[str], timeout: float) -> str:
+        last = prompt[-1] if prompt else ""
+        return f"Карты советуют не торопиться. (Тестовый ответ на: {last[:80]})"
+
+
+def create_provider(name: str = LLM_PROVIDER, model_name: str = LLM_MODEL) -> LLMProvider:
+    """Build the provider selected by LLM_PROVIDER: gemini, openai or stub"""
+    if name == "openai":
+        return OpenAIProvider(model_name or None)
+    if name == "stub":
+        return StubProvider()
+    if name != "gemini":
+        print(f"Неизвестный LLM_PROVIDER '{name}', используется gemini")
+    return GeminiProvider(model_name=model_name or None)
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker: open after ``threshold`` failures, one probe call after ``cooldown``"""
+
+    def __init__(self, threshold: int = LLM_BREAKER_THRESHOLD, cooldown: float = LLM_BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def is_open(self) -> bool:
+        """Cheap check for callers that should fail fast without claiming the probe call"""
+        return self.state == OPEN and time.monotonic() - self.opened_at < self.cooldown
+
+    def allow(self) -> bool:
+        if self.threshold <= 0:
+            return True
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self._probe_in_flight = False
+
+    def release(self) -> None:
+        """Give back a probe call that ended without an outcome, e.g. cancelled by its caller"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.threshold):
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                self.times_opened += 1
+            self._probe_in_flight = False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"state": self.state, "failures": self.failures, "times_opened": self.times_opened}
+
+
+class ResilientLLM:
+    """Wraps a provider with a concurrency limit, deadlines, retries, hedging and a circuit breaker"""
+
+    def __init__(self, provider: LLMProvider, max_concurrency: int = LLM_MAX_CONCURRENCY,
+                 timeout: float = LLM_TIMEOUT, max_retries: int = LLM_MAX_RETRIES,
+                 hedge_after: float = LLM_HEDGE_AFTER, breaker: Optional[CircuitBreaker] = None):
+        self.provider = provider
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.hedge_after = hedge_after
+        self.breaker = breaker or CircuitBreaker()
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._async_slots = None
+        self._async_loop = None
+
+    def _deadline(self, timeout: Optional[float]) -> float:
+        return time.monotonic() + (self.timeout if timeout is None else timeout)
+
+    def _unavailable(self, reason: str) -> LLMUnavailableError:
+        LLM_FALLBACKS.inc(provider=self.provider.name, reason=reason)
+        return LLMUnavailableError(reason)
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter keeps workers that failed together from retrying together
+        return random.uniform(0, min(LLM_RETRY_MAX_DELAY, LLM_RETRY_BASE_DELAY * 2 ** attempt))
+
+    def _next_delay(self, error: Exception, attempt: int, deadline: float) -> float:
+        """Backoff before the next attempt; raises when the error or the deadline rules a retry out"""
+        if not self.provider.is_retryable(error):
+            # The model answered, so the service itself is up
+            self.breaker.record_success()
+            raise error
+        self.breaker.record_failure()
+        delay = self._backoff(attempt)
+        if attempt >= self.max_retries or time.monotonic() + delay >= deadline:
+            print(f"Модель не ответила после {attempt + 1} попыток: {type(error).__name__}: {error}")
+            raise self._unavailable("timeout" if isinstance(error, _TRANSIENT_ERRORS) else "error")
+        LLM_RETRIES.inc(provider=self.provider.name)
+        return delay
+
+    def _check_attempt(self, deadline: float) -> float:
+        """Time left for the next attempt. The deadline is checked first: allow() may claim
+        the half-open probe, and every claimed attempt must end in record_* or release()."""
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise self._unavailable("deadline")
+        if not self.breaker.allow():
+            raise self._unavailable("circuit_open")
+        return remaining
+
+    def generate(self, prompt: List[str], timeout: Optional[float] = None) -> str:
+        deadline = self._deadline(timeout)
+        if self.breaker.is_open():
+            raise self._unavailable("circuit_open")
+        if not self._slots.acquire(timeout=max(0.0, deadline - time.monotonic())):
+            raise self._unavailable("busy")
+        try:
+            attempt = 0
+            while True:
+                remaining = self._check_attempt(deadline)
+                try:
+                    text = self._attempt(prompt, remaining)
+                except Exception as e:
+                    time.sleep(self._next_delay(e, attempt, deadline))
+                    attempt += 1
+                    continue
+                except BaseException:
+                    self.breaker.release()
+                    raise
+                self.breaker.record_success()
+                return text
+        finally:
+            self._slots.release()
+
+    def _attempt(self, prompt: List[str], remaining: float) -> str:
+        if self.hedge_after <= 0 or remaining <= self.hedge_after:
+            return self.provider.generate(prompt, remaining)
+        executor = self._hedge_executor()
+        started = time.monotonic()
+        primary = executor.submit(self.provider.generate, prompt, remaining)
+        done, _ = concurrent.futures.wait([primary], timeout=self.hedge_after)
+        # Only hedge with spare capacity, so a slow model is not hit with twice the load
+        if done or not self._slots.acquire(blocking=False):
+            return primary.result(timeout=max(0.0, remaining - (time.monotonic() - started)))
+        LLM_HEDGES.inc(provider=self.provider.name)
+        hedge = executor.submit(self.provider.generate, prompt, remaining - self.hedge_after)
+        hedge.add_done_callback(lambda _: self._slots.release())
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            left = remaining - (time.monotonic() - started)
+            done, pending = concurrent.futures.wait(
+                pending, timeout=max(0.0, left), return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            if not done:
+                raise concurrent.futures.TimeoutError()
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def _hedge_executor(self) -> concurrent.futures.ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.max_concurrency * 2, thread_name_prefix="llm-hedge"
+                )
+            return self._executor
+
+    def stream(self, prompt: List[str], timeout: Optional[float] = None) -> Iterator[str]:
+        """Yield the answer in chunks; only failures before the first chunk are retried"""
+        deadline = self._deadline(timeout)
+        if self.breaker.is_open():
+            raise self._unavailable("circuit_open")
+        if not self._slots.acquire(timeout=max(0.0, deadline - time.monotonic())):
+            raise self._unavailable("busy")
+        try:
+            attempt = 0
+            while True:
+                remaining = self._check_attempt(deadline)
+                try:
+                    chunks = self.provider.stream(prompt, remaining)
+                    first = next(chunks, None)
+                except Exception as e:
+                    time.sleep(self._next_delay(e, attempt, deadline))
+                    attempt += 1
+                    continue
+                except BaseException:
+                    self.breaker.release()
+                    raise
+                self.breaker.record_success()
+                if first is None:
+                    return
+                try:
+                    yield first
+                    yield from chunks
+                except Exception as e:
+                    if self.provider.is_retryable(e):
+                        self.breaker.record_failure()
+                    raise
+                finally:
+                    chunks.close()
+                return
+        finally:
+            self._slots.release()
+
+    def _async_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._async_loop is not loop:
+            self._async_slots = asyncio.Semaphore(self.max_concurrency)
+            self._async_loop = loop
+        return self._async_slots
+
+    async def generate_async(self, prompt: List[str], timeout: Optional[float] = None) -> str:
+        deadline = self._deadline(timeout)
+        if self.breaker.is_open():
+            raise self._unavailable("circuit_open")
+        slots = self._async_semaphore()
+        try:
+            await asyncio.wait_for(slots.acquire(), timeout=max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            raise self._unavailable("busy")
+        try:
+            attempt = 0
+            while True:
+                remaining = self._check_attempt(deadline)
+                try:
+                    text = await self._attempt_async(prompt, remaining, slots)
+                except Exception as e:
+                    await asyncio.sleep(self._next_delay(e, attempt, deadline))
+                    attempt += 1
+                    continue
+                except BaseException:
+                    # CancelledError, e.g. the ASGI client went away mid-call
+                    self.breaker.release()
+                    raise
+                self.breaker.record_success()
+                return text
+        finally:
+            slots.release()
+
+    async def _attempt_async(self, prompt: List[str], remaining: float, slots: asyncio.Semaphore) -> str:
+        started = time.monotonic()
+        tasks = {asyncio.ensure_future(self.provider.generate_async(prompt, remaining))}
+        hedged = False
+        try:
+            if 0 < self.hedge_after < remaining:
+                done, _ = await asyncio.wait(tasks, timeout=self.hedge_after)
+                if not done and not slots.locked():
+                    await slots.acquire()
+                    hedged = True
+                    LLM_HEDGES.inc(provider=self.provider.name)
+                    tasks.add(asyncio.ensure_future(
+                        self.provider.generate_async(prompt, remaining - self.hedge_after)
+                    ))
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(
+                    tasks, timeout=max(0.0, remaining - (time.monotonic() - started)),
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    raise asyncio.TimeoutError()
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+            if hedged:
+                slots.release()
+
+    def warm_up(self) -> None:
+        self.provider.warm_up()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "provider": self.provider.name,
+            "max_concurrency": self.max_concurrency,
+            "timeout": self.timeout,
+            "max_retries": self.max_retries,
+            "hedge_after": self.hedge_after,
+            "breaker": self.breaker.stats()
+        }
+
+
+def create_llm(provider: Optional[LLMProvider] = None) -> ResilientLLM:
+    return ResilientLLM(provider or create_provider())
@@ -0,0 +1,265 @@
+"""In-process counters and latency histograms exported in the Prometheus text format.
+
+Set METRICS_ENABLED=0 to turn every timer into a no-op and hide /metrics.
+Each worker process keeps its own numbers.
+"""
+import bisect
+import functools
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, Iterator, List, Optional, Sequence, Tuple
+
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1").lower() not in ("0", "false", "no")
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (100, 300, 1000, 3000, 10000, 30000, 100000)
+
+_QUERY_VERB_RE = re.compile(r"^\s*(\w+)", re.IGNORECASE)
+_QUERY_TABLE_RE = re.compile(r"\b(?:from|into|update|table)\s+(?:if\s+(?:not\s+)?exists\s+)?([\w.]+)", re.IGNORECASE)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[Any], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        if not METRICS_ENABLED:
+            return
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        if not METRICS_ENABLED:
+            return
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # One slot per bucket, then +Inf, sum and count
+                series = self._series[key] = [0] * (len(self.buckets) + 3)
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((key, list(values)) for key, values in self._series.items())
+        for key, values in series:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), values):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {values[-2]}")
+            lines.append(f"{self.name}_count{labels} {values[-1]}")
+        return lines
+
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "tarot_http_request_duration_seconds", "Time to produce a response, by route", ("method", "route", "status")
+)
+HTTP_REQUESTS = Counter("tarot_http_requests_total", "HTTP responses, by route and status", ("method", "route", "status"))
+DB_QUERY_SECONDS = Histogram("tarot_db_query_duration_seconds", "Database helper latency, by query", ("helper", "query"))
+DB_QUERY_ERRORS = Counter("tarot_db_query_errors_total", "Database helper failures, by query", ("helper", "query"))
+SESSION_SECONDS = Histogram("tarot_session_operation_duration_seconds", "Session store load/save latency", ("op",))
+LLM_SECONDS = Histogram(
+    "tarot_llm_request_duration_seconds", "Model call latency until the full answer", ("call", "outcome")
+)
+LLM_PROMPT_CHARS = Histogram("tarot_llm_prompt_chars", "Prompt size sent to the model", ("call",), SIZE_BUCKETS)
+LLM_RESPONSE_CHARS = Histogram("tarot_llm_response_chars", "Answer size received from the model", ("call",), SIZE_BUCKETS)
+LLM_RETRIES = Counter("tarot_llm_retries_total", "Model calls retried after a transient error", ("provider",))
+LLM_HEDGES = Counter("tarot_llm_hedges_total", "Duplicate model calls sent to cut tail latency", ("provider",))
+LLM_FALLBACKS = Counter("tarot_llm_fallbacks_total", "Fallback answers served instead of the model", ("provider", "reason"))
+
+REGISTRY = [
+    HTTP_REQUEST_SECONDS, HTTP_REQUESTS, DB_QUERY_SECONDS, DB_QUERY_ERRORS, SESSION_SECONDS,
+    LLM_SECONDS, LLM_PROMPT_CHARS, LLM_RESPONSE_CHARS, LLM_RETRIES, LLM_HEDGES, LLM_FALLBACKS
+]
+
+
+def render_metrics() -> str:
+    """Every registered metric in the Prometheus text exposition format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+@functools.lru_cache(maxsize=512)
+def query_label(query: str) -> str:
+    """Short label for a SQL statement: its verb and first table, e.g. 'select tarot_readings'"""
+    verb = _QUERY_VERB_RE.match(query)
+    table = _QUERY_TABLE_RE.search(query)
+    label = verb.group(1).lower() if verb else "unknown"
+    return f"{label} {table.group(1).lower()}" if table else label
+
+
+@contextmanager
+def timed_query(helper: str, query: str) -> Iterator[None]:
+    if not METRICS_ENABLED:
+        yield
+        return
+    label = query_label(query)
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        DB_QUERY_ERRORS.inc(helper=helper, query=label)
+        raise
+    finally:
+        DB_QUERY_SECONDS.observe(time.perf_counter() - started, helper=helper, query=label)
+
+
+@contextmanager
+def timed_session(op: str) -> Iterator[None]:
+    if not METRICS_ENABLED:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        SESSION_SECONDS.observe(time.perf_counter() - started, op=op)
+
+
+def _prompt_chars(contents: Any) -> int:
+    if isinstance(contents, (list, tuple)):
+        return sum(len(part) if isinstance(part, str) else 0 for part in contents)
+    return len(contents) if isinstance(contents, str) else 0
+
+
+class InstrumentedModel:
+    """Wraps a generative model and records latency, outcome and sizes of every generate_content call"""
+
+    def __init__(self, model):
+        self.model = model
+
+    def __getattr__(self, name: str):
+        return getattr(self.model, name)
+
+    def generate_content(self, contents: Any, stream: bool = False, **kwargs):
+        call = "stream" if stream else "generate"
+        started = time.perf_counter()
+        LLM_PROMPT_CHARS.observe(_prompt_chars(contents), call=call)
+        try:
+            response = self.model.generate_content(contents, stream=stream, **kwargs) if stream \
+                else self.model.generate_content(contents, **kwargs)
+        except Exception:
+            LLM_SECONDS.observe(time.perf_counter() - started, call=call, outcome="error")
+            raise
+        if stream:
+            return self._stream(response, started)
+        LLM_SECONDS.observe(time.perf_counter() - started, call=call, outcome="ok")
+        LLM_RESPONSE_CHARS.observe(len(response.text or ""), call=call)
+        return response
+
+    def _stream(self, chunks, started: float):
+        size = 0
+        outcome = "error"
+        try:
+            for chunk in chunks:
+                size += len(chunk.text or "")
+                yield chunk
+            outcome = "ok"
+        except GeneratorExit:
+            outcome = "cancelled"
+            raise
+        finally:
+            LLM_SECONDS.observe(time.perf_counter() - started, call="stream", outcome=outcome)
+            LLM_RESPONSE_CHARS.observe(size, call="stream")
+
+    async def generate_content_async(self, contents: Any, **kwargs):
+        started = time.perf_counter()
+        LLM_PROMPT_CHARS.observe(_prompt_chars(contents), call="async")
+        try:
+            response = await self.model.generate_content_async(contents, **kwargs)
+        except Exception:
+            LLM_SECONDS.observe(time.perf_counter() - started, call="async", outcome="error")
+            raise
+        LLM_SECONDS.observe(time.perf_counter() - started, call="async", outcome="ok")
+        LLM_RESPONSE_CHARS.observe(len(response.text or ""), call="async")
+        return response
+
+
+def observe_llm_call(call: str, outcome: str, seconds: float, prompt: Any = None,
+                     response_chars: Optional[int] = None) -> None:
+    """Record a model call made by a client that is not wrapped in InstrumentedModel"""
+    LLM_SECONDS.observe(seconds, call=call, outcome=outcome)
+    if prompt is not None:
+        LLM_PROMPT_CHARS.observe(_prompt_chars(prompt), call=call)
+    if response_chars is not None:
+        LLM_RESPONSE_CHARS.observe(response_chars, call=call)
+
+
+def instrument_model(model):
+    """Return the model wrapped for metrics, or unchanged when metrics are disabled"""
+    return InstrumentedModel(model) if METRICS_ENABLED else model
+
+
+def observe_request(method: str, route: str, status: int, seconds: float) -> None:
+    HTTP_REQUEST_SECONDS.observe(seconds, method=method, route=route, status=status)
+    HTTP_REQUESTS.inc(method=method, route=route, status=status)
+
+
+def install_flask_metrics(app) -> None:
+    """Time every Flask request by its URL rule and serve /metrics"""
+    if not METRICS_ENABLED:
+        return
+    from flask import Response, g, request
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        started = g.pop("metrics_started", None)
+        if started is not None:
+            route = request.url_rule.rule if request.url_rule else "unmatched"
+            observe_request(request.method, route, response.status_code, time.perf_counter() - started)
+        return response
+
+    @app.route("/metrics", methods=["GET"])
+    def metrics():
+        return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,138 @@
+"""bcrypt on a small process pool, so password checks never hold a request thread's CPU.
+
+At most PASSWORD_HASH_WORKERS hashes run at once and PASSWORD_HASH_QUEUE more may
+wait; anything beyond that is rejected with PasswordHasherBusyError, which the
+routes answer with 503 instead of letting logins starve the reading endpoints.
+A hash that takes longer than PASSWORD_HASH_TIMEOUT is reported the same way.
+PASSWORD_HASH_WORKERS=0 hashes inline in the calling thread.
+
+Workers come from a forkserver (spawn where there is none): the app process
+runs request, job and pool threads, and forking it directly could copy a lock
+held by one of them. A pool broken by a killed worker is replaced on the next call.
+"""
+import concurrent.futures
+import multiprocessing
+import os
+import threading
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Any
+
+import bcrypt
+
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", 12))
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+PASSWORD_HASH_QUEUE = int(os.environ.get("PASSWORD_HASH_QUEUE", 32))
+PASSWORD_HASH_TIMEOUT = float(os.environ.get("PASSWORD_HASH_TIMEOUT", 10))
+
+
+class PasswordHasherBusyError(Exception):
+    """Raised when every hashing worker is busy and the wait queue is full, or a hash timed out"""
+
+
+def _hash(password: bytes, rounds: int) -> bytes:
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+
+def _check(password: bytes, hashed: bytes) -> bool:
+    return bcrypt.checkpw(password, hashed)
+
+
+def hash_rounds(hashed: str) -> int:
+    """The cost factor of a bcrypt hash, e.g. 12 for '$2b$12$...'"""
+    try:
+        return int(hashed.split("$")[2])
+    except (IndexError, ValueError):
+        return 0
+
+
+def needs_rehash(hashed: str, rounds: int = BCRYPT_ROUNDS) -> bool:
+    return hash_rounds(hashed) != rounds
+
+
+class PasswordHasher:
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, queue_size: int = PASSWORD_HASH_QUEUE,
+                 rounds: int = BCRYPT_ROUNDS, timeout: float = PASSWORD_HASH_TIMEOUT):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.rounds = rounds
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(workers + queue_size) if workers > 0 else None
+        self._executor = None
+        self._lock = threading.Lock()
+        self.counters = {"hashed": 0, "checked": 0, "rejected": 0, "timed_out": 0, "pool_restarts": 0}
+
+    def _pool(self) -> concurrent.futures.ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                if "forkserver" in multiprocessing.get_all_start_methods():
+                    context = multiprocessing.get_context("forkserver")
+                    # The server preloads bcrypt and this module, so new workers start quickly
+                    context.set_forkserver_preload([__name__])
+                else:
+                    context = multiprocessing.get_context("spawn")
+                self._executor = concurrent.futures.ProcessPoolExecutor(self.workers, mp_context=context)
+            return self._executor
+
+    def _replace_pool(self, executor: concurrent.futures.ProcessPoolExecutor) -> None:
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+                self.counters["pool_restarts"] += 1
+                print("Пул хеширования паролей сломан (рабочий процесс завершился), создается новый")
+        executor.shutdown(wait=False)
+
+    def _run(self, fn, *args):
+        if self._slots is None:
+            return fn(*args)
+        # A second attempt runs on a fresh pool when a worker died under the first one
+        for _ in range(2):
+            if not self._slots.acquire(blocking=False):
+                with self._lock:
+                    self.counters["rejected"] += 1
+                raise PasswordHasherBusyError("Password hashing queue is full")
+            executor = self._pool()
+            try:
+                future = executor.submit(fn, *args)
+            except BrokenProcessPool:
+                self._slots.release()
+                self._replace_pool(executor)
+                continue
+            except Exception:
+                self._slots.release()
+                raise
+            future.add_done_callback(lambda _: self._slots.release())
+            try:
+                return future.result(timeout=self.timeout)
+            except concurrent.futures.TimeoutError:
+                future.cancel()
+                with self._lock:
+                    self.counters["timed_out"] += 1
+                raise PasswordHasherBusyError("Password hashing timed out")
+            except BrokenProcessPool:
+                self._replace_pool(executor)
+        raise PasswordHasherBusyError("Password hashing pool is unavailable")
+
+    def hash(self, password: str) -> str:
+        hashed = self._run(_hash, password.encode('utf-8'), self.rounds)
+        with self._lock:
+            self.counters["hashed"] += 1
+        return hashed.decode('utf-8')
+
+    def check(self, password: str, hashed_password: str) -> bool:
+        result = self._run(_check, password.encode('utf-8'), hashed_password.encode('utf-8'))
+        with self._lock:
+            self.counters["checked"] += 1
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self.counters)
+        return {
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "rounds": self.rounds,
+            **counters
+        }
+
+
+password_hasher = PasswordHasher()
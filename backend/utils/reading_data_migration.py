@@ -0,0 +1,158 @@
+"""Online conversion of tarot_readings.reading_data to JSONB.
+
+Older databases keep reading_data as TEXT, or as JSONB string scalars that hold
+encoded JSON. Rows are converted in id-ordered batches with a pause between them,
+so the table stays readable and writable while the tool runs. The app reads the
+column as reading_data::jsonb, so it keeps working before, during and after the
+conversion; init_db only reports that the tool still has to be run.
+
+Usage: python -m utils.reading_data_migration [--batch-size N] [--pause SECONDS]
+"""
+import argparse
+import os
+import time
+from typing import Optional
+
+from utils.db import advisory_lock, execute_query, execute_query_single, execute_update, pooled_connection
+
+READING_MIGRATION_BATCH_SIZE = int(os.environ.get("READING_MIGRATION_BATCH_SIZE", 500))
+READING_MIGRATION_PAUSE = float(os.environ.get("READING_MIGRATION_PAUSE", 0.05))
+
+# Text that is not valid JSON is kept under "raw" instead of failing the batch
+TO_JSONB_FUNCTION = """
+    CREATE OR REPLACE FUNCTION reading_data_to_jsonb(value TEXT) RETURNS JSONB AS $$
+    BEGIN
+        RETURN value::jsonb;
+    EXCEPTION WHEN others THEN
+        RETURN jsonb_build_object('raw', value);
+    END;
+    $$ LANGUAGE plpgsql IMMUTABLE
+"""
+
+# Keeps the shadow column in step with writes made while the backfill runs
+SYNC_TRIGGER_FUNCTION = """
+    CREATE OR REPLACE FUNCTION reading_data_sync_jsonb() RETURNS trigger AS $$
+    BEGIN
+        NEW.reading_data_jsonb := reading_data_to_jsonb(NEW.reading_data);
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql
+"""
+
+
+def reading_data_type() -> Optional[str]:
+    """Return the SQL type of tarot_readings.reading_data, or None if the column is missing"""
+    rows = execute_query(
+        """
+        SELECT data_type FROM information_schema.columns
+        WHERE table_schema = current_schema()
+          AND table_name = 'tarot_readings' AND column_name = 'reading_data'
+        """,
+        {}
+    )
+    return rows[0]["data_type"] if rows else None
+
+
+def run_id_batches(statement: str, batch_size: int, pause: float) -> int:
+    """Apply an UPDATE bounded by %(start)s/%(end)s ids over the whole table in batches"""
+    bounds = execute_query_single(
+        "SELECT COALESCE(MIN(id), 0) AS low, COALESCE(MAX(id), 0) AS high FROM tarot_readings", {}
+    )
+    converted = 0
+    for start in range(bounds["low"], bounds["high"] + 1, batch_size):
+        converted += execute_update(statement, {"start": start, "end": start + batch_size - 1})
+        if pause:
+            time.sleep(pause)
+    return converted
+
+
+def create_index_concurrently(name: str, definition: str) -> None:
+    """Build an index on tarot_readings without blocking writes, replacing one left invalid by a failed build"""
+    invalid = execute_query("""
+        SELECT 1 FROM pg_index i
+        WHERE i.indexrelid = to_regclass(%(name)s) AND NOT i.indisvalid
+    """, {"name": name})
+    if invalid:
+        execute_update(f"DROP INDEX CONCURRENTLY IF EXISTS {name}", {})
+    execute_update(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON tarot_readings {definition}", {})
+
+
+def _convert_text_column(batch_size: int, pause: float) -> int:
+    """Backfill a shadow JSONB column, then swap it in under a short lock"""
+    execute_update("ALTER TABLE tarot_readings ADD COLUMN IF NOT EXISTS reading_data_jsonb JSONB", {})
+    execute_update(SYNC_TRIGGER_FUNCTION, {})
+    execute_update("DROP TRIGGER IF EXISTS tarot_readings_reading_data_sync ON tarot_readings", {})
+    execute_update("""
+        CREATE TRIGGER tarot_readings_reading_data_sync
+            BEFORE INSERT OR UPDATE OF reading_data ON tarot_readings
+            FOR EACH ROW EXECUTE FUNCTION reading_data_sync_jsonb()
+    """, {})
+    converted = run_id_batches(
+        """
+        UPDATE tarot_readings SET reading_data_jsonb = reading_data_to_jsonb(reading_data)
+        WHERE id BETWEEN %(start)s AND %(end)s
+          AND reading_data IS NOT NULL AND reading_data_jsonb IS NULL
+        """,
+        batch_size, pause
+    )
+    with pooled_connection() as conn:
+        with conn.transaction():
+            # Keep a starting worker from applying db_schema.sql mid-swap
+            conn.execute("SELECT pg_advisory_xact_lock(hashtext('tarot_schema'))")
+            conn.execute("LOCK TABLE tarot_readings IN SHARE ROW EXCLUSIVE MODE")
+            cur = conn.execute("""
+                UPDATE tarot_readings SET reading_data_jsonb = reading_data_to_jsonb(reading_data)
+                WHERE reading_data IS NOT NULL AND reading_data_jsonb IS NULL
+            """)
+            converted += cur.rowcount
+            conn.execute("DROP TRIGGER tarot_readings_reading_data_sync ON tarot_readings")
+            conn.execute("DROP FUNCTION reading_data_sync_jsonb()")
+            conn.execute("ALTER TABLE tarot_readings DROP COLUMN reading_data")
+            conn.execute("ALTER TABLE tarot_readings RENAME COLUMN reading_data_jsonb TO reading_data")
+    return converted
+
+
+def migrate_reading_data(batch_size: int = READING_MIGRATION_BATCH_SIZE,
+                         pause: float = READING_MIGRATION_PAUSE) -> int:
+    """Convert reading_data to JSONB objects and build its GIN index; returns the rows rewritten.
+
+    Runs under an advisory lock, so a second copy of the tool waits and then finds
+    the column already converted.
+    """
+    with advisory_lock("tarot_reading_data_migration"):
+        return _migrate_reading_data(batch_size, pause)
+
+
+def _migrate_reading_data(batch_size: int, pause: float) -> int:
+    column_type = reading_data_type()
+    if column_type is None:
+        print("Таблица tarot_readings не найдена, миграция не требуется")
+        return 0
+
+    execute_update(TO_JSONB_FUNCTION, {})
+    converted = 0
+    if column_type != "jsonb":
+        print(f"Преобразование reading_data из {column_type} в JSONB...")
+        converted += _convert_text_column(batch_size, pause)
+        print("Перезапустите приложение, чтобы создать поисковый триггер, "
+              "и выполните python -m utils.reading_search reindex")
+
+    converted += run_id_batches(
+        """
+        UPDATE tarot_readings SET reading_data = reading_data_to_jsonb(reading_data #>> '{}')
+        WHERE id BETWEEN %(start)s AND %(end)s AND jsonb_typeof(reading_data) = 'string'
+        """,
+        batch_size, pause
+    )
+    create_index_concurrently("idx_tarot_readings_data", "USING GIN (reading_data jsonb_path_ops)")
+    print(f"Миграция reading_data завершена: преобразовано строк {converted}")
+    return converted
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert tarot_readings.reading_data to indexed JSONB")
+    parser.add_argument("--batch-size", type=int, default=READING_MIGRATION_BATCH_SIZE)
+    parser.add_argument("--pause", type=float, default=READING_MIGRATION_PAUSE,
+                        help="seconds to sleep between batches")
+    args = parser.parse_args()
+    migrate_reading_data(args.batch_size, args.pause)
@@ -0,0 +1,215 @@
+"""Streaming NDJSON export and bulk import of readings and saved layouts.
+
+Each line is one JSON record: a header, then "reading" and "layout" rows. Exports
+read id-ordered keyset batches, each on a short pool checkout, so a slow download
+holds neither a connection nor a transaction. Imports insert in executemany
+batches inside one transaction. Memory stays flat whatever the size of the data.
+
+Usage:
+    python -m utils.reading_export export [--user-id ID] [--gzip] [--output FILE]
+    python -m utils.reading_export import FILE [--user-id ID]
+"""
+import argparse
+import datetime
+import gzip
+import io
+import json
+import os
+import sys
+import zlib
+from typing import Dict, Any, Iterator, Iterable, Optional, Callable, IO
+
+from psycopg.types.json import Jsonb
+
+from utils.db import execute_query, pooled_connection
+
+EXPORT_FORMAT_VERSION = 1
+EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", 1000))
+IMPORT_BATCH_SIZE = int(os.environ.get("IMPORT_BATCH_SIZE", 1000))
+
+READING_COLUMNS = ["user_id", "reading_name", "description", "reading_data", "is_saved", "created_at"]
+LAYOUT_COLUMNS = ["user_id", "name", "description", "cards", "created_at"]
+
+
+def _json_default(value: Any) -> str:
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _dump_line(record: Dict[str, Any]) -> bytes:
+    return (json.dumps(record, ensure_ascii=False, default=_json_default) + "\n").encode("utf-8")
+
+
+def iter_export_records(user_id: Optional[int] = None, batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[Dict[str, Any]]:
+    """Yield the header and every reading and layout, of one user or of all users"""
+    yield {
+        "type": "header",
+        "version": EXPORT_FORMAT_VERSION,
+        "exported_at": datetime.datetime.utcnow().isoformat(),
+        "user_id": user_id
+    }
+    owner = "AND user_id = %(user_id)s" if user_id is not None else ""
+    queries = [
+        ("reading", f"SELECT id, {', '.join(READING_COLUMNS)} FROM tarot_readings"),
+        ("layout", f"SELECT id, {', '.join(LAYOUT_COLUMNS)} FROM saved_layouts")
+    ]
+    for record_type, select in queries:
+        query = f"{select} WHERE id > %(after)s {owner} ORDER BY id LIMIT %(limit)s"
+        after = 0
+        while True:
+            rows = execute_query(query, {"user_id": user_id, "after": after, "limit": batch_size})
+            for row in rows:
+                yield {"type": record_type, **row}
+            if len(rows) < batch_size:
+                break
+            after = rows[-1]["id"]
+
+
+def export_ndjson(user_id: Optional[int] = None, compress: bool = False) -> Iterator[bytes]:
+    """Stream an export as NDJSON bytes, gzip-compressed on the fly when asked"""
+    records = iter_export_records(user_id)
+    if not compress:
+        for record in records:
+            yield _dump_line(record)
+        return
+
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for record in records:
+        chunk = compressor.compress(_dump_line(record))
+        if chunk:
+            yield chunk
+    yield compressor.flush()
+
+
+def open_ndjson(stream: IO[bytes]) -> Iterator[str]:
+    """Iterate the lines of an NDJSON byte stream, transparently un-gzipping it.
+
+    A truncated or corrupt gzip body raises ValueError like any other bad input.
+    """
+    buffered = io.BufferedReader(stream) if not hasattr(stream, "peek") else stream
+    if buffered.peek(2)[:2] == b"\x1f\x8b":
+        buffered = gzip.GzipFile(fileobj=buffered)
+    try:
+        yield from io.TextIOWrapper(buffered, encoding="utf-8")
+    except (gzip.BadGzipFile, EOFError, zlib.error) as e:
+        raise ValueError(f"поврежденный gzip ({e})") from e
+
+
+def _created_at(record: Dict[str, Any]) -> datetime.datetime:
+    value = record.get("created_at")
+    if not value:
+        return datetime.datetime.utcnow()
+    if not isinstance(value, str):
+        raise ValueError(f"некорректная дата created_at: {value!r}")
+    return datetime.datetime.fromisoformat(value)
+
+
+def _parse_records(lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Строка {number}: некорректный JSON ({e.msg})") from e
+        if not isinstance(record, dict) or record.get("type") not in ("header", "reading", "layout"):
+            raise ValueError(f"Строка {number}: неизвестный тип записи")
+        if record["type"] == "header" and record.get("version") != EXPORT_FORMAT_VERSION:
+            raise ValueError(f"Неподдерживаемая версия экспорта: {record.get('version')}")
+        if record["type"] == "reading" and not record.get("reading_name"):
+            raise ValueError(f"Строка {number}: у чтения нет названия")
+        if record["type"] == "layout" and (not record.get("name") or not isinstance(record.get("cards"), list)):
+            raise ValueError(f"Строка {number}: у расклада нет названия или карт")
+        yield record
+
+
+def _reading_row(record: Dict[str, Any], user_id: Optional[int]) -> tuple:
+    return (
+        user_id if user_id is not None else record.get("user_id"),
+        record["reading_name"],
+        record.get("description"),
+        Jsonb(record["reading_data"]) if record.get("reading_data") is not None else None,
+        bool(record.get("is_saved", True)),
+        _created_at(record)
+    )
+
+
+def _layout_row(record: Dict[str, Any], user_id: Optional[int]) -> tuple:
+    return (
+        user_id if user_id is not None else record.get("user_id"),
+        record["name"],
+        record.get("description"),
+        [str(card) for card in record["cards"]],
+        _created_at(record)
+    )
+
+
+def import_ndjson(lines: Iterable[str], user_id: Optional[int] = None, batch_size: int = IMPORT_BATCH_SIZE,
+                  on_progress: Optional[Callable[[Dict[str, int]], None]] = None) -> Dict[str, int]:
+    """Load exported records in one transaction; user_id reassigns every row to that user.
+
+    Rows are buffered per table and flushed with executemany every batch_size rows,
+    so memory is bounded by one batch. Any invalid record rolls the whole import back.
+    """
+    counts = {"readings": 0, "layouts": 0}
+    statements = {
+        "reading": f"INSERT INTO tarot_readings ({', '.join(READING_COLUMNS)}) VALUES (%s, %s, %s, %s, %s, %s)",
+        "layout": f"INSERT INTO saved_layouts ({', '.join(LAYOUT_COLUMNS)}) VALUES (%s, %s, %s, %s, %s)"
+    }
+    builders = {"reading": _reading_row, "layout": _layout_row}
+    counters = {"reading": "readings", "layout": "layouts"}
+    pending: Dict[str, list] = {"reading": [], "layout": []}
+
+    with pooled_connection() as conn:
+        with conn.transaction():
+            with conn.cursor() as cur:
+                def flush(record_type: str) -> None:
+                    cur.executemany(statements[record_type], pending[record_type])
+                    counts[counters[record_type]] += len(pending[record_type])
+                    pending[record_type].clear()
+                    if on_progress:
+                        on_progress(dict(counts))
+
+                for record in _parse_records(lines):
+                    record_type = record["type"]
+                    if record_type == "header":
+                        continue
+                    pending[record_type].append(builders[record_type](record, user_id))
+                    if len(pending[record_type]) >= batch_size:
+                        flush(record_type)
+                for record_type, rows in pending.items():
+                    if rows:
+                        flush(record_type)
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export or import tarot readings and saved layouts as NDJSON")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export", help="write readings and layouts as NDJSON")
+    export_parser.add_argument("--user-id", type=int, default=None, help="only this user (default: all users)")
+    export_parser.add_argument("--gzip", action="store_true")
+    export_parser.add_argument("--output", default="-", help="file path, or - for stdout")
+    import_parser = subparsers.add_parser("import", help="load an NDJSON export (gzip is detected)")
+    import_parser.add_argument("file")
+    import_parser.add_argument("--user-id", type=int, default=None, help="assign every row to this user")
+    import_parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        output = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+        try:
+            for chunk in export_ndjson(args.user_id, args.gzip):
+                output.write(chunk)
+        finally:
+            if output is not sys.stdout.buffer:
+                output.close()
+    else:
+        with open(args.file, "rb") as f:
+            result = import_ndjson(
+                open_ndjson(f), args.user_id, args.batch_size,
+                on_progress=lambda counts: print(f"Импортировано: чтений {counts['readings']}, "
+                                                 f"раскладов {counts['layouts']}", file=sys.stderr)
+            )
+        print(f"Импорт завершен: чтений {result['readings']}, раскладов {result['layouts']}")
@@ -0,0 +1,73 @@
+"""Russian full-text search over a user's reading history.
+
+search_vector is filled by a trigger defined in db_schema.sql. The reindex command
+fills it for rows saved before the trigger existed and builds the search index
+concurrently, which the app does not do at startup.
+
+Usage: python -m utils.reading_search reindex [--batch-size N] [--pause SECONDS]
+"""
+import argparse
+import html
+from typing import Optional
+
+import psycopg
+
+from utils.db import execute_query, execute_update
+from utils.reading_data_migration import (
+    READING_MIGRATION_BATCH_SIZE, READING_MIGRATION_PAUSE, create_index_concurrently, run_id_batches
+)
+
+SEARCH_QUERY_MAX_LENGTH = 200
+HIGHLIGHT_START = "<mark>"
+HIGHLIGHT_STOP = "</mark>"
+HEADLINE_OPTIONS = f"StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_STOP}, MaxFragments=2, MaxWords=25, MinWords=8"
+
+
+def highlight_html(snippet: Optional[str]) -> Optional[str]:
+    """Escape a ts_headline snippet for HTML while keeping its highlight tags"""
+    if snippet is None:
+        return None
+    escaped = html.escape(snippet, quote=False)
+    return escaped.replace(html.escape(HIGHLIGHT_START), HIGHLIGHT_START) \
+        .replace(html.escape(HIGHLIGHT_STOP), HIGHLIGHT_STOP)
+
+
+def reindex_readings(batch_size: int = READING_MIGRATION_BATCH_SIZE, pause: float = READING_MIGRATION_PAUSE,
+                     force: bool = False) -> int:
+    """Compute search_vector for readings that lack one (or all of them); returns the rows updated"""
+    updated = run_id_batches(
+        f"""
+        UPDATE tarot_readings
+        SET search_vector = reading_search_vector(reading_name, description, reading_data)
+        WHERE id BETWEEN %(start)s AND %(end)s {"" if force else "AND search_vector IS NULL"}
+        """,
+        batch_size, pause
+    )
+    print(f"Поисковый индекс обновлен: строк {updated}")
+    create_search_index()
+    return updated
+
+
+def create_search_index() -> None:
+    """Build idx_tarot_readings_search; without btree_gin the index covers search_vector alone"""
+    try:
+        # btree_gin lets one index serve both the owner filter and the text match
+        execute_update("CREATE EXTENSION IF NOT EXISTS btree_gin", {})
+    except psycopg.Error as e:
+        print(f"Расширение btree_gin недоступно: {e}")
+    if execute_query("SELECT 1 FROM pg_extension WHERE extname = 'btree_gin'", {}):
+        columns = "user_id, search_vector"
+    else:
+        columns = "search_vector"
+    create_index_concurrently("idx_tarot_readings_search", f"USING GIN ({columns})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tarot reading full-text search maintenance")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    reindex = subparsers.add_parser("reindex", help="fill search_vector for existing readings and index it")
+    reindex.add_argument("--batch-size", type=int, default=READING_MIGRATION_BATCH_SIZE)
+    reindex.add_argument("--pause", type=float, default=READING_MIGRATION_PAUSE)
+    reindex.add_argument("--force", action="store_true", help="recompute rows that are already indexed")
+    args = parser.parse_args()
+    reindex_readings(args.batch_size, args.pause, args.force)
@@ -0,0 +1,559 @@
+import fcntl
+import gzip
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Any, Optional, List, Tuple
+
+SESSION_TTL_SECONDS = int(os.environ.get("SESSION_TTL_SECONDS", 7 * 24 * 3600))
+SESSION_SWEEP_INTERVAL = int(os.environ.get("SESSION_SWEEP_INTERVAL", 600))
+SESSION_COMPACT_EVERY = int(os.environ.get("SESSION_COMPACT_EVERY", 64))
+
+SESSION_ID_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_-]{0,127}$")
+
+
+class InvalidSessionIdError(ValueError):
+    """Raised for a session id that could escape its namespace, e.g. one containing a path separator"""
+
+
+def check_session_id(session_id: Any) -> str:
+    session_id = str(session_id)
+    if not SESSION_ID_RE.match(session_id):
+        raise InvalidSessionIdError("Некорректный идентификатор сессии")
+    return session_id
+
+
+def _expires_at(data: Dict[str, Any], updated_at: float) -> float:
+    return updated_at + data.get("ttl", SESSION_TTL_SECONDS)
+
+
+def apply_records(data: Dict[str, Any], records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Return a copy of a session document with journal records applied"""
+    data = dict(data)
+    data["history"] = list(data.get("history", []))
+    data["user_responses"] = list(data.get("user_responses", []))
+    for record in records:
+        op = record.get("op")
+        if op == "message":
+            data["history"].append({"role": record["role"], "content": record["content"]})
+        elif op == "response":
+            data["user_responses"].append(record["content"])
+        elif op == "set":
+            data.update(record["fields"])
+        elif op == "snapshot":
+            data = apply_records(record["state"], [])
+    return data
+
+
+class SessionStore:
+    """Base interface for tarot session persistence backends"""
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def put(self, session_id: str, data: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def append(self, session_id: str, records: List[Dict[str, Any]]) -> None:
+        """Apply journal records to a stored session; backends may override with a cheaper write"""
+        self.put(session_id, apply_records(self.get(session_id) or {}, records))
+
+    def delete(self, session_id: str) -> None:
+        raise NotImplementedError
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Remove or archive expired sessions and return how many were swept"""
+        return 0
+
+    def prepare(self) -> None:
+        """Create the directory or table up front; every backend also does this lazily on first use"""
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": type(self).__name__}
+
+
+class FileSessionStore(SessionStore):
+    """Append-only JSONL journal per session in a local directory.
+
+    The first line of ``<session_id>.jsonl`` is a snapshot of the whole session and
+    every later line is one mutation record, so a flush costs a single ``write``
+    proportional to the new records only. After ``compact_every`` records the journal
+    is replayed and replaced by a fresh snapshot. A torn trailing line left by a crash
+    is dropped on the next read.
+    """
+
+    def __init__(self, session_dir: str, archive_dir: Optional[str] = None,
+                 compact_every: int = SESSION_COMPACT_EVERY):
+        self.session_dir = Path(session_dir)
+        self._dir_ready = False
+        self.archive_dir = Path(archive_dir) if archive_dir else None
+        self.compact_every = compact_every
+        self._tail_lengths: Dict[str, int] = {}
+        self.swept = 0
+        self.compactions = 0
+        self.recovered = 0
+
+    def prepare(self) -> None:
+        if not self._dir_ready:
+            self.session_dir.mkdir(parents=True, exist_ok=True)
+            self._dir_ready = True
+
+    def _path(self, session_id: str) -> Path:
+        return self.session_dir / f"{check_session_id(session_id)}.jsonl"
+
+    def _legacy_path(self, session_id: str) -> Path:
+        return self.session_dir / f"{check_session_id(session_id)}.json"
+
+    @staticmethod
+    def _encode(records: List[Dict[str, Any]]) -> bytes:
+        return "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records).encode("utf-8")
+
+    def _replay(self, fd: int) -> Tuple[Optional[Dict[str, Any]], int, int, int]:
+        """Replay a journal; return (state, records after snapshot, valid bytes, file size)"""
+        os.lseek(fd, 0, os.SEEK_SET)
+        chunks = []
+        while True:
+            chunk = os.read(fd, 1 << 20)
+            if not chunk:
+                break
+            chunks.append(chunk)
+        raw = b"".join(chunks)
+        state, tail, valid = None, 0, 0
+        for line in raw.splitlines(keepends=True):
+            if not line.endswith(b"\n"):
+                break
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                break
+            if record.get("op") == "snapshot":
+                state, tail = apply_records(record["state"], []), 0
+            elif state is not None:
+                state, tail = apply_records(state, [record]), tail + 1
+            valid += len(line)
+        return state, tail, valid, len(raw)
+
+    def _write_snapshot(self, session_id: str, data: Dict[str, Any]) -> None:
+        self.prepare()
+        path = self._path(session_id)
+        tmp_path = path.with_suffix(f".jsonl.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(self._encode([{"op": "snapshot", "state": data}]))
+        os.replace(tmp_path, path)
+        self._tail_lengths[session_id] = 0
+
+    def _migrate_legacy(self, session_id: str) -> Optional[Dict[str, Any]]:
+        legacy_path = self._legacy_path(session_id)
+        try:
+            with open(legacy_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        self._write_snapshot(session_id, data)
+        legacy_path.unlink(missing_ok=True)
+        return data
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        path = self._path(session_id)
+        try:
+            fd = os.open(path, os.O_RDWR)
+        except FileNotFoundError:
+            return self._migrate_legacy(session_id)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            state, tail, valid, size = self._replay(fd)
+            if valid < size:
+                os.ftruncate(fd, valid)
+                self.recovered += 1
+            mtime = os.fstat(fd).st_mtime
+        finally:
+            os.close(fd)
+        if state is None:
+            return None
+        self._tail_lengths[session_id] = tail
+        if tail >= self.compact_every:
+            self._compact(session_id)
+        if _expires_at(state, mtime) < time.time():
+            return None
+        return state
+
+    def put(self, session_id: str, data: Dict[str, Any]) -> None:
+        self._write_snapshot(session_id, data)
+
+    def append(self, session_id: str, records: List[Dict[str, Any]]) -> None:
+        if not records:
+            return
+        path = self._path(session_id)
+        if not path.exists():
+            super().append(session_id, records)
+            return
+        payload = self._encode(records)
+        while True:
+            fd = os.open(path, os.O_WRONLY | os.O_APPEND)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                # A concurrent compaction may have swapped in a new file while we waited
+                if os.fstat(fd).st_ino != os.stat(path).st_ino:
+                    continue
+                os.write(fd, payload)
+                break
+            finally:
+                os.close(fd)
+        tail = self._tail_lengths.get(session_id, 0) + len(records)
+        self._tail_lengths[session_id] = tail
+        if tail >= self.compact_every:
+            self._compact(session_id)
+
+    def _compact(self, session_id: str) -> None:
+        """Replace the journal with a single snapshot of its replayed state"""
+        path = self._path(session_id)
+        try:
+            fd = os.open(path, os.O_RDWR)
+        except FileNotFoundError:
+            return
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            state, _, _, _ = self._replay(fd)
+            if state is not None:
+                self._write_snapshot(session_id, state)
+                self.compactions += 1
+        finally:
+            os.close(fd)
+
+    def delete(self, session_id: str) -> None:
+        self._tail_lengths.pop(session_id, None)
+        self._path(session_id).unlink(missing_ok=True)
+        self._legacy_path(session_id).unlink(missing_ok=True)
+
+    def _archive(self, path: Path) -> None:
+        self.archive_dir.mkdir(parents=True, exist_ok=True)
+        with open(path, "rb") as src, gzip.open(self.archive_dir / f"{path.name}.gz", "wb") as dst:
+            dst.write(src.read())
+
+    @staticmethod
+    def _read_ttl(path: Path) -> int:
+        with open(path, "r", encoding="utf-8") as f:
+            if path.suffix == ".json":
+                data = json.load(f)
+            else:
+                data = json.loads(f.readline())["state"]
+        return data.get("ttl", SESSION_TTL_SECONDS)
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        now = now or time.time()
+        swept = 0
+        for path in [*self.session_dir.glob("*.jsonl"), *self.session_dir.glob("*.json")]:
+            try:
+                expires_at = path.stat().st_mtime + self._read_ttl(path)
+            except (OSError, ValueError, KeyError):
+                continue
+            if expires_at >= now:
+                continue
+            if self.archive_dir:
+                self._archive(path)
+            path.unlink(missing_ok=True)
+            self._tail_lengths.pop(path.stem, None)
+            swept += 1
+        self.swept += swept
+        return swept
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "file",
+            "swept": self.swept,
+            "compactions": self.compactions,
+            "recovered": self.recovered
+        }
+
+
+class SQLiteSessionStore(SessionStore):
+    """Sessions in a local SQLite database, shared by all workers on a node"""
+
+    def __init__(self, db_path: str, table: str = "tarot_sessions"):
+        self.db_path = db_path
+        self.table = table
+        self._local = threading.local()
+        self._schema_ready = False
+        self.swept = 0
+
+    def prepare(self) -> None:
+        self._connection()
+
+    def _connection(self) -> sqlite3.Connection:
+        # One connection per thread and process: a connection inherited across fork must not be used
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, isolation_level=None, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        if not self._schema_ready:
+            conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS {self.table} (
+                    session_id TEXT PRIMARY KEY,
+                    data TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{self.table}_expires ON {self.table} (expires_at)")
+            self._schema_ready = True
+        return conn
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connection().execute(
+            f"SELECT data FROM {self.table} WHERE session_id = ? AND expires_at >= ?",
+            (session_id, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, session_id: str, data: Dict[str, Any]) -> None:
+        self._connection().execute(
+            f"""
+            INSERT INTO {self.table} (session_id, data, expires_at) VALUES (?, ?, ?)
+            ON CONFLICT (session_id) DO UPDATE SET data = excluded.data, expires_at = excluded.expires_at
+            """,
+            (session_id, json.dumps(data, ensure_ascii=False), _expires_at(data, time.time()))
+        )
+
+    def delete(self, session_id: str) -> None:
+        self._connection().execute(f"DELETE FROM {self.table} WHERE session_id = ?", (session_id,))
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        cur = self._connection().execute(
+            f"DELETE FROM {self.table} WHERE expires_at < ?", (now or time.time(),)
+        )
+        self.swept += cur.rowcount
+        return cur.rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "sqlite", "swept": self.swept}
+
+
+class PostgresSessionStore(SessionStore):
+    """Sessions in the shared Postgres database, visible to every node"""
+
+    def __init__(self, table: str = "tarot_sessions"):
+        self.table = table
+        self.swept = 0
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+
+    def _ensure_schema(self) -> None:
+        """Create the table on first use, so building the store never touches the database"""
+        if self._schema_ready:
+            return
+        from utils.db import execute_update
+        with self._schema_lock:
+            if self._schema_ready:
+                return
+            execute_update(f"""
+                CREATE TABLE IF NOT EXISTS {self.table} (
+                    session_id TEXT PRIMARY KEY,
+                    data JSONB NOT NULL,
+                    expires_at TIMESTAMP WITH TIME ZONE NOT NULL
+                )
+            """, {})
+            execute_update(
+                f"CREATE INDEX IF NOT EXISTS idx_{self.table}_expires ON {self.table} (expires_at)", {}
+            )
+            self._schema_ready = True
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        from utils.db import execute_query
+        self._ensure_schema()
+        rows = execute_query(
+            f"SELECT data FROM {self.table} WHERE session_id = %(session_id)s AND expires_at >= now()",
+            {"session_id": session_id}
+        )
+        return rows[0]["data"] if rows else None
+
+    def put(self, session_id: str, data: Dict[str, Any]) -> None:
+        from utils.db import execute_update
+        self._ensure_schema()
+        execute_update(
+            f"""
+            INSERT INTO {self.table} (session_id, data, expires_at)
+            VALUES (%(session_id)s, %(data)s, now() + make_interval(secs => %(ttl)s))
+            ON CONFLICT (session_id) DO UPDATE SET data = EXCLUDED.data, expires_at = EXCLUDED.expires_at
+            """,
+            {
+                "session_id": session_id,
+                "data": json.dumps(data, ensure_ascii=False),
+                "ttl": data.get("ttl", SESSION_TTL_SECONDS)
+            }
+        )
+
+    def delete(self, session_id: str) -> None:
+        from utils.db import execute_update
+        self._ensure_schema()
+        execute_update(f"DELETE FROM {self.table} WHERE session_id = %(session_id)s", {"session_id": session_id})
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        from utils.db import execute_update
+        self._ensure_schema()
+        swept = execute_update(f"DELETE FROM {self.table} WHERE expires_at < now()", {})
+        self.swept += swept
+        return swept
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "postgres", "swept": self.swept}
+
+
+class CachedSessionStore(SessionStore):
+    """In-process LRU tier in front of another store; writes go through to the backend.
+
+    Entries are not checked against the backend, so a session written by another
+    process is served stale until it expires. Only enable the tier (SESSION_CACHE_SIZE)
+    when a single process serves every request of a session.
+    """
+
+    def __init__(self, backend: SessionStore, max_entries: int = 1000):
+        self.backend = backend
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _remember(self, session_id: str, data: Dict[str, Any]) -> None:
+        with self._lock:
+            self._remember_locked(session_id, data)
+
+    def _remember_locked(self, session_id: str, data: Dict[str, Any]) -> None:
+        self._entries[session_id] = (data, _expires_at(data, time.time()))
+        self._entries.move_to_end(session_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None:
+                data, expires_at = entry
+                if expires_at >= time.time():
+                    self._entries.move_to_end(session_id)
+                    self.hits += 1
+                    return data
+                del self._entries[session_id]
+                self.expirations += 1
+            self.misses += 1
+        data = self.backend.get(session_id)
+        if data is not None:
+            self._remember(session_id, data)
+        return data
+
+    def put(self, session_id: str, data: Dict[str, Any]) -> None:
+        self.backend.put(session_id, data)
+        self._remember(session_id, data)
+
+    def append(self, session_id: str, records: List[Dict[str, Any]]) -> None:
+        self.backend.append(session_id, records)
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None:
+                self._remember_locked(session_id, apply_records(entry[0], records))
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._entries.pop(session_id, None)
+        self.backend.delete(session_id)
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        now = now or time.time()
+        with self._lock:
+            expired = [sid for sid, (_, expires_at) in self._entries.items() if expires_at < now]
+            for sid in expired:
+                del self._entries[sid]
+            self.expirations += len(expired)
+        return self.backend.sweep(now)
+
+    def prepare(self) -> None:
+        self.backend.prepare()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            size = len(self._entries)
+        lookups = self.hits + self.misses
+        return {
+            **self.backend.stats(),
+            "cache_size": size,
+            "cache_max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
+
+
+class SessionSweeper:
+    """Background thread that periodically sweeps expired sessions from a store"""
+
+    def __init__(self, store: SessionStore, interval: int = SESSION_SWEEP_INTERVAL):
+        self.store = store
+        self.interval = interval
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def ensure_started(self) -> None:
+        """Start the sweeper thread in the current process if it is not running yet"""
+        if self._pid == os.getpid() or self.interval <= 0:
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._run, name="session-sweeper", daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                swept = self.store.sweep()
+                if swept:
+                    print(f"Session sweeper removed {swept} expired sessions")
+            except Exception as e:
+                print(f"Error sweeping sessions: {e}")
+
+
+def create_session_store(session_dir: str, namespace: str = "sessions") -> SessionStore:
+    """Build the session store configured through environment variables.
+
+    Other namespaces (e.g. "jobs") get their own directory or table in the same
+    backend, so their records can never be loaded or swept as sessions.
+    """
+    backend_name = os.environ.get("SESSION_STORE", "file")
+    table = "tarot_sessions" if namespace == "sessions" else f"tarot_{namespace}"
+    if backend_name == "sqlite":
+        backend = SQLiteSessionStore(
+            os.environ.get("SESSION_SQLITE_PATH", os.path.join(session_dir, "sessions.db")), table
+        )
+    elif backend_name == "postgres":
+        backend = PostgresSessionStore(table)
+    elif namespace == "sessions":
+        backend = FileSessionStore(session_dir, os.environ.get("SESSION_ARCHIVE_DIR"))
+    else:
+        backend = FileSessionStore(os.path.join(session_dir, namespace))
+    if namespace != "sessions":
+        return backend
+
+    # Off by default: the LRU is only coherent when one process owns every session
+    cache_size = int(os.environ.get("SESSION_CACHE_SIZE", 0))
+    if cache_size > 0:
+        return CachedSessionStore(backend, cache_size)
+    return backend
@@ -0,0 +1,205 @@
+"""Server-side spreads: named layouts, seeded reproducible draws and reversed cards.
+
+A draw is fully determined by its seed, the spread positions and the reversal
+rate, so the seed stored with a reading replays exactly the same cards. Seeds
+come from the OS CSPRNG; the shuffle itself is NumPy's PCG64.
+
+Usage: python -m utils.spreads simulate [--spread celtic_cross] [--count 1000000]
+       python -m utils.spreads replay --seed HEX [--spread three_card]
+"""
+import argparse
+import secrets
+import time
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+from utils.card_recognition import TAROT_CARDS_DATA
+
+SPREAD_REVERSAL_RATE = 0.5
+SPREAD_MAX_POSITIONS = 20
+SIMULATION_CHUNK = 100_000
+
+SPREADS: Dict[str, Dict[str, Any]] = {
+    "single": {
+        "title": "Одна карта",
+        "positions": [
+            {"name": "Совет", "meaning": "Главная подсказка на сегодня"}
+        ]
+    },
+    "three_card": {
+        "title": "Три карты",
+        "positions": [
+            {"name": "Прошлое", "meaning": "Что привело к ситуации"},
+            {"name": "Настоящее", "meaning": "Что происходит сейчас"},
+            {"name": "Будущее", "meaning": "К чему ведет текущий путь"}
+        ]
+    },
+    "celtic_cross": {
+        "title": "Кельтский крест",
+        "positions": [
+            {"name": "Суть", "meaning": "Суть ситуации"},
+            {"name": "Препятствие", "meaning": "Что мешает или усиливает"},
+            {"name": "Основа", "meaning": "Глубинная причина"},
+            {"name": "Прошлое", "meaning": "Что уходит"},
+            {"name": "Сознание", "meaning": "Цель и осознанные стремления"},
+            {"name": "Ближайшее будущее", "meaning": "Что скоро проявится"},
+            {"name": "Я", "meaning": "Позиция и состояние кандидата"},
+            {"name": "Окружение", "meaning": "Влияние людей и обстоятельств"},
+            {"name": "Надежды и страхи", "meaning": "Ожидания и опасения"},
+            {"name": "Итог", "meaning": "Вероятный исход"}
+        ]
+    }
+}
+
+
+class SpreadError(ValueError):
+    """Raised for an unknown spread, a malformed custom layout or an invalid seed"""
+
+
+def new_seed() -> str:
+    """A fresh 128-bit seed from the OS CSPRNG, as hex so it survives JSON and JavaScript"""
+    return secrets.token_hex(16)
+
+
+def _rng(seed: str) -> np.random.Generator:
+    try:
+        return np.random.Generator(np.random.PCG64(int(seed, 16)))
+    except (TypeError, ValueError):
+        raise SpreadError("Некорректный seed расклада")
+
+
+def resolve_spread(spec: Any) -> Tuple[str, str, List[Dict[str, str]]]:
+    """(name, title, positions) of a spread given by name or as {"name": "custom", "positions": [...]}"""
+    if isinstance(spec, str):
+        spec = {"name": spec}
+    if not isinstance(spec, dict):
+        raise SpreadError("Некорректное описание расклада")
+    name = spec.get("name")
+    if name in SPREADS:
+        return name, SPREADS[name]["title"], SPREADS[name]["positions"]
+    if name != "custom":
+        raise SpreadError(f"Неизвестный расклад: {name}")
+    positions = spec.get("positions")
+    if not isinstance(positions, list) or not 1 <= len(positions) <= SPREAD_MAX_POSITIONS:
+        raise SpreadError(f"В своем раскладе должно быть от 1 до {SPREAD_MAX_POSITIONS} позиций")
+    resolved = []
+    for i, position in enumerate(positions, 1):
+        if isinstance(position, str):
+            position = {"name": position}
+        if not isinstance(position, dict) or not str(position.get("name") or "").strip():
+            raise SpreadError(f"У позиции {i} нет названия")
+        resolved.append({"name": str(position["name"]).strip()[:100],
+                         "meaning": str(position.get("meaning") or "").strip()[:300]})
+    return name, str(spec.get("title") or "Свой расклад")[:100], resolved
+
+
+def draw_indices(count: int, seed: str, reversal_rate: float = SPREAD_REVERSAL_RATE) -> Tuple[np.ndarray, np.ndarray]:
+    """Deck indices of the first ``count`` cards of a seeded shuffle, and which of them are reversed"""
+    rng = _rng(seed)
+    indices = rng.permutation(len(TAROT_CARDS_DATA))[:count]
+    reversed_ = rng.random(count) < reversal_rate
+    return indices, reversed_
+
+
+def draw_spread(spec: Any, seed: Optional[str] = None, reversals: bool = True) -> Dict[str, Any]:
+    """Draw a spread; the result is what gets stored with the session and the reading"""
+    name, title, positions = resolve_spread(spec)
+    seed = seed or new_seed()
+    reversal_rate = SPREAD_REVERSAL_RATE if reversals else 0.0
+    indices, reversed_ = draw_indices(len(positions), seed, reversal_rate)
+    cards = []
+    for position, index, is_reversed in zip(positions, indices.tolist(), reversed_.tolist()):
+        card = dict(TAROT_CARDS_DATA[index])
+        card["position"] = position["name"]
+        card["position_meaning"] = position["meaning"]
+        card["reversed"] = is_reversed
+        cards.append(card)
+    return {
+        "name": name,
+        "title": title,
+        "positions": positions,
+        "seed": seed,
+        "reversal_rate": reversal_rate,
+        "cards": cards
+    }
+
+
+def replay_spread(spread: Dict[str, Any]) -> Dict[str, Any]:
+    """Draw a stored spread again from its seed; the cards match the original draw"""
+    spec = {"name": spread["name"], "title": spread.get("title"), "positions": spread["positions"]}
+    return draw_spread(spec, spread["seed"], spread.get("reversal_rate", SPREAD_REVERSAL_RATE) > 0)
+
+
+def card_label(card: Dict[str, Any]) -> str:
+    """A card as the client would say it, e.g. 'Шут (перевернутая)'"""
+    return f"{card['name']} (перевернутая)" if card.get("reversed") else card["name"]
+
+
+def card_cache_label(card: Dict[str, Any]) -> str:
+    """Card identity for the interpretation cache; plain names for cards picked without a spread"""
+    if "position" not in card:
+        return card["name"]
+    return f"{card['position']}|{card['name']}|{'R' if card.get('reversed') else 'U'}"
+
+
+def simulate(count: int, spread_size: int, reversal_rate: float = SPREAD_REVERSAL_RATE,
+             seed: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """``count`` independent draws at once: (count, spread_size) deck indices and reversed flags.
+
+    Rows are shuffled in chunks with Generator.permuted, so memory stays at about
+    SIMULATION_CHUNK * 78 bytes whatever the count.
+    """
+    rng = _rng(seed or new_seed())
+    deck_size = len(TAROT_CARDS_DATA)
+    indices = np.empty((count, spread_size), dtype=np.uint8)
+    base = np.arange(deck_size, dtype=np.uint8)
+    for start in range(0, count, SIMULATION_CHUNK):
+        rows = min(SIMULATION_CHUNK, count - start)
+        shuffled = rng.permuted(np.broadcast_to(base, (rows, deck_size)), axis=1)
+        indices[start:start + rows] = shuffled[:, :spread_size]
+    reversed_ = rng.random((count, spread_size)) < reversal_rate
+    return indices, reversed_
+
+
+def position_frequencies(indices: np.ndarray) -> np.ndarray:
+    """(spread_size, 78) counts of each card at each position"""
+    deck_size = len(TAROT_CARDS_DATA)
+    return np.stack([np.bincount(indices[:, i], minlength=deck_size) for i in range(indices.shape[1])])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Tarot spread engine")
+    parser.add_argument("command", choices=["simulate", "replay"])
+    parser.add_argument("--spread", default="three_card", choices=list(SPREADS))
+    parser.add_argument("--count", type=int, default=1_000_000)
+    parser.add_argument("--seed", default=None)
+    args = parser.parse_args()
+
+    if args.command == "replay":
+        if not args.seed:
+            parser.error("replay требует --seed")
+        spread = draw_spread(args.spread, args.seed)
+        for card in spread["cards"]:
+            print(f"{card['position']:<20}{card_label(card)}")
+        return
+
+    positions = len(SPREADS[args.spread]["positions"])
+    started = time.perf_counter()
+    indices, reversed_ = simulate(args.count, positions, seed=args.seed)
+    elapsed = time.perf_counter() - started
+    frequencies = position_frequencies(indices)
+    expected = args.count / len(TAROT_CARDS_DATA)
+    chi_square = ((frequencies - expected) ** 2 / expected).sum(axis=1)
+    print(f"{args.count} раскладов «{SPREADS[args.spread]['title']}» за {elapsed:.2f} с "
+          f"({args.count / elapsed:,.0f} в секунду)")
+    print(f"Доля перевернутых карт: {reversed_.mean():.4f}")
+    print(f"Повторы карт внутри расклада: "
+          f"{int((np.sort(indices, axis=1)[:, 1:] == np.sort(indices, axis=1)[:, :-1]).sum())}")
+    for position, value in zip(SPREADS[args.spread]["positions"], chi_square.tolist()):
+        # 77 degrees of freedom: values far above ~110 would mean a biased shuffle
+        print(f"{position['name']:<20}chi2={value:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Whole-deck sprite atlases, one packed image per size with a coordinate map.
+
+Usage: python -m utils.sprite_atlas [--force]
+"""
+import argparse
+import hashlib
+import io
+import json
+import math
+import os
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+from PIL import Image
+
+from utils.card_recognition import TAROT_CARDS_DATA
+from utils.image_pipeline import BUILD_LOCK_NAME, build_lock
+
+ATLAS_VERSION = 1
+ATLAS_WIDTHS = {"thumb": 120, "medium": 240}
+ATLAS_QUALITY = 80
+ATLAS_MANIFEST_NAME = "atlas.json"
+
+
+def _sources_hash(images_dir: str, cards: List[Dict[str, Any]]) -> str:
+    digest = hashlib.sha256(f"v{ATLAS_VERSION}".encode())
+    for card in cards:
+        path = Path(images_dir) / card["image"]
+        digest.update(card["name"].encode("utf-8"))
+        if path.exists():
+            digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def load_atlas_manifest(out_dir: str) -> Dict[str, Any]:
+    try:
+        with open(Path(out_dir) / ATLAS_MANIFEST_NAME, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {"version": ATLAS_VERSION, "sources_hash": None, "atlases": {}}
+
+
+def atlas_files(manifest: Dict[str, Any]) -> set:
+    return {atlas["file"] for atlas in manifest.get("atlases", {}).values()}
+
+
+def _pack(images_dir: str, cards: List[Dict[str, Any]], width: int) -> Dict[str, Any]:
+    tiles = []
+    for card in cards:
+        path = Path(images_dir) / card["image"]
+        if not path.exists():
+            print(f"ВНИМАНИЕ: Не найдено изображение для карты {card['name']}: {path}")
+            continue
+        with Image.open(path) as image:
+            image = image.convert("RGB")
+            height = round(image.height * width / image.width)
+            tiles.append((card["name"], image.resize((width, height), Image.LANCZOS)))
+
+    columns = math.ceil(math.sqrt(len(tiles))) or 1
+    rows = math.ceil(len(tiles) / columns)
+    cell_height = max((tile.height for _, tile in tiles), default=0)
+    sheet = Image.new("RGB", (columns * width, rows * cell_height), (0, 0, 0))
+    coordinates = {}
+    for index, (name, tile) in enumerate(tiles):
+        x, y = (index % columns) * width, (index // columns) * cell_height
+        sheet.paste(tile, (x, y))
+        coordinates[name] = {"x": x, "y": y, "w": tile.width, "h": tile.height}
+
+    buffer = io.BytesIO()
+    sheet.save(buffer, format="WEBP", quality=ATLAS_QUALITY, method=6)
+    return {"data": buffer.getvalue(), "width": sheet.width, "height": sheet.height, "cards": coordinates}
+
+
+def build_atlases(images_dir: str, out_dir: str, force: bool = False,
+                  cards: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """Build one atlas per size unless the source images are unchanged since the last build"""
+    with build_lock(out_dir):
+        return _build_atlases(images_dir, out_dir, force, cards)
+
+
+def _build_atlases(images_dir: str, out_dir: str, force: bool,
+                   cards: Optional[List[Dict[str, Any]]]) -> Dict[str, Any]:
+    cards = cards if cards is not None else TAROT_CARDS_DATA
+    sources_hash = _sources_hash(images_dir, cards)
+    previous = load_atlas_manifest(out_dir)
+    existing = set(os.listdir(out_dir))
+    if not force and previous.get("sources_hash") == sources_hash and atlas_files(previous) <= existing:
+        return previous
+
+    atlases = {}
+    for size, width in ATLAS_WIDTHS.items():
+        packed = _pack(images_dir, cards, width)
+        content_hash = hashlib.sha256(packed["data"]).hexdigest()[:12]
+        filename = f"atlas.{size}.{content_hash}.webp"
+        (Path(out_dir) / filename).write_bytes(packed["data"])
+        atlases[size] = {
+            "file": filename,
+            "version": content_hash,
+            "width": packed["width"],
+            "height": packed["height"],
+            "cards": packed["cards"]
+        }
+
+    manifest = {"version": ATLAS_VERSION, "sources_hash": sources_hash, "atlases": atlases}
+    tmp_path = Path(out_dir) / f"{ATLAS_MANIFEST_NAME}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_path, Path(out_dir) / ATLAS_MANIFEST_NAME)
+
+    for filename in existing - atlas_files(manifest) - {ATLAS_MANIFEST_NAME, BUILD_LOCK_NAME}:
+        (Path(out_dir) / filename).unlink(missing_ok=True)
+    print(f"Атласы карт собраны: {', '.join(atlases)}")
+    return manifest
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build tarot deck sprite atlases")
+    parser.add_argument("--images-dir", default=os.environ.get("CARDS_IMAGES_DIR", "./static/images/tarot"))
+    parser.add_argument("--out-dir", default=None)
+    parser.add_argument("--force", action="store_true")
+    args = parser.parse_args()
+    build_atlases(args.images_dir, args.out_dir or os.path.join(args.images_dir, "atlas"), args.force)
@@ -0,0 +1,119 @@
+"""Deferred application initialization, run in a background thread per worker process.
+
+Tasks run in registration order. A failed task is retried every
+STARTUP_RETRY_INTERVAL seconds, so a database that is down at boot only delays
+readiness instead of breaking the import. The process is ready once every
+required task has succeeded. Starting is tied to the process id, so a server
+that imports the app and then forks workers runs the unfinished tasks again in
+each child.
+"""
+import os
+import threading
+import time
+from typing import Dict, Any, Callable, List, Optional
+
+STARTUP_RETRY_INTERVAL = float(os.environ.get("STARTUP_RETRY_INTERVAL", 5))
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class StartupTask:
+    def __init__(self, name: str, fn: Callable[[], Any], required: bool = True):
+        self.name = name
+        self.fn = fn
+        self.required = required
+        self.state = PENDING
+        self.error: Optional[str] = None
+        self.attempts = 0
+        self.seconds: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "required": self.required,
+            "attempts": self.attempts,
+            "seconds": round(self.seconds, 4) if self.seconds is not None else None,
+            "error": self.error
+        }
+
+
+class Startup:
+    def __init__(self, retry_interval: float = STARTUP_RETRY_INTERVAL):
+        self.retry_interval = retry_interval
+        self.tasks: List[StartupTask] = []
+        self.started_at: Optional[float] = None
+        self.ready_at: Optional[float] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+
+    def task(self, name: str, required: bool = True) -> Callable:
+        """Decorator registering a function as a startup task"""
+        def register(fn: Callable[[], Any]) -> Callable[[], Any]:
+            self.tasks.append(StartupTask(name, fn, required))
+            return fn
+        return register
+
+    def ensure_started(self) -> None:
+        """Start the initialization thread in the current process if it is not running yet"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            if self.started_at is None:
+                self.started_at = time.time()
+            # Tasks interrupted by a fork are started over in the child
+            for task in self.tasks:
+                if task.state == RUNNING:
+                    task.state = PENDING
+            self._ready = threading.Event()
+            threading.Thread(target=self._run, name="startup", daemon=True).start()
+
+    def _run(self) -> None:
+        while True:
+            for task in self.tasks:
+                if task.state != DONE:
+                    self._run_task(task)
+            if self.is_ready() and self.ready_at is None:
+                self.ready_at = time.time()
+                print(f"Приложение готово за {self.ready_at - self.started_at:.2f} с")
+            if self.is_ready():
+                self._ready.set()
+            if all(task.state == DONE for task in self.tasks):
+                return
+            time.sleep(self.retry_interval)
+
+    def _run_task(self, task: StartupTask) -> None:
+        task.state = RUNNING
+        task.attempts += 1
+        started = time.perf_counter()
+        try:
+            task.fn()
+        except Exception as e:
+            task.state = FAILED
+            task.error = str(e)
+            print(f"Ошибка инициализации ({task.name}), повтор через {self.retry_interval} с: {e}")
+        else:
+            task.state = DONE
+            task.error = None
+        task.seconds = time.perf_counter() - started
+
+    def is_ready(self) -> bool:
+        return all(task.state == DONE for task in self.tasks if task.required)
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        self.ensure_started()
+        return self._ready.wait(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ready": self.is_ready(),
+            "started_at": self.started_at,
+            "ready_at": self.ready_at,
+            "tasks": {task.name: task.to_dict() for task in self.tasks}
+        }
@@ -1,6 +1,8 @@
 from flask import Blueprint, request, jsonify
+from psycopg.types.json import Jsonb
 from utils.db import execute_query, execute_query_single, execute_insert
-from utils.auth import token_required
+from utils.auth import token_required, invalidate_principal
+from utils.user_stats import get_user_stats
 import json  
 tarot_blueprint = Blueprint('tarot', __name__)
 
@@ -18,12 +20,11 @@ def save_reading(user):
             }), 400
     
     try:
-        serialized_reading_data = json.dumps(data['reading_data'])
         params = {
             "user_id": user['id'],
             "reading_name": data['reading_name'],
             "description": data.get('description', ''),
-            "reading_data": serialized_reading_data 
+            "reading_data": Jsonb(data['reading_data'])
         }
         
         execute_query(
@@ -33,27 +34,15 @@ def save_reading(user):
             """,
             params
         )
+        invalidate_principal(user['id'])
         
         try:
-            total_readings_query = """
-                SELECT COUNT(*) as count FROM tarot_readings 
-                WHERE user_id = %(user_id)s
-            """
-            total_readings_result = execute_query(total_readings_query, {"user_id": user['id']})
-            total_readings = total_readings_result[0]['count'] if total_readings_result else 0
+            stats = get_user_stats(user['id'])
+            total_readings = stats['total_readings']
+            month_readings = stats['month_readings']
         except Exception as stats_error:
-            print(f"Error getting total readings: {stats_error}")
+            print(f"Error getting reading stats: {stats_error}")
             total_readings = 0
-        try:
-            month_readings_query = """
-                SELECT COUNT(*) as count FROM tarot_readings 
-                WHERE user_id = %(user_id)s 
-                AND created_at >= date_trunc('month', CURRENT_DATE)
-            """
-            month_readings_result = execute_query(month_readings_query, {"user_id": user['id']})
-            month_readings = month_readings_result[0]['count'] if month_readings_result else 0
-        except Exception as stats_error:
-            print(f"Error getting month readings: {stats_error}")
             month_readings = 0
         
         return jsonify({
@@ -77,7 +66,7 @@ def get_reading(user, reading_id):
     """Get a specific tarot reading by ID"""
     try:
         reading_query = """
-            SELECT id, reading_name, description, reading_data, 
+            SELECT id, reading_name, description, reading_data::jsonb AS reading_data,
                    created_at, is_saved
             FROM tarot_readings 
             WHERE id = %(reading_id)s AND user_id = %(user_id)s
@@ -98,7 +87,7 @@ def get_reading(user, reading_id):
             
         reading = readings[0]
             
-        if reading['reading_data']:
+        if isinstance(reading['reading_data'], str):
             try:
                 reading['reading_data'] = json.loads(reading['reading_data'])
             except json.JSONDecodeError:
@@ -1,13 +1,29 @@
 # backend/utils/user_routes.py
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+import base64
+import binascii
+import json
 import re
-from typing import Dict, Any, Tuple, List
+from datetime import datetime, timedelta
+from psycopg.types.json import Jsonb
+from typing import Dict, Any, Tuple, List, Optional
 from utils.db import execute_query, execute_query_single, execute_insert
-from utils.auth import hash_password, check_password, generate_token, token_required, get_user_info, update_last_login
+from utils.auth import hash_password, check_password, upgrade_password_hash, generate_token, token_required, get_login_user, update_last_login, invalidate_principal
+from utils.password_hashing import PasswordHasherBusyError
+from utils.user_stats import get_user_stats
+from utils.card_recognition import DECK
+from utils.reading_export import export_ndjson, import_ndjson, open_ndjson
+from utils.reading_search import HEADLINE_OPTIONS, SEARCH_QUERY_MAX_LENGTH, highlight_html
 
 user_blueprint = Blueprint('user', __name__)
 tarot_blueprint = Blueprint('tarot', __name__)
 
+def password_hasher_busy():
+    return jsonify({
+        'success': False,
+        'message': 'Сервер перегружен. Пожалуйста, попробуйте позже.'
+    }), 503
+
 @user_blueprint.route('/api/auth/register', methods=['POST'])
 def register():
     """Register a new user"""
@@ -50,13 +66,17 @@ def register():
             'message': 'Пользователь с таким email уже существует'
         }), 400
     
-    hashed_password = hash_password(data['password'])
+    try:
+        hashed_password = hash_password(data['password'])
+    except PasswordHasherBusyError:
+        return password_hasher_busy()
     
     try:
         user_id = execute_insert(
             """
             INSERT INTO users (name, email, password_hash)
             VALUES (%(name)s, %(email)s, %(password_hash)s)
+            RETURNING id
             """,
             {
                 "name": data['name'],
@@ -88,10 +108,7 @@ def login():
                 'message': f'Поле {field} обязательно для заполнения'
             }), 400
     
-    user = execute_query_single(
-        "SELECT id, name, email, password_hash FROM users WHERE email = %(email)s",
-        {"email": data['email']}
-    )
+    user = get_login_user(data['email'])
     
     if not user:
         return jsonify({
@@ -99,26 +116,33 @@ def login():
             'message': 'Неверный email или пароль'
         }), 401
     
-    if not check_password(data['password'], user['password_hash']):
+    try:
+        password_ok = check_password(data['password'], user['password_hash'])
+    except PasswordHasherBusyError:
+        return password_hasher_busy()
+    if not password_ok:
         return jsonify({
             'success': False,
             'message': 'Неверный email или пароль'
         }), 401
     
+    upgrade_password_hash(user['id'], data['password'], user['password_hash'])
     update_last_login(user['id'])
     token = generate_token(user['id'])
     
-    user_info = get_user_info(user['id'])
-    stats = user_info.get('stats', {})  
     return jsonify({
         'success': True,
         'token': token,
         'user': {
-            'id': user_info['id'],
-            'name': user_info['name'],
-            'email': user_info['email'],
-            'avatar': user_info['avatar'],
-            'stats': stats 
+            'id': user['id'],
+            'name': user['name'],
+            'email': user['email'],
+            'avatar': user['avatar'],
+            'stats': {
+                'total_readings': user['total_readings'],
+                'month_readings': user['month_readings'],
+                'saved_layouts': user['saved_layouts']
+            }
         }
     })
 @user_blueprint.route('/api/user/profile', methods=['GET'])
@@ -130,66 +154,323 @@ def get_profile(user):
         'user': user
     })
 
+READINGS_PAGE_MAX = 100
+
+# reading_data::jsonb lets these queries run while utils.reading_data_migration has not
+# converted a text column yet; on a JSONB column Postgres drops the cast, so indexes apply.
+READING_SUMMARY_COLUMNS = """
+    id, reading_name, description, created_at,
+    reading_data::jsonb->'questions'->>0 AS first_question,
+    jsonb_path_query_array(reading_data::jsonb, '$.cards[*].name') AS card_names,
+    COALESCE((reading_data::jsonb->>'isAiGenerated')::boolean, FALSE) AS is_ai_generated
+"""
+
+def reading_icon(reading_name: str) -> str:
+    """Pick the list icon for a reading from its name"""
+    name = reading_name.lower()
+    if 'карта дня' in name:
+        return 'sun'
+    if 'отношения' in name:
+        return 'heart'
+    return 'star'
+
+def encode_cursor(values: List[Any]) -> str:
+    """Opaque keyset cursor holding the sort key of the last row on a page"""
+    raw = json.dumps(values).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor: str) -> List[Any]:
+    """Inverse of encode_cursor; raises ValueError on a malformed cursor"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (TypeError, ValueError, binascii.Error) as e:
+        raise ValueError(f"Invalid readings cursor: {cursor}") from e
+    if not isinstance(values, list) or len(values) != 2:
+        raise ValueError(f"Invalid readings cursor: {cursor}")
+    return values
+
+def encode_readings_cursor(created_at: datetime, reading_id: int) -> str:
+    """Cursor pointing just past a (created_at, id) row"""
+    return encode_cursor([created_at.isoformat(), reading_id])
+
+def decode_readings_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Inverse of encode_readings_cursor; raises ValueError on a malformed cursor"""
+    created_at, reading_id = decode_cursor(cursor)
+    try:
+        return datetime.fromisoformat(created_at), int(reading_id)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid readings cursor: {cursor}") from e
+
+def decode_rank_cursor(cursor: str) -> Tuple[float, int]:
+    """Decode a (rank, id) cursor of full-text search results"""
+    rank, reading_id = decode_cursor(cursor)
+    try:
+        return float(rank), int(reading_id)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid readings cursor: {cursor}") from e
+
+def format_reading_item(reading: Dict[str, Any]) -> Dict[str, Any]:
+    """Build a history list item from a reading row"""
+    created_at = reading['created_at']
+    return {
+        'id': reading['id'],
+        'name': reading['reading_name'],
+        'description': reading['description'],
+        'date': created_at.strftime('%d %B %Y'),
+        'time': created_at.strftime('%H:%M'),
+        'icon': reading_icon(reading['reading_name'])
+    }
+
+def format_reading_summary(reading: Dict[str, Any]) -> Dict[str, Any]:
+    """Build a history list item from a READING_SUMMARY_COLUMNS row"""
+    item = format_reading_item(reading)
+    if not item['description'] and reading['first_question']:
+        item['description'] = reading['first_question'][:100]
+    item['cards'] = reading['card_names'] or []
+    item['is_ai_generated'] = reading['is_ai_generated']
+    return item
+
 @user_blueprint.route('/api/user/readings', methods=['GET'])
 @token_required
 def get_user_readings(user):
-    """Get user tarot readings history"""
-    limit = request.args.get('limit', default=10, type=int)
-    offset = request.args.get('offset', default=0, type=int)
+    """Get user tarot readings history.
+
+    Without ``offset`` this pages by a (created_at, id) cursor and returns summaries
+    only; ``next_cursor`` fetches the following page. Passing ``offset`` keeps the
+    old full-row mode for existing clients.
+    """
+    limit = min(max(request.args.get('limit', default=10, type=int), 1), READINGS_PAGE_MAX)
+    total = user['total_readings']
+    
+    if 'offset' in request.args:
+        return get_user_readings_by_offset(user, limit, request.args.get('offset', default=0, type=int), total)
+    
+    return readings_page(user['id'], limit, request.args.get('cursor'), [], {}, total)
+
+def readings_page(user_id: int, limit: int, cursor: Optional[str], conditions: List[str],
+                  params: Dict[str, Any], total: Optional[int] = None):
+    """One keyset page of reading summaries matching extra SQL conditions"""
+    params = {**params, "user_id": user_id, "limit": limit + 1}
+    conditions = ["user_id = %(user_id)s", *conditions]
+    if cursor:
+        try:
+            params["cursor_created_at"], params["cursor_id"] = decode_readings_cursor(cursor)
+        except ValueError:
+            return jsonify({
+                'success': False,
+                'message': 'Некорректный курсор страницы'
+            }), 400
+        conditions.append("(created_at, id) < (%(cursor_created_at)s, %(cursor_id)s)")
     
+    readings = execute_query(
+        f"""
+        SELECT {READING_SUMMARY_COLUMNS}
+        FROM tarot_readings
+        WHERE {" AND ".join(conditions)}
+        ORDER BY created_at DESC, id DESC
+        LIMIT %(limit)s
+        """,
+        params
+    )
+    
+    has_more = len(readings) > limit
+    readings = readings[:limit]
+    last = readings[-1] if readings else None
+    response = {
+        'success': True,
+        'readings': [format_reading_summary(reading) for reading in readings],
+        'next_cursor': encode_readings_cursor(last['created_at'], last['id']) if has_more else None
+    }
+    if total is not None:
+        response['total'] = total
+    return jsonify(response)
+
+def ranked_readings_page(user_id: int, limit: int, cursor: Optional[str], query: str,
+                         conditions: List[str], params: Dict[str, Any]):
+    """One page of full-text matches ordered by relevance, with highlighted snippets"""
+    params = {**params, "user_id": user_id, "limit": limit + 1, "query": query, "headline": HEADLINE_OPTIONS}
+    conditions = ["user_id = %(user_id)s", "search_vector @@ query", *conditions]
+    if cursor:
+        try:
+            params["cursor_rank"], params["cursor_id"] = decode_rank_cursor(cursor)
+        except ValueError:
+            return jsonify({
+                'success': False,
+                'message': 'Некорректный курсор страницы'
+            }), 400
+        conditions.append("(ts_rank_cd(search_vector, query), id) < (%(cursor_rank)s, %(cursor_id)s)")
+    
+    readings = execute_query(
+        f"""
+        SELECT page.*,
+               ts_headline('russian', reading_search_document(page.description, page.reading_data),
+                           query, %(headline)s) AS snippet
+        FROM (
+            SELECT {READING_SUMMARY_COLUMNS}, reading_data::jsonb AS reading_data, ts_rank_cd(search_vector, query) AS rank
+            FROM tarot_readings, websearch_to_tsquery('russian', %(query)s) query
+            WHERE {" AND ".join(conditions)}
+            ORDER BY rank DESC, id DESC
+            LIMIT %(limit)s
+        ) page, websearch_to_tsquery('russian', %(query)s) query
+        ORDER BY page.rank DESC, page.id DESC
+        """,
+        params
+    )
+    
+    has_more = len(readings) > limit
+    readings = readings[:limit]
+    formatted_readings = []
+    for reading in readings:
+        item = format_reading_summary(reading)
+        item['snippet'] = highlight_html(reading['snippet'])
+        item['rank'] = reading['rank']
+        formatted_readings.append(item)
+    
+    last = readings[-1] if readings else None
+    return jsonify({
+        'success': True,
+        'readings': formatted_readings,
+        'next_cursor': encode_cursor([last['rank'], last['id']]) if has_more else None
+    })
+
+def cards_jsonpath(names: List[str]) -> str:
+    """jsonpath matching readings that contain any of the given card names"""
+    alternatives = " || ".join(f"@.name == {json.dumps(name, ensure_ascii=False)}" for name in names)
+    return f"$.cards[*] ? ({alternatives})"
+
+@user_blueprint.route('/api/user/readings/search', methods=['GET'])
+@token_required
+def search_user_readings(user):
+    """Find the user's readings by text, card name, suit, arcana type or date range.
+
+    Every filter is evaluated by Postgres against GIN indexes; repeated ``card``
+    parameters must all be present in the reading. With ``q`` the results are a
+    Russian full-text search ranked by relevance, with highlighted snippets;
+    otherwise they are ordered newest first.
+    """
+    limit = min(max(request.args.get('limit', default=10, type=int), 1), READINGS_PAGE_MAX)
+    conditions, params = [], {}
+    query = request.args.get('q', '').strip()
+    if len(query) > SEARCH_QUERY_MAX_LENGTH:
+        return jsonify({
+            'success': False,
+            'message': f'Поисковый запрос не должен превышать {SEARCH_QUERY_MAX_LENGTH} символов'
+        }), 400
+    
+    cards, unknown = DECK.resolve([name.strip() for name in request.args.getlist('card') if name.strip()])
+    if unknown:
+        return jsonify({
+            'success': False,
+            'message': f'Неизвестные карты: {", ".join(unknown)}'
+        }), 400
+    for index, card in enumerate(cards):
+        params[f"card_{index}"] = Jsonb({"cards": [{"name": card["name"]}]})
+        conditions.append(f"reading_data::jsonb @> %(card_{index})s")
+    
+    for field, index in (('suit', DECK.by_suit), ('type', DECK.by_type)):
+        value = request.args.get(field)
+        if not value:
+            continue
+        if value not in index:
+            return jsonify({
+                'success': False,
+                'message': f'Некорректное значение {field}: {value}'
+            }), 400
+        params[field] = cards_jsonpath([card["name"] for card in index[value]])
+        conditions.append(f"reading_data::jsonb @? %({field})s::jsonpath")
+    
+    for field, operator in (('date_from', '>='), ('date_to', '<')):
+        value = request.args.get(field)
+        if not value:
+            continue
+        try:
+            params[field] = datetime.strptime(value, '%Y-%m-%d')
+        except ValueError:
+            return jsonify({
+                'success': False,
+                'message': f'Дата {field} должна быть в формате ГГГГ-ММ-ДД'
+            }), 400
+        if field == 'date_to':
+            params[field] += timedelta(days=1)
+        conditions.append(f"created_at {operator} %({field})s")
+    
+    if query:
+        return ranked_readings_page(user['id'], limit, request.args.get('cursor'), query, conditions, params)
+    return readings_page(user['id'], limit, request.args.get('cursor'), conditions, params)
+
+def get_user_readings_by_offset(user: Dict[str, Any], limit: int, offset: int, total: int):
+    """Legacy LIMIT/OFFSET page with the full reading_data of every row"""
     readings = execute_query(
         """
-        SELECT id, reading_name, description, created_at, reading_data
+        SELECT id, reading_name, description, created_at, reading_data::jsonb AS reading_data
         FROM tarot_readings
         WHERE user_id = %(user_id)s
-        ORDER BY created_at DESC
+        ORDER BY created_at DESC, id DESC
         LIMIT %(limit)s OFFSET %(offset)s
         """,
         {
             "user_id": user['id'],
             "limit": limit,
-            "offset": offset
+            "offset": max(offset, 0)
         }
     )
     
     formatted_readings = []
     for reading in readings:
-        description = reading['description']
-        if not description and 'reading_data' in reading and 'questions' in reading['reading_data']:
+        item = format_reading_item(reading)
+        # Rows not yet converted by the migration can hold encoded JSON in a string
+        if isinstance(reading['reading_data'], str):
+            try:
+                reading['reading_data'] = json.loads(reading['reading_data'])
+            except json.JSONDecodeError:
+                pass
+        if not item['description'] and isinstance(reading['reading_data'], dict) and 'questions' in reading['reading_data']:
             questions = reading['reading_data']['questions']
             if questions and len(questions) > 0:
-                description = questions[0][:100]
-        
-    
-        icon = 'star' 
-        if 'расклад на будущее' in reading['reading_name'].lower():
-            icon = 'star'
-        elif 'карта дня' in reading['reading_name'].lower():
-            icon = 'sun'
-        elif 'отношения' in reading['reading_name'].lower():
-            icon = 'heart'
-        
-        created_at = reading['created_at']
-        date_str = created_at.strftime('%d %B %Y')
-        time_str = created_at.strftime('%H:%M')
-        
-        formatted_readings.append({
-            'id': reading['id'],
-            'name': reading['reading_name'],
-            'description': description,
-            'date': date_str,
-            'time': time_str,
-            'icon': icon,
-            'reading_data': reading['reading_data']
-        })
+                item['description'] = questions[0][:100]
+        item['reading_data'] = reading['reading_data']
+        formatted_readings.append(item)
     
     return jsonify({
         'success': True,
         'readings': formatted_readings,
-        'total': execute_query_single(
-            "SELECT COUNT(*) AS count FROM tarot_readings WHERE user_id = %(user_id)s",
-            {"user_id": user['id']}
-        )['count']
+        'total': total
+    })
+
+@user_blueprint.route('/api/user/export', methods=['GET'])
+@token_required
+def export_user_data(user):
+    """Stream all of the user's readings and layouts as NDJSON (gzip with ?gzip=1)"""
+    compress = request.args.get('gzip', '').lower() in ('1', 'true', 'yes')
+    filename = f"tarot-export-{user['id']}.ndjson" + (".gz" if compress else "")
+    return Response(
+        stream_with_context(export_ndjson(user['id'], compress)),
+        mimetype='application/gzip' if compress else 'application/x-ndjson',
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
+@user_blueprint.route('/api/user/import', methods=['POST'])
+@token_required
+def import_user_data(user):
+    """Import an NDJSON export (plain or gzip) into the user's account in one transaction"""
+    try:
+        counts = import_ndjson(open_ndjson(request.stream), user_id=user['id'])
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': f'Ошибка в файле импорта: {e}'
+        }), 400
+    except Exception as e:
+        print(f"Error importing user data: {e}")
+        return jsonify({
+            'success': False,
+            'message': 'Ошибка при импорте данных'
+        }), 500
+    invalidate_principal(user['id'])
+    return jsonify({
+        'success': True,
+        'message': 'Данные успешно импортированы',
+        'imported': counts
     })
 
 @user_blueprint.route('/api/user/saved-layouts', methods=['GET'])
@@ -246,6 +527,7 @@ def save_layout(user):
             """
             INSERT INTO saved_layouts (user_id, name, description, cards)
             VALUES (%(user_id)s, %(name)s, %(description)s, %(cards)s)
+            RETURNING id
             """,
             {
                 "user_id": user['id'],
@@ -254,6 +536,7 @@ def save_layout(user):
                 "cards": data['cards']
             }
         )
+        invalidate_principal(user['id'])
         
         return jsonify({
             'success': True,
@@ -285,6 +568,7 @@ def delete_layout(user, layout_id):
         )
         
         if result:
+            invalidate_principal(user['id'])
             return jsonify({
                 'success': True,
                 'message': 'Расклад успешно удален'
@@ -328,27 +612,15 @@ def save_reading(user):
                 "user_id": user['id'],
                 "reading_name": data['reading_name'],
                 "description": data.get('description', ''),
-                "reading_data": data['reading_data']
+                "reading_data": Jsonb(data['reading_data'])
             }
         )
+        invalidate_principal(user['id'])
         
 
-        total_readings = execute_query_single(
-            """
-            SELECT COUNT(*) as count FROM tarot_readings 
-            WHERE user_id = %(user_id)s
-            """,
-            {"user_id": user['id']}
-        )['count']
-
-        month_readings = execute_query_single(
-            """
-            SELECT COUNT(*) as count FROM tarot_readings 
-            WHERE user_id = %(user_id)s 
-            AND created_at >= date_trunc('month', CURRENT_DATE)
-            """,
-            {"user_id": user['id']}
-        )['count']
+        stats = get_user_stats(user['id'])
+        total_readings = stats['total_readings']
+        month_readings = stats['month_readings']
         
         return jsonify({
             'success': True,
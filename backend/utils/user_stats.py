@@ -0,0 +1,75 @@
+"""Materialized per-user reading statistics.
+
+The user_stats table is kept current by triggers defined in db_schema.sql.
+Usage: python -m utils.user_stats rebuild [--user-id ID]
+"""
+import argparse
+from typing import Dict, Any, Optional
+
+from utils.db import execute_query_single, execute_update
+
+USER_STATS_COLUMNS = """
+    COALESCE(s.total_readings, 0) AS total_readings,
+    CASE WHEN s.month_start = date_trunc('month', CURRENT_DATE)::date
+         THEN s.month_readings ELSE 0 END AS month_readings,
+    COALESCE(s.saved_layouts, 0) AS saved_layouts
+"""
+
+
+def get_user_stats(user_id: int) -> Dict[str, Any]:
+    """Return total, monthly and saved-layout counters for a user"""
+    return execute_query_single(
+        f"""
+        SELECT {USER_STATS_COLUMNS}
+        FROM (SELECT %(user_id)s::integer AS user_id) u
+        LEFT JOIN user_stats s ON s.user_id = u.user_id
+        """,
+        {"user_id": user_id}
+    )
+
+
+def rebuild_user_stats(user_id: Optional[int] = None) -> int:
+    """Recount user_stats from tarot_readings and saved_layouts; returns the number of rows written"""
+    return execute_update(
+        """
+        INSERT INTO user_stats (user_id, total_readings, month_readings, month_start, saved_layouts, updated_at)
+        SELECT u.id,
+               COALESCE(r.total_readings, 0),
+               COALESCE(r.month_readings, 0),
+               date_trunc('month', CURRENT_DATE)::date,
+               COALESCE(l.saved_layouts, 0),
+               CURRENT_TIMESTAMP
+        FROM users u
+        LEFT JOIN (
+            SELECT user_id,
+                   COUNT(*) AS total_readings,
+                   COUNT(*) FILTER (WHERE created_at >= date_trunc('month', CURRENT_DATE)) AS month_readings
+            FROM tarot_readings
+            GROUP BY user_id
+        ) r ON r.user_id = u.id
+        LEFT JOIN (
+            SELECT user_id, COUNT(*) AS saved_layouts
+            FROM saved_layouts
+            GROUP BY user_id
+        ) l ON l.user_id = u.id
+        WHERE %(user_id)s::integer IS NULL OR u.id = %(user_id)s::integer
+        ON CONFLICT (user_id) DO UPDATE SET
+            total_readings = EXCLUDED.total_readings,
+            month_readings = EXCLUDED.month_readings,
+            month_start = EXCLUDED.month_start,
+            saved_layouts = EXCLUDED.saved_layouts,
+            updated_at = EXCLUDED.updated_at
+        """,
+        {"user_id": user_id}
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the user_stats table")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    rebuild = subparsers.add_parser("rebuild", help="Backfill or repair counters from the source tables")
+    rebuild.add_argument("--user-id", type=int, default=None)
+    args = parser.parse_args()
+    if args.command == "rebuild":
+        rows = rebuild_user_stats(args.user_id)
+        print(f"user_stats rebuilt for {rows} users")
@@ -80,7 +80,7 @@ export const saveReading = async (sessionId, readingName, description, readingDa
   }
 };
 
-export const getUserReadings = async (limit = 10, offset = 0) => {
+export const getUserReadings = async (limit = 10, cursor = null) => {
   try {
     const token = localStorage.getItem('token');
     
@@ -88,7 +88,12 @@ export const getUserReadings = async (limit = 10, offset = 0) => {
       return { success: false, message: 'Пользователь не авторизован' };
     }
     
-    const response = await fetch(`${API_BASE_URL}/user/readings?limit=${limit}&offset=${offset}`, {
+    const params = new URLSearchParams({ limit });
+    if (cursor) {
+      params.set('cursor', cursor);
+    }
+    
+    const response = await fetch(`${API_BASE_URL}/user/readings?${params}`, {
       headers: {
         'Authorization': `Bearer ${token}`
       }
@@ -101,6 +106,36 @@ export const getUserReadings = async (limit = 10, offset = 0) => {
   }
 };
 
+export const searchUserReadings = async ({ query, cards = [], suit, type, dateFrom, dateTo, cursor, limit = 10 } = {}) => {
+  try {
+    const token = localStorage.getItem('token');
+    
+    if (!token) {
+      return { success: false, message: 'Пользователь не авторизован' };
+    }
+    
+    const params = new URLSearchParams({ limit });
+    if (query) params.set('q', query);
+    cards.forEach(card => params.append('card', card));
+    if (suit) params.set('suit', suit);
+    if (type) params.set('type', type);
+    if (dateFrom) params.set('date_from', dateFrom);
+    if (dateTo) params.set('date_to', dateTo);
+    if (cursor) params.set('cursor', cursor);
+    
+    const response = await fetch(`${API_BASE_URL}/user/readings/search?${params}`, {
+      headers: {
+        'Authorization': `Bearer ${token}`
+      }
+    });
+    
+    return await response.json();
+  } catch (error) {
+    console.error('Error searching user readings:', error);
+    return { success: false, message: 'Ошибка при поиске чтений' };
+  }
+};
+
 export const getReading = async (readingId) => {
   try {
     const token = localStorage.getItem('token');
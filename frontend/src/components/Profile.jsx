@@ -31,7 +31,7 @@ const Profile = () => {
     setIsLoadingReadings(true);
     try {
       // Получаем историю гаданий
-      const readingsData = await getUserReadings(10, 0);
+      const readingsData = await getUserReadings(10);
       
       if (readingsData.success) {
         // Разделяем чтения на ИИ-интерпретации и Пользовательские расклады
@@ -39,7 +39,7 @@ const Profile = () => {
         const user = [];
         
         readingsData.readings.forEach(reading => {
-          if (reading.reading_data && reading.reading_data.isAiGenerated) {
+          if (reading.is_ai_generated) {
             ai.push(reading);
           } else {
             user.push(reading);